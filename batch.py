@@ -0,0 +1,197 @@
+import argparse
+import glob
+import marshal
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+# Lex and parse many BASIC and vintage_fe sources at once.
+#
+# The files are fanned out over a pool of worker processes, one per core
+# by default.  The workers are started once and import the parsers when
+# they start, so each file costs only its own parse; files are handed out
+# in chunks, so small files do not each pay for a round trip to a worker.
+# A worker sends back only a small Result, and the tree, marshalled, only
+# when it is asked for.  With a parsecache directory the workers share
+# parse results through it.
+#
+# usage: python batch.py [-j JOBS] [--parser basic|vintage] [--cache DIR]
+#                        [-q] path ...
+# A path is a file, a directory (every file under it) or a glob.  Files
+# ending in .bas are BASIC and the rest vintage_fe, unless --parser says.
+# Prints a status line for each file and the totals, and exits with 1 if
+# any file did not parse.
+
+BASIC_SUFFIXES = ('.bas',)
+
+class Result:
+    __slots__ = ('path', 'error', 'statements', 'size', 'seconds', 'tree')
+
+    def __init__(self, path, error, statements, size, seconds, tree=None):
+        self.path = path
+        # None, or why the file did not parse
+        self.error = error
+        self.statements = statements
+        self.size = size
+        # the time the worker took to read and parse the file
+        self.seconds = seconds
+        # the marshalled tree, when it was asked for
+        self.tree = tree
+
+    def __reduce__(self):
+        return (Result, (self.path, self.error, self.statements, self.size, self.seconds, self.tree))
+
+    def __str__(self):
+        if self.error is not None:
+            return 'FAIL %s: %s' % (self.path, self.error.replace('\n', '\n     '))
+        return 'ok   %s: %d statements, %.1f ms' % (self.path, self.statements, self.seconds * 1e3)
+
+# the parser of a file: 'basic' or 'vintage'
+def parser_of(path, parser=None):
+    if parser is not None:
+        return parser
+    return 'basic' if path.endswith(BASIC_SUFFIXES) else 'vintage'
+
+# the files paths name, in order, each once
+def expand(paths):
+    seen = set()
+    for path in paths:
+        if os.path.isdir(path):
+            found = []
+            for (directory, subdirectories, names) in os.walk(path):
+                subdirectories.sort()
+                found.extend(os.path.join(directory, name) for name in sorted(names))
+        elif os.path.exists(path):
+            found = [path]
+        else:
+            found = sorted(glob.glob(path, recursive=True))
+            if not found:
+                raise ValueError("no files match {}".format(path))
+        for name in found:
+            if os.path.isfile(name) and name not in seen:
+                seen.add(name)
+                yield name
+
+# the state of a worker process, set up once by start_worker
+worker = {}
+
+def start_worker(cache_directory=None, keep_trees=False):
+    import engine
+    import vintage_fe
+    worker['parse_program'] = engine.parse_program
+    worker['parse_vintage'] = vintage_fe.parse
+    worker['cache'] = None
+    if cache_directory is not None:
+        from parsecache import ParseCache
+        worker['cache'] = ParseCache(cache_directory)
+    worker['keep_trees'] = keep_trees
+
+# lex and parse one file in a worker
+def parse_file(job):
+    (path, parser) = job
+    if not worker:
+        start_worker()
+    start = time.perf_counter()
+    size = 0
+    try:
+        with open(path, encoding='utf-8') as file:
+            text = file.read()
+        size = len(text)
+        cache = worker['cache']
+        if parser == 'basic':
+            if cache is not None:
+                tree = cache.parse_basic(text)[0]
+            else:
+                tree = worker['parse_program'](text).statements
+            statements = len(tree)
+        else:
+            if cache is not None:
+                tree = cache.parse_vintage(text, iterative=True)
+            else:
+                tree = worker['parse_vintage'](text, iterative=True)
+            statements = len(tree[1])
+    except SyntaxError as e:
+        return Result(path, str(e), 0, size, time.perf_counter() - start)
+    except (OSError, UnicodeDecodeError) as e:
+        return Result(path, 'cannot read: %s' % e, 0, size, time.perf_counter() - start)
+    except (ValueError, RecursionError) as e:
+        return Result(path, '%s: %s' % (type(e).__name__, e), 0, size, time.perf_counter() - start)
+    seconds = time.perf_counter() - start
+    if worker['keep_trees']:
+        return Result(path, None, statements, size, seconds, marshal.dumps(tree))
+    return Result(path, None, statements, size, seconds)
+
+# the Result of each file, in order.  jobs is the number of worker
+# processes, one per core by default; with one the files are parsed in
+# this process.  With keep_trees each Result has the tree, marshalled
+def parse_files(paths, jobs=None, parser=None, cache_directory=None, keep_trees=False):
+    jobs = jobs or os.cpu_count() or 1
+    work = [(path, parser_of(path, parser)) for path in paths]
+    if jobs == 1 or len(work) <= 1:
+        start_worker(cache_directory, keep_trees)
+        try:
+            for job in work:
+                yield parse_file(job)
+        finally:
+            worker.clear()
+        return
+    # a few chunks per worker, so the last chunks even out the load
+    chunksize = max(1, min(64, len(work) // (jobs * 4)))
+    with ProcessPoolExecutor(jobs, initializer=start_worker,
+                             initargs=(cache_directory, keep_trees)) as executor:
+        yield from executor.map(parse_file, work, chunksize=chunksize)
+
+class Totals:
+    def __init__(self):
+        self.files = 0
+        self.failed = 0
+        self.statements = 0
+        self.size = 0
+        self.seconds = 0.0
+
+    def add(self, result):
+        self.files += 1
+        self.failed += result.error is not None
+        self.statements += result.statements
+        self.size += result.size
+        self.seconds += result.seconds
+
+    def report(self, elapsed, jobs):
+        return '\n'.join([
+            '%d files, %d ok, %d failed, %d statements, %.1f KB' % (
+                self.files, self.files - self.failed, self.failed, self.statements, self.size / 1024),
+            '%.3f s with %d jobs, %.3f s in the workers (%.1fx)' % (
+                elapsed, jobs, self.seconds, self.seconds / elapsed if elapsed else 0.0),
+            '%.0f files/s, %.0f statements/s, %.1f KB/s' % (
+                self.files / elapsed if elapsed else 0.0,
+                self.statements / elapsed if elapsed else 0.0,
+                self.size / 1024 / elapsed if elapsed else 0.0),
+        ])
+
+def main(argv=None):
+    arguments = argparse.ArgumentParser(description='Lex and parse BASIC and vintage_fe sources in parallel.')
+    arguments.add_argument('paths', nargs='+', help='files, directories or globs')
+    arguments.add_argument('-j', '--jobs', type=int, default=None, help='worker processes (default: one per core)')
+    arguments.add_argument('--parser', choices=('basic', 'vintage'), default=None,
+                           help='parse every file with this parser (default: .bas files are BASIC)')
+    arguments.add_argument('--cache', default=None, help='parsecache directory shared by the workers')
+    arguments.add_argument('-q', '--quiet', action='store_true', help='print only the files that fail')
+    options = arguments.parse_args(argv)
+    jobs = options.jobs or os.cpu_count() or 1
+    try:
+        paths = list(expand(options.paths))
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+    totals = Totals()
+    start = time.perf_counter()
+    for result in parse_files(paths, jobs, options.parser, options.cache):
+        totals.add(result)
+        if result.error is not None or not options.quiet:
+            print(result)
+    print(totals.report(time.perf_counter() - start, jobs))
+    return 1 if totals.failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
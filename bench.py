@@ -0,0 +1,491 @@
+import io
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from corpus import (LOOP_PROGRAMS, SAMPLE_LINES, VINTAGE_FUNCTION, GeneratedSource, ListStream,
+                    legacy_dumpast, legacy_lex, sample_program, vintage_tokens, walk)
+from engine import Program, compile_source, parse_source
+from lexer import Lexer, StreamingLexer, TokenList, TokenStream, VintageLexer
+from parser_1 import Parser
+
+# micro benchmarks for the front end
+# usage: python bench.py [name ...]   (no names runs everything)
+# the behaviour they rely on is checked in tests/ (python -m pytest); the
+# programs and the reference implementations timed here are in corpus.py
+
+BENCHMARKS = {}
+
+def benchmark(fn):
+    BENCHMARKS[fn.__name__[len('bench_'):]] = fn
+    return fn
+
+def best_of(fn, repeat=5):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+def report(name, seconds, count=None, unit='items'):
+    if count:
+        print('  %-36s %10.3f ms  %12.0f %s/s' % (name, seconds * 1e3, count / seconds, unit))
+    else:
+        print('  %-36s %10.3f ms' % (name, seconds * 1e3))
+
+@benchmark
+def bench_lexer():
+    print('lexer: precompiled master scanner vs per-instance re.finditer')
+    small = [sample_program(5) for _ in range(2000)]
+    large = sample_program(20000)
+    ntokens = sum(len(Lexer(p).get_tokens()) for p in small)
+    report('legacy, 2000 small programs', best_of(lambda: [legacy_lex(p) for p in small]), ntokens, 'tokens')
+    report('master, 2000 small programs', best_of(lambda: [Lexer(p) for p in small]), ntokens, 'tokens')
+    ntokens = len(Lexer(large).get_tokens())
+    report('legacy, 20000 line program', best_of(lambda: legacy_lex(large)), ntokens, 'tokens')
+    report('master, 20000 line program', best_of(lambda: Lexer(large)), ntokens, 'tokens')
+
+def traced_bytes(fn):
+    tracemalloc.start()
+    try:
+        result = fn()
+        return tracemalloc.get_traced_memory()[0], result
+    finally:
+        tracemalloc.stop()
+
+@benchmark
+def bench_token_memory():
+    print('lexer: token storage, Token objects vs TokenBuffer')
+    source = sample_program(20000)
+    legacy, tokens = traced_bytes(lambda: legacy_lex(source))
+    compact, lexer = traced_bytes(lambda: Lexer(source))
+    print('  source text       %10d bytes' % len(source))
+    print('  Token objects     %10d bytes  (%d tokens)' % (legacy, len(tokens)))
+    print('  TokenBuffer       %10d bytes  (%d tokens)' % (compact, len(lexer.get_tokens())))
+
+@benchmark
+def bench_streaming():
+    print('parser: Parser.iter_statements() over a StreamingLexer')
+    def traced_peak(fn):
+        tracemalloc.start()
+        try:
+            fn()
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    peaks = []
+    for lines in (10000, 40000, 160000):
+        def run(index=False):
+            parser = Parser(StreamingLexer(GeneratedSource(lines)), index=index)
+            return sum(1 for _ in parser.iter_statements())
+        # timed without tracemalloc, which slows the parser several times
+        report('%d lines' % lines, best_of(run, 1), lines * 4, 'statements')
+        peaks.append(traced_peak(run))
+    print('  %-36s %s bytes, %.2fx from the smallest input' % (
+        'peak', ', '.join(str(peak) for peak in peaks), peaks[-1] / peaks[0]))
+    print('  %-36s %d bytes' % ('peak, 160000 lines with the index', traced_peak(lambda: run(True))))
+    source = GeneratedSource(40000).text * 40000
+    report('40000 lines, Lexer + parse()', best_of(lambda: Parser(Lexer(source)).parse(), 1), 160000, 'statements')
+
+@benchmark
+def bench_from_path():
+    print('lexer: Lexer.from_path() (mmap, bytes scanner) vs read() + Lexer')
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'large.bas')
+        with open(path, 'w') as f:
+            f.write(sample_program(100000))
+        def read_and_lex():
+            with open(path) as f:
+                return Lexer(f.read())
+        ntokens = len(Lexer.from_path(path).get_tokens())
+        report('read() + Lexer', best_of(read_and_lex, 3), ntokens, 'tokens')
+        report('Lexer.from_path', best_of(lambda: Lexer.from_path(path), 3), ntokens, 'tokens')
+        # the values are sliced from the str, or decoded from the mapping
+        for (name, lex) in (('read() + Lexer', read_and_lex), ('Lexer.from_path', lambda: Lexer.from_path(path))):
+            tokens = lex().get_tokens()
+            report(name + ', every value', best_of(lambda: [token.value for token in tokens], 3), ntokens, 'tokens')
+        peak_read, _ = traced_bytes(read_and_lex)
+        peak_mmap, _ = traced_bytes(lambda: Lexer.from_path(path))
+        print('  traced memory: read() %d bytes, mmap %d bytes' % (peak_read, peak_mmap))
+
+@benchmark
+def bench_incremental():
+    print('incremental: one keystroke in a 5000 line buffer')
+    from incremental import Document
+    text = 'goto 10; gosub 20; next I;\n' * 5000
+    doc = Document(text)
+    middle = len(text) // 2
+    def keystroke():
+        doc.edit(middle, 0, 'return;')
+        doc.edit(middle, len('return;'), '')
+    report('full Lexer + Parser', best_of(lambda: Parser(Lexer(text)).parse(), 3))
+    report('Document.edit (insert + delete)', best_of(keystroke))
+    print('  %s' % doc.edit(middle, 0, 'end;'))
+
+def arithmetic_chain(terms):
+    ops = ['+', '*', '-', '/']
+    parts = ['X1']
+    for i in range(1, terms):
+        parts.append(ops[i % len(ops)])
+        parts.append('(%d - Y)' % i if i % 7 == 0 else str(i))
+    return 'let Z == %s;' % ' '.join(parts)
+
+@benchmark
+def bench_expression():
+    print('parser: precedence climbing on long arithmetic chains')
+    for terms in (1000, 10000, 100000):
+        lexer = Lexer(arithmetic_chain(terms))
+        ntokens = len(lexer.get_tokens())
+        report('%d term chain' % terms, best_of(lambda: Parser(lexer).parse(), 3), ntokens, 'tokens')
+
+@benchmark
+def bench_ll1():
+    print('parsers: throughput with LL(1) table dispatch')
+    import vintage_fe
+    tokens = vintage_tokens(''.join(VINTAGE_FUNCTION % i for i in range(5000)))
+    report('vintage_fe, 5000 functions', best_of(lambda: vintage_fe.stmt_list(ListStream(tokens)), 3), len(tokens), 'tokens')
+    lexer = Lexer(sample_program(50000))
+    ntokens = len(lexer.get_tokens())
+    report('parser_1, 50000 lines', best_of(lambda: Parser(lexer).parse(), 3), ntokens, 'tokens')
+
+@benchmark
+def bench_diagnostics():
+    print('parser: one pass over a 50000 line program with an error every 5 lines')
+    broken = ['let == 2;', 'print X +;', 'goto X;', 'for I == 1 2;', 'if X then;']
+    clean = Lexer(sample_program(50000))
+    lines = sample_program(50000).split('\n')
+    for i in range(0, len(lines), 5):
+        lines[i] = broken[(i // 5) % len(broken)]
+    lexer = Lexer('\n'.join(lines))
+    parser = Parser(lexer)
+    parser.parse()
+    report('clean program', best_of(lambda: Parser(clean).parse(), 3), len(clean.get_tokens()), 'tokens')
+    report('%d errors collected' % len(parser.errors), best_of(lambda: Parser(lexer).parse(), 3), len(lexer.get_tokens()), 'tokens')
+    print('  first: %s' % parser.errors[0])
+
+@benchmark
+def bench_nesting():
+    print('vintage_fe: explicit-stack parser on deeply nested input')
+    import vintage_fe
+    import vintage_iter
+    tokens = vintage_tokens(''.join(VINTAGE_FUNCTION % i for i in range(5000)))
+    report('recursive, 5000 functions', best_of(lambda: vintage_fe.stmt_list(ListStream(tokens)), 3), len(tokens), 'tokens')
+    report('explicit stack, 5000 functions', best_of(lambda: vintage_iter.stmt_list(ListStream(tokens)), 3), len(tokens), 'tokens')
+    for depth in (1000, 10000, 100000):
+        for (name, text) in [('blocks', '{ ' * depth + '} ' * depth),
+                             ('parentheses', 'x = ' + '( ' * depth + '1' + ' )' * depth + ' ;')]:
+            tokens = vintage_tokens(text)
+            report('%d nested %s' % (depth, name), best_of(lambda: vintage_iter.stmt_list(ListStream(tokens)), 3), len(tokens), 'tokens')
+
+@benchmark
+def bench_engine():
+    print('engine: statements executed per second, closures vs a tree walk')
+    for (name, source) in LOOP_PROGRAMS.items():
+        program = compile_source(source)
+        executed = program.run()
+        report('%s, tree walk' % name, best_of(lambda: walk(program), 3), executed, 'statements')
+        report('%s, closures' % name, best_of(program.run, 3), executed, 'statements')
+
+@benchmark
+def bench_vm():
+    print('vm: register bytecode vs a tree walk and the closure engine')
+    import vm
+    for (name, source) in LOOP_PROGRAMS.items():
+        program = compile_source(source)
+        bytecode = vm.compile_source(source)
+        statements = program.run()
+        instructions = bytecode.run()
+        report('%s, tree walk' % name, best_of(lambda: walk(program), 3), statements, 'statements')
+        report('%s, closures' % name, best_of(program.run, 3), statements, 'statements')
+        seconds = best_of(bytecode.run, 3)
+        report('%s, vm' % name, seconds, statements, 'statements')
+        report('%s, vm (%d instructions)' % (name, instructions), seconds, instructions, 'instructions')
+
+@benchmark
+def bench_transpile():
+    print('transpile: BASIC compiled to Python code objects vs the engines')
+    import vm
+    import transpile
+    class Null:
+        def write(self, text):
+            pass
+    for (name, source) in LOOP_PROGRAMS.items():
+        program = compile_source(source)
+        bytecode = vm.compile_source(source)
+        statements = program.run()
+        report('%s, closures' % name, best_of(program.run, 3), statements, 'statements')
+        report('%s, vm' % name, best_of(bytecode.run, 3), statements, 'statements')
+        report('%s, python' % name, best_of(lambda: transpile.run_source(source, Null()), 3), statements, 'statements')
+    source = sample_program(5000, [s for s in SAMPLE_LINES if not s.startswith(('if', 'goto', 'gosub', 'return'))])
+    def first_run():
+        transpile.CODE_CACHE.clear()
+        transpile.run_source(source, Null())
+    report('5000 lines, translate and run', best_of(first_run, 3))
+    report('5000 lines, cached code object', best_of(lambda: transpile.run_source(source, Null()), 3))
+
+VECTOR_LOOP = """
+    let S == 0;
+    for I == 1 to %d let X == SIN(I) * COS(I) / (I + 1);
+    let S == S + X * X + SQR(I);
+    next I;
+"""
+
+@benchmark
+def bench_vectorize():
+    print('vectorize: FOR loops as NumPy array operations vs the closure engine')
+    import vectorize
+    if vectorize.numpy is None:
+        print('  numpy is not installed')
+        return
+    for exponent in range(3, 8):
+        count = 10 ** exponent
+        source = VECTOR_LOOP % count
+        scalar = compile_source(source)
+        vector = compile_source(source, vectorize=True)
+        # the long scalar runs are timed once
+        repeat = 3 if count <= 100000 else 1
+        scalar_seconds = best_of(scalar.run, repeat)
+        vector_seconds = best_of(vector.run, 3)
+        report('N=%d, scalar' % count, scalar_seconds, count, 'iterations')
+        report('N=%d, numpy' % count, vector_seconds, count, 'iterations')
+        print('  %-36s %10.1fx' % ('N=%d, speedup' % count, scalar_seconds / vector_seconds))
+
+FOLD_LOOP = """
+    let S == 0;
+    for I == 1 to 100000 let S == S + I * (2 * 3 - 5) + (10 / 4 - 2.5) + SQR(16) * 0.25;
+    let T == (I + 0) * 1 - (1 - 1) + 2 ^ 3;
+    next I;
+"""
+
+VINTAGE_CONSTANTS = """
+int y = 2 ;
+y = ( 2 * 3 ) * y + 0 ;
+put not 0 + - ( 8 / 4 ) * 1 ;
+"""
+
+@benchmark
+def bench_fold():
+    print('fold: constant folding and simplification')
+    import fold
+    import vintage_fe
+    (statements, lines) = parse_source(FOLD_LOOP)
+    (folded, eliminated) = fold.fold_basic(statements)
+    print('  %-36s %10d of %d' % ('parser_1 nodes eliminated', eliminated, fold.count_nodes(statements)))
+    report('parser_1 loop, as parsed', best_of(Program(statements, lines).run, 3), 300002, 'statements')
+    report('parser_1 loop, folded', best_of(Program(folded, lines).run, 3), 300002, 'statements')
+    source = ''.join(VINTAGE_FUNCTION % i + VINTAGE_CONSTANTS for i in range(5000))
+    tree = vintage_fe.stmt_list(ListStream(vintage_tokens(source)))
+    (folded, eliminated) = fold.fold_vintage(tree)
+    print('  %-36s %10d of %d' % ('vintage_fe nodes eliminated', eliminated, fold.count_nodes(tree)))
+    report('vintage_fe, 5000 functions', best_of(lambda: fold.fold_vintage(tree), 3), fold.count_nodes(tree), 'nodes')
+
+OPTIMIZE_LOOP = """
+    def fn D(X, Y) == SQR(X * X + Y * Y);
+    def fn N(X, Y) == X / D(X, Y);
+    let S == 0;
+    for I == 1 to 50000 let A == I / 100;
+    let B == 3 - A;
+    let S == S + N(A, B) * D(A, B) + D(A, B) / (1 + D(A, B));
+    next I;
+"""
+
+@benchmark
+def bench_optimize():
+    print('optimize: DEF FN inlining and common subexpressions')
+    import optimize
+    (statements, lines) = parse_source(OPTIMIZE_LOOP)
+    (optimized, optimized_lines, stats) = optimize.optimize(statements, lines)
+    print('  %-36s %s' % ('', ', '.join('%s %d' % item for item in sorted(stats.items()))))
+    report('as parsed', best_of(Program(statements, lines).run, 3), 50000, 'iterations')
+    report('optimized', best_of(Program(optimized, optimized_lines).run, 3), 50000, 'iterations')
+    report('optimize pass', best_of(lambda: optimize.optimize(statements, lines), 3))
+
+@benchmark
+def bench_cfg():
+    print('cfg: basic blocks, loop pairing and dead code')
+    source = sample_program(50000, [s for s in SAMPLE_LINES if not s.startswith('return')])
+    lexer = Lexer(source + '\nend;\nprint "DEAD";\nrem TAIL;\n' * 100)
+    parser = Parser(lexer)
+    statements = parser.parse()
+    graph = parser.control_flow()
+    (pruned, lines, dropped) = graph.pruned()
+    print('  %-36s %10d blocks, %d dead, %d statements dropped' % (
+        '50000 lines', len(graph.blocks), sum(1 for b in graph.blocks if not b.reachable), dropped))
+    import cfg
+    report('build', best_of(lambda: cfg.ControlFlowGraph(statements, parser.statement_lines), 3), len(statements), 'statements')
+    report('cached', best_of(parser.control_flow, 3))
+    report('prune', best_of(graph.pruned, 3), len(statements), 'statements')
+
+# 1000 lines of DATA read through ten times from line 501: each pass
+# restores and reads 5000 values
+DATA_PROGRAM = 'data 1, 2, 3, 4, 5, 6, 7, 8, 9, 10;\n' * 1000 + \
+    'for R == 1 to 10;\nrestore 501;\nfor I == 1 to 5000;\nread X;\nlet S == S + X;\nnext I;\nnext R;\n'
+
+@benchmark
+def bench_data():
+    print('data: line index and DATA pool built at parse time')
+    parser = Parser(Lexer(DATA_PROGRAM))
+    parser.parse()
+    print('  %-36s %10d statements, %d values' % ('', len(parser.index.starts), len(parser.index.data)))
+    report('parse with index', best_of(lambda: Parser(Lexer(DATA_PROGRAM)).parse(), 3), len(parser.statements), 'statements')
+    program = compile_source(DATA_PROGRAM)
+    report('read, closures', best_of(program.run, 3), 50000, 'values')
+    import vm
+    import transpile
+    bytecode = vm.compile_source(DATA_PROGRAM)
+    report('read, vm', best_of(bytecode.run, 3), 50000, 'values')
+    report('read, python', best_of(lambda: transpile.run_source(DATA_PROGRAM), 3), 50000, 'values')
+
+@benchmark
+def bench_symbols():
+    print('symbols: the cost of resolving identifiers to frame slots')
+    import symbols
+    (statements, lines) = parse_source(sample_program(50000))
+    (resolved, table) = symbols.resolve_basic(statements)
+    print('  %-36s %10d globals' % ('50000 lines', len(table.globals)))
+    report('resolve', best_of(lambda: symbols.resolve_basic(statements), 3), len(statements), 'statements')
+    # the functions call g
+    tokens = vintage_tokens('int g ( int p , int q ) return p ;' + ''.join(VINTAGE_FUNCTION % i for i in range(5000)))
+    import vintage_iter
+    tree = vintage_iter.stmt_list(ListStream(tokens))
+    report('resolve vintage_fe, 5000 functions', best_of(lambda: symbols.resolve_vintage(tree), 3), len(tokens), 'tokens')
+
+@benchmark
+def bench_hashcons():
+    print('hashcons: shared subtrees across resident programs')
+    import hashcons
+    import vintage_iter
+    # 2000 programs made from 20 distinct functions
+    programs = [vintage_tokens(VINTAGE_FUNCTION % (i % 20)) for i in range(2000)]
+    plain, trees = traced_bytes(lambda: [vintage_iter.stmt_list(ListStream(tokens)) for tokens in programs])
+    del trees
+    factory = hashcons.NodeFactory()
+    interned, trees = traced_bytes(lambda: [factory.intern(vintage_iter.stmt_list(ListStream(tokens))) for tokens in programs])
+    print('  %-36s %10.1f KB' % ('2000 vintage_fe trees', plain / 1024))
+    print('  %-36s %10.1f KB  (%s)' % ('interned', interned / 1024, factory))
+    del trees
+    report('parse', best_of(lambda: [vintage_iter.stmt_list(ListStream(tokens)) for tokens in programs], 3), len(programs), 'programs')
+    report('parse and intern', best_of(lambda: [factory.intern(vintage_iter.stmt_list(ListStream(tokens))) for tokens in programs], 3), len(programs), 'programs')
+    report('collect', best_of(factory.collect, 1))
+    source = sample_program(20000)
+    plain, statements = traced_bytes(lambda: Parser(Lexer(source)).parse())
+    del statements
+    factory = hashcons.NodeFactory()
+    interned, statements = traced_bytes(lambda: Parser(Lexer(source), factory).parse())
+    print('  %-36s %10.1f KB' % ('parser_1, 20000 lines', plain / 1024))
+    print('  %-36s %10.1f KB  (%s)' % ('interned', interned / 1024, factory))
+
+@benchmark
+def bench_parsecache():
+    print('parsecache: parse results reused from disk')
+    import parsecache
+    source = sample_program(20000)
+    with tempfile.TemporaryDirectory() as directory:
+        cache = parsecache.ParseCache(directory)
+        report('parse, 20000 lines', best_of(lambda: parse_source(source), 3), 20000, 'lines')
+        cache.parse_basic(source)
+        report('cache hit, 20000 lines', best_of(lambda: cache.parse_basic(source), 3), 20000, 'lines')
+        (statements, lines) = parse_source(source)
+        report('store', best_of(lambda: cache.put('basic', source, (statements, list(lines))), 3))
+
+@benchmark
+def bench_tokenstream():
+    print('tokenstream: parsers pulling tokens through a ring buffer')
+    source = sample_program(20000)
+    report('parser_1 on TokenBuffer', best_of(lambda: Parser(Lexer(source)).parse(), 3), 20000, 'lines')
+    report('parser_1 on TokenStream', best_of(lambda: Parser(TokenStream(Lexer.iter_tokens(source))).parse(), 3), 20000, 'lines')
+    # peak memory of counting the statements, so only the tokens count
+    for (name, tokens) in [('TokenBuffer', lambda: Lexer(source)),
+                           ('TokenStream', lambda: TokenStream(Lexer.iter_tokens(source)))]:
+        tracemalloc.start()
+        sum(1 for _ in Parser(tokens()).iter_statements())
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print('  %-36s %10.1f KB' % ('peak, ' + name, peak / 1024))
+    import vintage_fe
+    text = ''.join(VINTAGE_FUNCTION % i for i in range(5000))
+    ntokens = sum(1 for _ in VintageLexer.iter_tokens(text))
+    report('vintage_fe.parse, 5000 functions', best_of(lambda: vintage_fe.parse(text), 3), ntokens, 'tokens')
+    report('vintage_fe.parse, from a file', best_of(lambda: vintage_fe.parse(io.StringIO(text)), 3), ntokens, 'tokens')
+    report('lexing alone', best_of(lambda: list(VintageLexer.iter_tokens(text)), 3), ntokens, 'tokens')
+    tokens = list(VintageLexer.iter_tokens(text))
+    report('parsing a TokenList', best_of(lambda: vintage_fe.parse_tokens(TokenList(tokens)), 3), ntokens, 'tokens')
+    report('parsing a TokenStream', best_of(lambda: vintage_fe.parse_tokens(TokenStream(tokens)), 3), ntokens, 'tokens')
+
+@benchmark
+def bench_parallel_lex():
+    print('parallel lex: one program split on ; and lexed in worker processes')
+    from concurrent.futures import ProcessPoolExecutor
+    source = sample_program(200000)
+    report('sequential', best_of(lambda: Lexer(source), 3), 200000, 'lines')
+    for jobs in sorted({2, os.cpu_count() or 1}):
+        with ProcessPoolExecutor(jobs) as executor:
+            # start the workers before timing
+            Lexer.parallel(source, jobs, executor)
+            report('%d jobs, warm pool' % jobs, best_of(lambda: Lexer.parallel(source, jobs, executor), 3), 200000, 'lines')
+
+@benchmark
+def bench_batch():
+    print('batch: files parsed by a pool of worker processes')
+    import batch
+    with tempfile.TemporaryDirectory() as directory:
+        for i in range(200):
+            with open(os.path.join(directory, 'p%d.bas' % i), 'w') as file:
+                file.write(sample_program(200 + i))
+            with open(os.path.join(directory, 'f%d.v' % i), 'w') as file:
+                file.write(''.join(VINTAGE_FUNCTION % j for j in range(20 + i % 7)))
+        paths = list(batch.expand([directory]))
+        for jobs in sorted({1, 2, os.cpu_count() or 1}):
+            seconds = best_of(lambda: sum(1 for _ in batch.parse_files(paths, jobs)), 1)
+            report('%d jobs, %d files' % (jobs, len(paths)), seconds, len(paths), 'files')
+
+@benchmark
+def bench_instrument():
+    print('instrument: cost of the rule profiler')
+    import instrument
+    import vintage_fe
+    text = ''.join(VINTAGE_FUNCTION % i for i in range(5000))
+    ntokens = sum(1 for _ in VintageLexer.iter_tokens(text))
+    report('vintage_fe.parse', best_of(lambda: vintage_fe.parse(text), 3), ntokens, 'tokens')
+    with instrument.Profiler():
+        report('instrumented', best_of(lambda: vintage_fe.parse(text), 3), ntokens, 'tokens')
+    report('after restore', best_of(lambda: vintage_fe.parse(text), 3), ntokens, 'tokens')
+
+# the tuples and lists in a tree
+def count_nodes(tree):
+    count = 0
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, (tuple, list)):
+            count += 1
+            stack.extend(node)
+    return count
+
+@benchmark
+def bench_dumpast():
+    print('dumpast: rendering a tree into one buffer')
+    import dumpast
+    (statements, lines) = parse_source(sample_program(20000))
+    nodes = count_nodes(statements)
+    with open(os.devnull, 'w') as devnull:
+        stdout = sys.stdout
+        sys.stdout = devnull
+        try:
+            legacy = best_of(lambda: legacy_dumpast(statements), 1)
+        finally:
+            sys.stdout = stdout
+        report('print per piece', legacy, nodes, 'nodes')
+        for format in ('tree', 'sexp', 'ndjson'):
+            report(format, best_of(lambda: dumpast.dump(statements, devnull, format), 3), nodes, 'nodes')
+    report('parse, 20000 lines', best_of(lambda: parse_source(sample_program(20000)), 1), nodes, 'nodes')
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        BENCHMARKS[name]()
@@ -0,0 +1,194 @@
+from array import array
+
+from engine import Layout
+
+# Control-flow graph of a parser_1 program.
+#
+# The graph is built over the flat engine.Layout entries, so the statement
+# after THEN and the statement on a FOR line have places of their own.  A
+# basic block is a run of entries that control enters only at the first
+# and leaves only after the last.
+#
+# Edges: a GOSUB goes to the subroutine and, as if it had returned, to the
+# entry after it; a RETURN and an END go nowhere.  An ON goes to each target
+# and falls through when the selector is out of range.  Each NEXT is paired
+# statically with a FOR as the text nests them: the nearest open FOR of the
+# variable, closing any inner loops left open, as the engine does.  A NEXT
+# goes to the loop body of its FOR and falls through.  Which loop it
+# repeats is decided by the FOR frames at run time, but that only matters
+# for the edges: any body it can go to was reached from its own FOR first,
+# so what is reachable is the same.
+#
+# Blocks no path from the first entry reaches are dead.  pruned() gives the
+# program without the statements in them and without REM statements, except
+# a REM a GOTO or GOSUB jumps to, as its line has to stay.  DEF and DATA
+# statements are kept wherever they are, as a function is defined and the
+# DATA values are read for the whole program, and so is the statement on a
+# line a RESTORE names.
+
+class Block:
+    __slots__ = ('index', 'start', 'end', 'successors', 'predecessors', 'reachable')
+
+    def __init__(self, index, start, end):
+        self.index = index
+        # the entries start .. end - 1
+        self.start = start
+        self.end = end
+        self.successors = []
+        self.predecessors = []
+        self.reachable = False
+
+    def __str__(self):
+        return 'block %d: entries %d-%d -> %s' % (
+            self.index, self.start, self.end - 1,
+            ', '.join(str(b) for b in self.successors) or 'exit')
+
+class ControlFlowGraph:
+    def __init__(self, statements, lines=None):
+        if lines is None:
+            lines = range(1, len(statements) + 1)
+        self.statements = statements
+        self.lines = lines
+        layout = Layout(statements, lines)
+        self.entries = layout.entries
+        self.line_index = layout.line_index
+        self.target = layout.target
+        # the entry each statement starts at
+        self.statement_entries = []
+        entry = 0
+        for statement in statements:
+            self.statement_entries.append(entry)
+            entry += self.size(statement)
+        # NEXT entry -> FOR entry, and the NEXTs with no FOR
+        self.pairs = {}
+        self.unpaired = []
+        self.pair_loops()
+        self.edges = [self.successors(index) for index in range(len(self.entries))]
+        self.blocks = []
+        self.block_of = []
+        self.build_blocks()
+        self.mark_reachable()
+
+    # the number of entries a statement takes
+    def size(self, node):
+        if node[0] == 'IF':
+            (IF, condition, true_statement, false_statement) = node
+            size = 1 + self.size(true_statement)
+            if false_statement is not None:
+                size += 1 + self.size(false_statement)
+            return size
+        if node[0] == 'FOR' and node[5] is not None:
+            return 1 + self.size(node[5])
+        return 1
+
+    def pair_loops(self):
+        open_loops = []
+        for (index, node) in enumerate(self.entries):
+            if node[0] == 'FOR':
+                # a FOR of a variable already open restarts that loop
+                for i in range(len(open_loops) - 1, -1, -1):
+                    if self.entries[open_loops[i]][1] == node[1]:
+                        del open_loops[i:]
+                        break
+                open_loops.append(index)
+            elif node[0] == 'NEXT':
+                while open_loops and self.entries[open_loops[-1]][1] != node[1]:
+                    open_loops.pop()
+                if open_loops:
+                    self.pairs[index] = open_loops.pop()
+                else:
+                    self.unpaired.append(index)
+
+    # the entries control can go to from an entry
+    def successors(self, index):
+        node = self.entries[index]
+        kind = node[0]
+        following = index + 1
+        if kind == 'IF':
+            return [following, node[2]]
+        elif kind == 'JUMP':
+            return [node[1]]
+        elif kind == 'GOTO':
+            return [self.target(node[1])]
+        elif kind == 'GOSUB':
+            return [self.target(node[1]), following]
+        elif kind == 'ON':
+            return [self.target(line_num) for line_num in node[3]] + [following]
+        elif kind == 'RETURN' or kind == 'END':
+            return []
+        elif kind == 'NEXT':
+            if index in self.pairs:
+                return [self.pairs[index] + 1, following]
+            return [following]
+        return [following]
+
+    def build_blocks(self):
+        count = len(self.entries)
+        leaders = {0}
+        for (index, successors) in enumerate(self.edges):
+            if successors != [index + 1]:
+                leaders.update(successors)
+                leaders.add(index + 1)
+        leaders = sorted(leader for leader in leaders if leader < count)
+        self.block_of = array('I', bytes(4 * count)) if count else array('I')
+        for (number, start) in enumerate(leaders):
+            end = leaders[number + 1] if number + 1 < len(leaders) else count
+            self.blocks.append(Block(number, start, end))
+            for index in range(start, end):
+                self.block_of[index] = number
+        for block in self.blocks:
+            for successor in self.edges[block.end - 1]:
+                # falling off the last entry ends the program
+                if successor < count:
+                    target = self.block_of[successor]
+                    if target not in block.successors:
+                        block.successors.append(target)
+                        self.blocks[target].predecessors.append(block.index)
+
+    def mark_reachable(self):
+        if not self.blocks:
+            return
+        stack = [0]
+        self.blocks[0].reachable = True
+        while stack:
+            for successor in self.blocks[stack.pop()].successors:
+                if not self.blocks[successor].reachable:
+                    self.blocks[successor].reachable = True
+                    stack.append(successor)
+
+    def reachable(self, entry):
+        return self.blocks[self.block_of[entry]].reachable
+
+    # the program without dead statements and REMs: the statements, their
+    # lines, and how many statements were dropped
+    def pruned(self):
+        targets = set()
+        restored = set()
+        for node in self.entries:
+            if node[0] == 'GOTO' or node[0] == 'GOSUB':
+                targets.add(self.target(node[1]))
+            elif node[0] == 'ON':
+                targets.update(self.target(line_num) for line_num in node[3])
+            elif node[0] == 'RESTORE' and node[1] is not None:
+                restored.add(self.target(node[1]))
+        statements = []
+        lines = array('I')
+        for (statement, line_num, entry) in zip(self.statements, self.lines, self.statement_entries):
+            kept = entry in restored or statement[0] == 'DEF' or statement[0] == 'DATA'
+            if not kept and not self.reachable(entry):
+                continue
+            if statement[0] == 'REM' and entry not in targets and entry not in restored:
+                continue
+            statements.append(statement)
+            lines.append(line_num)
+        return (statements, lines, len(self.statements) - len(statements))
+
+    def __str__(self):
+        lines = []
+        for block in self.blocks:
+            lines.append(('' if block.reachable else 'dead ') + str(block))
+        for (next_entry, for_entry) in sorted(self.pairs.items()):
+            lines.append('NEXT %d pairs with FOR %d' % (next_entry, for_entry))
+        for next_entry in self.unpaired:
+            lines.append('NEXT %d has no FOR' % next_entry)
+        return '\n'.join(lines)
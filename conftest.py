@@ -0,0 +1 @@
+# the tests in tests/ import the modules at the top of the tree
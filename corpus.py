@@ -0,0 +1,260 @@
+import re
+
+from engine import BINARY, BUILTINS, FALSE, TRUE, is_name, literal_value
+from lexer import Lexer, Token
+
+# Programs, token streams and reference implementations shared by
+# bench.py, which times them, and the tests in tests/, which check the
+# front ends and back ends against them.
+
+SAMPLE_LINES = [
+    'let X == 1;',
+    'let Y == X * 2 + 3;',
+    'for I == 1 to 10 step 1 print I;',
+    'next I;',
+    'if X < Y then goto 10;',
+    'gosub 20;',
+    'rem SOME REMARK TEXT;',
+    'print "HELLO";',
+    'return;',
+]
+
+def sample_program(lines, statements=SAMPLE_LINES):
+    return '\n'.join(statements[i % len(statements)] for i in range(lines))
+
+# the original Lexer.__init__: the alternation is rebuilt for every
+# instance and each keyword is its own alternative ahead of ID
+def legacy_lex(input_string):
+    token_regex = '|'.join('(?P<%s>%s)' % pair for pair in Lexer.TOKEN_TYPES)
+    line_num = 1
+    line_start = 0
+    tokens = []
+    for mo in re.finditer(token_regex, input_string):
+        kind = mo.lastgroup
+        value = mo.group()
+        if kind == 'EOL':
+            line_start = mo.end()
+            line_num += 1
+        elif kind == 'SPACE':
+            pass
+        else:
+            column = mo.start() - line_start
+            tokens.append(Token(kind, value, line_num, column))
+    return tokens
+
+# file-like object producing a generated program without holding it in memory
+class GeneratedSource:
+    def __init__(self, lines, text='goto 10; gosub 20; next I; return;\n'):
+        self.remaining = lines
+        self.text = text
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return ''
+        lines = min(self.remaining, max(1, size // len(self.text)))
+        self.remaining -= lines
+        return self.text * lines
+
+# vintage_fe takes a token stream with pointer()/match()/end_of_file();
+# this one is built from whitespace separated lexemes
+VINTAGE_LEXEMES = {
+    'int': 'INTEGER_TYPE', 'float': 'FLOAT_TYPE', 'string': 'STRING_TYPE',
+    'void': 'VOID_TYPE', 'while': 'WHILE', 'if': 'IF', 'else': 'ELSE',
+    'return': 'RETURN', 'put': 'PUT', 'get': 'GET', 'not': 'NOT',
+    '(': 'LPAREN', ')': 'RPAREN', '{': 'LCURLY', '}': 'RCURLY',
+    '[': 'LSQUARE', ']': 'RSQUARE', '=': 'ASSIGN', '==': 'EQ', '=<': 'LE',
+    '+': 'PLUS', '-': 'MINUS', '*': 'MUL', '/': 'DIV', ';': 'SEMI', ',': 'COMMA',
+}
+
+class VintageToken:
+    __slots__ = ('type', 'value')
+
+    def __init__(self, type, value):
+        self.type = type
+        self.value = value
+
+def vintage_tokens(text):
+    tokens = []
+    for lexeme in text.split():
+        if lexeme in VINTAGE_LEXEMES:
+            tokens.append(VintageToken(VINTAGE_LEXEMES[lexeme], lexeme))
+        elif lexeme.isdigit():
+            tokens.append(VintageToken('INTEGER', int(lexeme)))
+        else:
+            tokens.append(VintageToken('ID', lexeme))
+    return tokens
+
+class ListStream:
+    def __init__(self, tokens):
+        self.tokens = tokens + [VintageToken('EOF', 'EOF')]
+        self.index = 0
+
+    def pointer(self):
+        return self.tokens[self.index]
+
+    def match(self, type):
+        token = self.tokens[self.index]
+        if token.type != type:
+            raise SyntaxError("match: expected {} got {}".format(type, token.value))
+        self.index += 1
+        return token
+
+    def end_of_file(self):
+        return self.tokens[self.index].type == 'EOF'
+
+VINTAGE_FUNCTION = """
+int f%d ( int a , int b ) {
+    int x = 1 ;
+    int [ 4 ] v ;
+    while ( x =< 10 ) {
+        x = x + a * ( b - 1 ) / 2 ;
+        v [ x ] = - x ;
+        put x ;
+    }
+    if ( x == 3 ) return x ; else { get b ; return g ( b , x ) + 1 ; }
+}
+"""
+
+# a tree-walking interpreter over the same flat layout as engine.Program:
+# every statement and expression node is dispatched on its tag each time
+# it is run
+def walk_expression(node, env):
+    if isinstance(node, str):
+        return env[node] if is_name(node) else literal_value(node)
+    tag = node[0]
+    if tag == 'FACTOR':
+        return node[1] * walk_expression(node[2], env)
+    elif tag == 'FUNC':
+        return BUILTINS[node[1]](*[walk_expression(arg, env) for arg in node[2]])
+    elif tag == 'UNARY':
+        return FALSE if walk_expression(node[2], env) else TRUE
+    elif tag == 'LOGIC':
+        left = walk_expression(node[2], env)
+        right = walk_expression(node[3], env)
+        if node[1] == 'AND':
+            return TRUE if left and right else FALSE
+        return TRUE if left or right else FALSE
+    return BINARY[node[1]](walk_expression(node[2], env), walk_expression(node[3], env))
+
+def walk(program):
+    env = dict.fromkeys(program.names, 0)
+    layout = program.layout
+    gosubs = []
+    frames = []
+    pc = 0
+    executed = 0
+    while pc < len(layout):
+        node = layout[pc]
+        kind = node[0]
+        executed += 1
+        pc += 1
+        if kind == 'LET':
+            env[node[1]] = walk_expression(node[2], env)
+        elif kind == 'PRINT':
+            walk_expression(node[1], env)
+        elif kind == 'IF':
+            if not walk_expression(node[1], env):
+                pc = node[2]
+        elif kind == 'JUMP':
+            pc = node[1]
+        elif kind == 'GOTO':
+            pc = program.line_index[literal_value(node[1])]
+        elif kind == 'GOSUB':
+            gosubs.append(pc)
+            pc = program.line_index[literal_value(node[1])]
+        elif kind == 'ON':
+            index = int(walk_expression(node[1], env))
+            if 1 <= index <= len(node[3]):
+                if node[2] == 'GOSUB':
+                    gosubs.append(pc)
+                pc = program.line_index[literal_value(node[3][index - 1])]
+        elif kind == 'RETURN':
+            pc = gosubs.pop()
+        elif kind == 'FOR':
+            env[node[1]] = walk_expression(node[2], env)
+            step = walk_expression(node[4], env) if node[4] is not None else 1
+            frames.append((node[1], walk_expression(node[3], env), step, pc))
+        elif kind == 'NEXT':
+            while frames[-1][0] != node[1]:
+                frames.pop()
+            (name, end, step, body) = frames[-1]
+            env[name] += step
+            if env[name] <= end if step >= 0 else env[name] >= end:
+                pc = body
+            else:
+                frames.pop()
+        elif kind == 'END':
+            break
+    return executed
+
+LOOP_PROGRAMS = {
+    'sum loop': """
+        let S == 0;
+        for I == 1 to 200000 let S == S + I * 2 - 1;
+        next I;
+    """,
+    'nested loops': """
+        let S == 0;
+        for I == 1 to 300 for J == 1 to 300 let S == S + (I - J) * (I + J) / 2;
+        next J;
+        next I;
+    """,
+    'gosub and if': """
+        let N == 0;
+        let S == 0;
+        for I == 1 to 50000 gosub 8;
+        next I;
+        end;
+        rem SUBROUTINE;
+        rem AT LINE 8;
+        let N == N + 1;
+        if N > 3 then let N == 0;
+        let S == S + SQR(N) * ABS(I - 100);
+        return;
+    """,
+}
+
+# the original dumpast.py, unchanged: a print() for every parenthesis,
+# space, indent bar and leaf
+def legacy_dumpast(node):
+    _dumpast(node)
+    print('')
+
+def _dumpast(node, level=0):
+
+    if isinstance(node, tuple):
+        indent(level)
+        nchildren = len(node) - 1
+
+        print("(%s" % node[0], end='')
+
+        if nchildren > 0:
+            print(" ", end='')
+
+        for c in range(nchildren):
+            _dumpast(node[c+1], level+1)
+            if c != nchildren-1:
+                print(' ', end='')
+
+        print(")", end='')
+    elif isinstance(node, list):
+        indent(level)
+        nchildren = len(node)
+
+        print("[", end='')
+
+        if nchildren > 0:
+            print(" ", end='')
+
+        for c in range(nchildren):
+            _dumpast(node[c], level+1)
+            if c != nchildren-1:
+                print(' ', end='')
+        print("]", end='')
+    else:
+        print("%s" % str(node), end='')
+
+def indent(level):
+    print('')
+    for i in range(level):
+        print('  |',end='')
@@ -1,42 +1,146 @@
-def dumpast(node):
-    _dumpast(node)
-    print('')
+import io
+import json
+import sys
 
-def _dumpast(node, level=0):
+# Text renderings of vintage_fe and parser_1 trees.
+#
+# 'tree' is the indented tree dumpast has always printed: a tuple on a line
+# of its own, '(KIND', indented by one '  |' per level, and a list as '['.
+# 'sexp' is the same tree as one compact S-expression, with a string leaf
+# that would not read back as one atom written as a JSON string.  'ndjson'
+# is one JSON array per top level statement (each element of a list, or of
+# the list of a STMTLIST), one per line.
+#
+# The tree is rendered in one pass without recursion, so trees of any
+# depth can be dumped.  The pieces are collected in a list that is joined
+# and written once they hold FLUSH characters, so a large tree is written
+# in a few large writes rather than one for every parenthesis and leaf,
+# and a deep tree, whose indents are long, is not held in memory whole.
 
-    if isinstance(node, tuple):
-        indent(level)
-        nchildren = len(node) - 1
+FLUSH = 65536
 
-        print("(%s" % node[0], end='')
+def dumpast(node, file=None):
+    dump(node, file)
 
-        if nchildren > 0:
-            print(" ", end='')
+# write node to file (stdout by default) in the given format
+def dump(node, file=None, format='tree'):
+    if file is None:
+        file = sys.stdout
+    if format not in FORMATS:
+        raise ValueError("unknown format {}".format(format))
+    FORMATS[format](node, file.write)
 
-        for c in range(nchildren):
-            _dumpast(node[c+1], level+1)
-            if c != nchildren-1:
-                print(' ', end='')
+# node in the given format, as a string
+def dumps(node, format='tree'):
+    buffer = io.StringIO()
+    dump(node, buffer, format)
+    return buffer.getvalue()
 
-        print(")", end='')
-    elif isinstance(node, list):
-        indent(level)
-        nchildren = len(node)
+# Append the pieces of tree to pieces, which hold size characters,
+# writing them out every FLUSH characters; returns the characters left in
+# pieces.  Each frame on the stack is a tuple or list being rendered, the
+# index of its next child, the index of its first child, the separator
+# written before the first child, its level and what closes it.
+def render(tree, pieces, write, leaf, open_tuple, open_list, separator, first_list, close_tuple,
+           close_list, size=0):
+    append = pieces.append
+    stack = []
+    node = tree
+    level = 0
+    while True:
+        if isinstance(node, tuple):
+            piece = open_tuple(level, node[0])
+            stack.append([node, 1, 1, separator, level, close_tuple])
+        elif isinstance(node, list):
+            piece = open_list(level)
+            stack.append([node, 0, 0, first_list, level, close_list])
+        else:
+            piece = leaf(node)
+        append(piece)
+        size += len(piece)
+        # find the next child to render, closing the nodes that are done
+        while stack:
+            frame = stack[-1]
+            (parent, index, start, first, level, close) = frame
+            if index < len(parent):
+                frame[1] = index + 1
+                append(first if index == start else separator)
+                # separators and closes are one character or none
+                size += 1
+                node = parent[index]
+                level += 1
+                break
+            stack.pop()
+            append(close)
+            size += 1
+        else:
+            break
+        if size >= FLUSH:
+            write(''.join(pieces))
+            pieces.clear()
+            size = 0
+    return size
 
-        print("[", end='')
+def tree_leaf(node):
+    return node if type(node) is str else str(node)
 
-        if nchildren > 0:
-            print(" ", end='')
+def write_tree(tree, write):
+    # '\n' and the indent bars of the deepest level so far; a level's
+    # prefix is cut from it
+    bars = ['\n']
 
-        for c in range(nchildren):
-            _dumpast(node[c], level+1)
-            if c != nchildren-1:
-                print(' ', end='')
-        print("]", end='')
-    else:
-        print("%s" % str(node), end='')
+    def prefix(level):
+        if len(bars[0]) <= 3 * level:
+            bars[0] = '\n' + '  |' * (2 * level)
+        return bars[0][:3 * level + 1]
 
-def indent(level):
-    print('')
-    for i in range(level):
-        print('  |',end='')
+    pieces = []
+    render(tree, pieces, write, tree_leaf,
+           lambda level, kind: prefix(level) + '(' + str(kind),
+           lambda level: prefix(level) + '[',
+           ' ', ' ', ')', ']')
+    pieces.append('\n')
+    write(''.join(pieces))
+
+# characters that end an atom of an S-expression
+ATOM_ENDS = frozenset(' \t\n\r()[]";')
+
+def sexp_leaf(node):
+    if type(node) is not str:
+        return str(node)
+    if not node or not ATOM_ENDS.isdisjoint(node):
+        return json.dumps(node)
+    return node
+
+def write_sexp(tree, write):
+    pieces = []
+    render(tree, pieces, write, sexp_leaf,
+           lambda level, kind: '(' + sexp_leaf(kind),
+           lambda level: '[',
+           ' ', '', ')', ']')
+    pieces.append('\n')
+    write(''.join(pieces))
+
+def json_leaf(node):
+    return str(node) if type(node) is int else json.dumps(node)
+
+def write_ndjson(tree, write):
+    if isinstance(tree, tuple) and len(tree) == 2 and tree[0] == 'STMTLIST':
+        tree = tree[1]
+    statements = tree if isinstance(tree, list) else [tree]
+    pieces = []
+    size = 0
+    for statement in statements:
+        size = render(statement, pieces, write, json_leaf,
+                      lambda level, kind: '[' + json_leaf(kind),
+                      lambda level: '[',
+                      ',', '', ']', ']', size)
+        pieces.append('\n')
+        size += 1
+    write(''.join(pieces))
+
+FORMATS = {
+    'tree': write_tree,
+    'sexp': write_sexp,
+    'ndjson': write_ndjson,
+}
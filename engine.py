@@ -0,0 +1,389 @@
+import math
+import random
+import sys
+
+from lexer import Lexer, TokenList
+from parser_1 import Parser, ProgramIndex, literal_value
+
+# Execution engine for parser_1 programs.
+#
+# Each statement is compiled once into a Python closure that runs it and
+# returns the index of the next statement to run, so a program is executed
+# by the loop in Program.run() without looking at the tree again.  The
+# statement list is first laid out flat: the statement after THEN and the
+# statement on the FOR line get their own places, so that jumps (GOTO,
+# GOSUB, RETURN, NEXT) can land anywhere.
+#
+# GOTO and GOSUB take a source line number: the first statement starting
+# on that line.  Comparisons and logic give -1 for true and 0 for false,
+# and a FOR body always runs at least once, as in Microsoft BASIC.
+#
+# The DATA literals are pooled when the program is parsed (see
+# parser_1.ProgramIndex): READ takes the next values from the pool and
+# RESTORE moves the read position, so a DATA statement does nothing when
+# it is run.
+
+TRUE = -1
+FALSE = 0
+
+# the math builtins of grammar.txt
+BUILTINS = {
+    'ABS': abs,
+    'ATN': math.atan,
+    'COS': math.cos,
+    'EXP': math.exp,
+    'INT': lambda x: math.floor(x),
+    'LEN': len,
+    'LOG': math.log,
+    'RND': lambda x=1: random.random(),
+    'SGN': lambda x: (x > 0) - (x < 0),
+    'SIN': math.sin,
+    'SQR': math.sqrt,
+    'TAN': math.tan,
+    'STR': lambda x: format_value(x),
+    'VAL': lambda s: literal_value(s.strip()),
+    'ASC': ord,
+    'CHR': chr,
+}
+
+BINARY = {
+    'ADD': lambda a, b: a + b,
+    'SUB': lambda a, b: a - b,
+    'MUL': lambda a, b: a * b,
+    'DIV': lambda a, b: a / b,
+    'POW': lambda a, b: a ** b,
+    'EQ':  lambda a, b: TRUE if a == b else FALSE,
+    'NEQ': lambda a, b: TRUE if a != b else FALSE,
+    'LSS': lambda a, b: TRUE if a < b else FALSE,
+    'GRT': lambda a, b: TRUE if a > b else FALSE,
+    'LEQ': lambda a, b: TRUE if a <= b else FALSE,
+    'GREQ': lambda a, b: TRUE if a >= b else FALSE,
+}
+
+def format_value(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+def is_name(text):
+    return text[:1].isalpha()
+
+# The program laid out flat, one entry per place a jump can land.  An IF
+# becomes ('IF', condition, index when false) followed by its statement,
+# and a FOR becomes ('FOR', variable, start, end, step) followed by the
+# statement on its line.  line_index maps a source line to the first entry
+# of the statement starting on it.
+class Layout:
+    def __init__(self, statements, lines=None):
+        if lines is None:
+            lines = range(1, len(statements) + 1)
+        self.entries = []
+        self.line_index = {}
+        for (statement, line_num) in zip(statements, lines):
+            self.line_index.setdefault(line_num, len(self.entries))
+            self.place(statement)
+
+    def place(self, node):
+        kind = node[0]
+        if kind == 'IF':
+            (IF, condition, true_statement, false_statement) = node
+            index = len(self.entries)
+            self.entries.append(None)
+            self.place(true_statement)
+            if false_statement is None:
+                self.entries[index] = ('IF', condition, len(self.entries))
+            else:
+                jump = len(self.entries)
+                self.entries.append(None)
+                self.entries[index] = ('IF', condition, len(self.entries))
+                self.place(false_statement)
+                self.entries[jump] = ('JUMP', len(self.entries))
+        elif kind == 'FOR':
+            (FOR, variable, start, end, step, loop_statement) = node
+            self.entries.append(('FOR', variable, start, end, step))
+            if loop_statement is not None:
+                self.place(loop_statement)
+        else:
+            self.entries.append(node)
+
+    # the entry a GOTO or GOSUB to the given line number jumps to
+    def target(self, line_num):
+        line_num = literal_value(line_num)
+        if line_num not in self.line_index:
+            raise ValueError("undefined line {}".format(line_num))
+        return self.line_index[line_num]
+
+class Program:
+    # vectorize runs the numeric loops vectorize.find_kernels() picks out
+    # as NumPy array operations.  index is the parser_1.ProgramIndex of the
+    # statements, built from them when not given
+    def __init__(self, statements, lines=None, vectorize=False, index=None):
+        self.env = {}
+        self.names = set()
+        self.gosub_stack = []
+        self.for_stack = []
+        self.output = sys.stdout
+        layout = Layout(statements, lines)
+        self.layout = layout.entries
+        self.line_index = layout.line_index
+        self.target = layout.target
+        self.end = len(self.layout)
+        if index is None:
+            index = ProgramIndex.of(statements, lines)
+        self.index = index
+        self.data = index.data
+        self.data_position = 0
+        # DEF FN functions, defined for the whole program: name ->
+        # (parameters, body), and name -> [compiled body]
+        self.functions = {node[1]: (node[2], node[3]) for node in self.layout if node[0] == 'DEF'}
+        self.function_bodies = {}
+        self.kernels = {}
+        if vectorize:
+            from vectorize import find_kernels
+            self.kernels = find_kernels(layout)
+        self.code = [self.compile_statement(node, pc) for (pc, node) in enumerate(self.layout)]
+
+    def variable(self, name):
+        self.names.add(name)
+        return name
+
+    # statement -> closure returning the index of the statement to run next
+    def compile_statement(self, node, pc):
+        kind = node[0]
+        following = pc + 1
+        env = self.env
+        if kind == 'LET':
+            name = self.variable(node[1])
+            value = self.compile_expression(node[2])
+            def run():
+                env[name] = value()
+                return following
+        elif kind == 'PRINT':
+            value = self.compile_expression(node[1])
+            def run():
+                print(format_value(value()), file=self.output)
+                return following
+        elif kind == 'IF':
+            condition = self.compile_expression(node[1])
+            otherwise = node[2]
+            def run():
+                return following if condition() else otherwise
+        elif kind == 'JUMP':
+            target = node[1]
+            def run():
+                return target
+        elif kind == 'GOTO':
+            target = self.target(node[1])
+            def run():
+                return target
+        elif kind == 'GOSUB':
+            target = self.target(node[1])
+            push = self.gosub_stack.append
+            def run():
+                push(following)
+                return target
+        elif kind == 'ON':
+            (ON, selector, jump, targets) = node
+            selector = self.compile_expression(selector)
+            targets = [self.target(line_num) for line_num in targets]
+            push = self.gosub_stack.append if jump == 'GOSUB' else None
+            def run():
+                index = int(selector())
+                if not 1 <= index <= len(targets):
+                    return following
+                if push:
+                    push(following)
+                return targets[index - 1]
+        elif kind == 'RETURN':
+            stack = self.gosub_stack
+            def run():
+                if not stack:
+                    raise RuntimeError("RETURN without GOSUB")
+                return stack.pop()
+        elif kind == 'FOR':
+            name = self.variable(node[1])
+            start = self.compile_expression(node[2])
+            end = self.compile_expression(node[3])
+            step = self.compile_expression(node[4]) if node[4] is not None else lambda: 1
+            frames = self.for_stack
+            (kernel, last) = self.kernels.get(pc, (None, None))
+            def run():
+                # re-entering a loop drops its old frame and any inside it
+                for i in range(len(frames) - 1, -1, -1):
+                    if frames[i][0] == name:
+                        del frames[i:]
+                        break
+                first = env[name] = start()
+                limit = end()
+                increment = step()
+                # the whole loop at once, or one iteration at a time
+                if kernel is not None and kernel.run(env, first, limit, increment):
+                    return last + 1
+                frames.append((name, limit, increment, following))
+                return following
+        elif kind == 'NEXT':
+            name = self.variable(node[1])
+            frames = self.for_stack
+            def run():
+                # an inner loop left without its NEXT is closed as well
+                while frames and frames[-1][0] != name:
+                    frames.pop()
+                if not frames:
+                    raise RuntimeError("NEXT without FOR: {}".format(name))
+                (_, end, step, body) = frames[-1]
+                value = env[name] + step
+                env[name] = value
+                if value <= end if step >= 0 else value >= end:
+                    return body
+                frames.pop()
+                return following
+        elif kind == 'READ':
+            names = [self.variable(name) for name in node[1]]
+            data = self.data
+            def run():
+                position = self.data_position
+                if position + len(names) > len(data):
+                    raise RuntimeError("out of DATA")
+                for name in names:
+                    env[name] = data[position]
+                    position += 1
+                self.data_position = position
+                return following
+        elif kind == 'RESTORE':
+            position = 0 if node[1] is None else self.index.restore(node[1])
+            def run():
+                self.data_position = position
+                return following
+        elif kind == 'END':
+            end = self.end
+            def run():
+                return end
+        elif kind == 'REM' or kind == 'DEF' or kind == 'DATA':
+            def run():
+                return following
+        else:
+            raise ValueError("cannot execute {}".format(kind))
+        return run
+
+    # expression -> closure computing its value
+    def compile_expression(self, node):
+        env = self.env
+        if isinstance(node, str):
+            if is_name(node):
+                name = self.variable(node)
+                return lambda: env[name]
+            value = literal_value(node)
+            return lambda: value
+        tag = node[0]
+        if tag == 'FACTOR':
+            (FACTOR, sign, operand) = node
+            value = self.compile_expression(operand)
+            if sign == 1:
+                return value
+            if sign == -1:
+                return lambda: -value()
+            return lambda: sign * value()
+        elif tag == 'FUNC' and node[1] in self.functions:
+            return self.compile_call(node[1], [self.compile_expression(arg) for arg in node[2]])
+        elif tag == 'FUNC':
+            (FUNC, name, args) = node
+            if name not in BUILTINS:
+                raise ValueError("unknown function {}".format(name))
+            function = BUILTINS[name]
+            args = [self.compile_expression(arg) for arg in args]
+            if len(args) == 1:
+                (arg,) = args
+                return lambda: function(arg())
+            return lambda: function(*[arg() for arg in args])
+        elif tag == 'UNARY':
+            value = self.compile_expression(node[2])
+            return lambda: FALSE if value() else TRUE
+        elif tag == 'LOGIC':
+            (LOGIC, op, left, right) = node
+            left = self.compile_expression(left)
+            right = self.compile_expression(right)
+            if op == 'AND':
+                return lambda: TRUE if left() and right() else FALSE
+            return lambda: TRUE if left() or right() else FALSE
+        else:
+            (tag, op, left, right) = node
+            left = self.compile_expression(left)
+            right = self.compile_expression(right)
+            # the common operators get their own closure, saving a call
+            if op == 'ADD':
+                return lambda: left() + right()
+            elif op == 'SUB':
+                return lambda: left() - right()
+            elif op == 'MUL':
+                return lambda: left() * right()
+            elif op == 'LSS':
+                return lambda: TRUE if left() < right() else FALSE
+            function = BINARY[op]
+            return lambda: function(left(), right())
+
+    # a call of a DEF FN function: the parameters are bound for the call
+    # and restored afterwards
+    def compile_call(self, name, args):
+        env = self.env
+        (parameters, body) = self.functions[name]
+        if len(args) != len(parameters):
+            raise ValueError("{} takes {} arguments".format(name, len(parameters)))
+        holder = self.function_bodies.get(name)
+        if holder is None:
+            # the body is compiled once; a recursive call finds the holder
+            # and reads the body from it when it runs
+            holder = self.function_bodies[name] = []
+            for parameter in parameters:
+                self.variable(parameter)
+            holder.append(self.compile_expression(body))
+        def call():
+            values = [arg() for arg in args]
+            saved = [env[parameter] for parameter in parameters]
+            for (parameter, value) in zip(parameters, values):
+                env[parameter] = value
+            try:
+                return holder[0]()
+            finally:
+                for (parameter, value) in zip(parameters, saved):
+                    env[parameter] = value
+        return call
+
+    # run the program; returns the number of statements executed
+    def run(self, output=None):
+        self.output = output or sys.stdout
+        self.env.clear()
+        for name in self.names:
+            self.env[name] = 0
+        del self.gosub_stack[:]
+        del self.for_stack[:]
+        self.data_position = 0
+        code = self.code
+        end = self.end
+        pc = 0
+        executed = 0
+        while pc < end:
+            pc = code[pc]()
+            executed += 1
+        return executed
+
+# lex and parse BASIC source: the parser, with its statements and index
+def parse_program(text):
+    parser = Parser(TokenList(Lexer.iter_tokens(text)))
+    parser.parse()
+    if parser.errors:
+        raise SyntaxError('\n'.join(str(error) for error in parser.errors))
+    return parser
+
+# lex and parse BASIC source: the statements and the line each starts on
+def parse_source(text):
+    parser = parse_program(text)
+    return (parser.statements, parser.statement_lines)
+
+# lex, parse and compile BASIC source; with a parsecache.ParseCache the
+# statements are taken from it when they are there
+def compile_source(text, vectorize=False, cache=None):
+    if cache is not None:
+        (statements, lines) = cache.parse_basic(text)
+        return Program(statements, lines, vectorize)
+    parser = parse_program(text)
+    return Program(parser.statements, parser.statement_lines, vectorize, parser.index)
@@ -0,0 +1,501 @@
+import math
+
+from engine import BINARY, BUILTINS, FALSE, TRUE, is_name, literal_value
+
+# Constant folding and algebraic simplification for vintage_fe and parser_1
+# trees.
+#
+# fold_vintage(tree) and fold_basic(statements) return the simplified tree
+# and the number of nodes (tuples) it no longer has.  Operators whose
+# operands are all constants are replaced by their value, computed the way
+# the program would compute it; anything that would raise an error when
+# the program runs (a division by zero, SQR of a negative number, adding a
+# string to a number) is left alone so that it still does.  Identities are
+# applied where the operand's type is known well enough for the result to
+# be the same value of the same type: x*1, 1*x, x+0, 0+x and x-0 for a
+# numeric x, x/1 for a float x, and x*0 and 0*x for a pure integer x.
+# (A float -0.0 + 0 is 0.0, which no operation in either language can tell
+# from -0.0.)
+#
+# The trees are rebuilt bottom up without recursion, so trees from the
+# explicit-stack parser of any depth can be folded.  Unchanged subtrees are
+# shared with the input.
+
+# rebuild a tree of tuples and lists bottom up, passing each rebuilt tuple
+# through simplify; tuples with a kind in leaves are kept as they are.
+# Returns the new tree and the number of tuples it no longer has.  Each
+# frame is a node, the index of its next child and its children so far
+def rebuild(tree, simplify, leaves=()):
+    if not isinstance(tree, (tuple, list)):
+        return (tree, 0)
+    eliminated = 0
+    stack = [(tree, [0], [])]
+    while True:
+        (node, position, children) = stack[-1]
+        index = position[0]
+        if index < len(node):
+            position[0] = index + 1
+            child = node[index]
+            if isinstance(child, list) or isinstance(child, tuple) and child and child[0] not in leaves:
+                stack.append((child, [0], []))
+            else:
+                children.append(child)
+            continue
+        stack.pop()
+        for (new, old) in zip(children, node):
+            if new is not old:
+                node = tuple(children) if isinstance(node, tuple) else children
+                break
+        if isinstance(node, tuple):
+            simplified = simplify(node)
+            if simplified is not node:
+                eliminated += replaced(node, simplified)
+                node = simplified
+        if not stack:
+            return (node, eliminated)
+        stack[-1][2].append(node)
+
+# the number of tuples fewer in new than in old, where new is a part of
+# old, or is made of new tuples and parts of old
+def replaced(old, new):
+    removed = 0
+    inside = False
+    stack = [old]
+    while stack:
+        node = stack.pop()
+        if node is new:
+            inside = True
+            continue
+        if isinstance(node, tuple):
+            removed += 1
+        stack.extend([child for child in node if isinstance(child, (tuple, list))])
+    if not inside:
+        removed -= count_nodes(new)
+    return removed
+
+def count_nodes(tree):
+    count = 0
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, tuple):
+            count += 1
+        stack.extend([child for child in node if isinstance(child, (tuple, list))])
+    return count
+
+# vintage_fe ------------------------------------------------------------
+
+INTEGER = ('INTEGER_TYPE',)
+FLOAT = ('FLOAT_TYPE',)
+STRING = ('STRING_TYPE',)
+NUMERIC = {'INTEGER_TYPE', 'FLOAT_TYPE'}
+
+# nodes with nothing to simplify inside
+VINTAGE_LEAVES = {'ID', 'CONST', 'INTEGER_TYPE', 'FLOAT_TYPE', 'STRING_TYPE',
+                  'VOID_TYPE', 'ARRAY_TYPE', 'FUNCTION_TYPE', 'FORMALARG', 'NIL'}
+
+# expressions that cannot fail or have an effect when evaluated
+VINTAGE_PURE = {'ID', 'CONST', 'PLUS', 'MINUS', 'MUL', 'UMINUS', 'NOT', 'EQ', 'LE'}
+
+def vintage_const(value):
+    if isinstance(value, float):
+        if not math.isfinite(value):
+            return None
+        return ('CONST', FLOAT, ('VALUE', value))
+    if isinstance(value, int):
+        return ('CONST', INTEGER, ('VALUE', value))
+    return ('CONST', STRING, ('VALUE', value))
+
+# the declared types of the names in a vintage_fe tree: name -> type for
+# the names with one declaration, or declarations that agree, as scalars;
+# arrays and functions are told apart from scalars by the node using them
+class VintageTypes:
+    def __init__(self, tree):
+        declared = {}
+        stack = [tree]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, list):
+                stack.extend(node)
+                continue
+            if not isinstance(node, tuple) or not node:
+                continue
+            kind = node[0]
+            if kind == 'VARDECL' or kind == 'ARRAYDECL':
+                declared.setdefault(node[1][1], set()).add(node[2])
+            elif kind == 'FORMALARG':
+                declared.setdefault(node[2][1], set()).add(node[1])
+            elif kind == 'FUNDECL':
+                declared.setdefault(node[1][1], set()).add(('FUNCTION', node[2][1]))
+            if kind not in VINTAGE_LEAVES or kind == 'FORMALARG':
+                stack.extend([child for child in node if isinstance(child, (tuple, list))])
+        self.names = {}
+        for (name, types) in declared.items():
+            if len(types) == 1:
+                self.names[name] = types.pop()
+
+    # the type of an expression, or None when it is not known
+    def type_of(self, node):
+        kind = node[0]
+        if kind == 'CONST':
+            return node[1]
+        elif kind == 'ID':
+            t = self.names.get(node[1])
+            return t if t is not None and t[0] in NUMERIC | {'STRING_TYPE'} else None
+        elif kind == 'ARRAY_ACCESS' and node[1][0] == 'ID':
+            t = self.names.get(node[1][1])
+            return t[1] if t is not None and t[0] == 'ARRAY_TYPE' else None
+        elif kind == 'CALLEXP':
+            t = self.names.get(node[1][1])
+            return t[1] if t is not None and t[0] == 'FUNCTION' else None
+        elif kind == 'EQ' or kind == 'LE' or kind == 'NOT':
+            return INTEGER
+        elif kind == 'UMINUS':
+            t = self.type_of(node[1])
+            return t if t is not None and t[0] in NUMERIC else None
+        elif kind in ('PLUS', 'MINUS', 'MUL', 'DIV'):
+            a = self.type_of(node[1])
+            b = self.type_of(node[2])
+            if a is None or b is None:
+                return None
+            if a[0] in NUMERIC and b[0] in NUMERIC:
+                return FLOAT if FLOAT in (a, b) else INTEGER
+            if kind == 'PLUS' and a == STRING and b == STRING:
+                return STRING
+        return None
+
+def vintage_pure(node):
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if node[0] not in VINTAGE_PURE:
+            return False
+        if node[0] not in ('ID', 'CONST'):
+            stack.extend(node[1:])
+    return True
+
+class VintageFolder:
+    def __init__(self, tree):
+        self.types = VintageTypes(tree)
+
+    def simplify(self, node):
+        kind = node[0]
+        if kind == 'UMINUS' or kind == 'NOT':
+            operand = node[1]
+            if operand[0] == 'CONST':
+                (CONST, t, (VALUE, value)) = operand
+                if kind == 'UMINUS' and t[0] in NUMERIC:
+                    return vintage_const(-value)
+                if kind == 'NOT' and t == INTEGER:
+                    return vintage_const(0 if value else 1)
+            return node
+        if kind not in ('PLUS', 'MINUS', 'MUL', 'DIV', 'EQ', 'LE') or len(node) != 3:
+            return node
+        (op, left, right) = node
+        if left[0] == 'CONST' and right[0] == 'CONST':
+            folded = self.fold(op, left, right)
+            if folded is not None:
+                return folded
+        return self.identity(op, left, right) or node
+
+    def fold(self, op, left, right):
+        (CONST, a_type, (VALUE, a)) = left
+        (CONST, b_type, (VALUE, b)) = right
+        numeric = a_type[0] in NUMERIC and b_type[0] in NUMERIC
+        if op == 'EQ' and (numeric or a_type == b_type):
+            return vintage_const(1 if a == b else 0)
+        if op == 'LE' and (numeric or a_type == b_type):
+            return vintage_const(1 if a <= b else 0)
+        if op == 'PLUS' and a_type == STRING and b_type == STRING:
+            return vintage_const(a + b)
+        if not numeric:
+            return None
+        if FLOAT in (a_type, b_type):
+            (a, b) = (float(a), float(b))
+        if op == 'PLUS':
+            return vintage_const(a + b)
+        elif op == 'MINUS':
+            return vintage_const(a - b)
+        elif op == 'MUL':
+            return vintage_const(a * b)
+        elif b == 0:
+            return None
+        elif isinstance(a, float):
+            return vintage_const(a / b)
+        # integer division is folded only when it is exact, where every
+        # rounding agrees
+        elif a % b == 0:
+            return vintage_const(a // b)
+        return None
+
+    def identity(self, op, left, right):
+        for (x, c, commutes) in ((left, right, False), (right, left, True)):
+            if c[0] != 'CONST' or c[1][0] not in NUMERIC:
+                continue
+            if commutes and op not in ('PLUS', 'MUL'):
+                continue
+            t = self.types.type_of(x)
+            if t is None or t[0] not in NUMERIC:
+                continue
+            value = c[2][1]
+            # x op c has the type of x unless c is a float and x is not
+            keeps_type = c[1] == INTEGER or t == FLOAT
+            if value == 0 and op in ('PLUS', 'MINUS') and keeps_type:
+                return x
+            if value == 1 and op == 'MUL' and keeps_type:
+                return x
+            if value == 1 and op == 'DIV' and t == FLOAT:
+                return x
+            if value == 0 and op == 'MUL' and t == INTEGER == c[1] and vintage_pure(x):
+                return c
+        return None
+
+def fold_vintage(tree):
+    return rebuild(tree, VintageFolder(tree).simplify, VINTAGE_LEAVES)
+
+# parser_1 ---------------------------------------------------------------
+
+# types of parser_1 values: 'int', 'float', 'number' (either), 'str', or
+# None for not known
+ARITHMETIC_TYPES = {'int', 'float', 'number'}
+# builtin -> type of its result; None is the argument's numeric type
+BUILTIN_TYPES = {
+    'ABS': None, 'INT': 'int', 'SGN': 'int', 'LEN': 'int', 'ASC': 'int',
+    'STR': 'str', 'CHR': 'str', 'ATN': 'float', 'COS': 'float', 'EXP': 'float',
+    'LOG': 'float', 'SIN': 'float', 'SQR': 'float', 'TAN': 'float', 'RND': 'float',
+}
+# builtins that return something else each call
+IMPURE_BUILTINS = {'RND'}
+BASIC_PURE = {'EXPR', 'TERM'}
+
+def join(a, b):
+    if a == b:
+        return a
+    if a in ARITHMETIC_TYPES and b in ARITHMETIC_TYPES:
+        return 'number'
+    return None
+
+# the parser_1 constant an expression is, as ('FACTOR', sign, literal),
+# or NOT_CONSTANT
+NOT_CONSTANT = object()
+
+def basic_value(node):
+    if isinstance(node, tuple) and node[0] == 'FACTOR' and isinstance(node[2], str):
+        (FACTOR, sign, text) = node
+        if is_name(text):
+            return NOT_CONSTANT
+        value = literal_value(text)
+        if isinstance(value, str):
+            return value if sign == 1 else NOT_CONSTANT
+        return sign * value
+    return NOT_CONSTANT
+
+def basic_const(value):
+    if isinstance(value, bool) or value is NOT_CONSTANT:
+        return None
+    if isinstance(value, int):
+        return ('FACTOR', -1 if value < 0 else 1, str(abs(value)))
+    if isinstance(value, float):
+        text = repr(abs(value))
+        # the literal must read back as the same float
+        if not math.isfinite(value) or '.' not in text or 'e' in text:
+            return None
+        return ('FACTOR', -1 if math.copysign(1, value) < 0 else 1, text)
+    if isinstance(value, str) and '"' not in value:
+        return ('FACTOR', 1, '"%s"' % value)
+    return None
+
+class BasicFolder:
+    def __init__(self, statements):
+        self.eliminated = 0
+        self.functions = set()
+        self.parameters = set()
+        assignments = []
+        read = set()
+        stack = list(statements)
+        while stack:
+            node = stack.pop()
+            if node is None:
+                continue
+            kind = node[0]
+            if kind == 'LET':
+                assignments.append((node[1], node[2]))
+            elif kind == 'FOR':
+                assignments.append((node[1], node[2]))
+                assignments.append((node[1], node[4] or ('FACTOR', 1, '1')))
+                stack.append(node[5])
+            elif kind == 'IF':
+                stack.extend(node[2:])
+            elif kind == 'DEF':
+                self.functions.add(node[1])
+            elif kind == 'READ':
+                read.update(node[1])
+        # every variable starts as 0, and widens to what is assigned to it;
+        # READ can assign anything
+        self.variables = dict.fromkeys(read)
+        changed = True
+        while changed:
+            changed = False
+            for (name, expression) in assignments:
+                old = self.variables.get(name, 'int')
+                new = join(old, self.type_of(expression))
+                if new != old or name not in self.variables:
+                    self.variables[name] = new
+                    changed = new != old or changed
+
+    def type_of(self, node):
+        if isinstance(node, str):
+            if is_name(node):
+                if node in self.parameters:
+                    return None
+                return self.variables.get(node, 'int')
+            value = literal_value(node)
+            return 'str' if isinstance(value, str) else type(value).__name__
+        tag = node[0]
+        if tag == 'FACTOR':
+            t = self.type_of(node[2])
+            return t if node[1] == 1 or t in ARITHMETIC_TYPES else None
+        elif tag == 'FUNC':
+            (FUNC, name, args) = node
+            if name in self.functions or name not in BUILTIN_TYPES:
+                return None
+            t = BUILTIN_TYPES[name]
+            if t is None and len(args) == 1:
+                t = self.type_of(args[0])
+                return t if t in ARITHMETIC_TYPES else None
+            return t
+        elif tag in ('COMPARE', 'LOGIC', 'UNARY'):
+            return 'int'
+        (tag, op, left, right) = node
+        a = self.type_of(left)
+        b = self.type_of(right)
+        if op == 'ADD' and a == b == 'str':
+            return 'str'
+        if a not in ARITHMETIC_TYPES or b not in ARITHMETIC_TYPES:
+            return None
+        if op == 'DIV':
+            return 'float'
+        if op == 'POW':
+            exponent = basic_value(right)
+            if a == 'int' and isinstance(exponent, int) and exponent >= 0:
+                return 'int'
+            return None
+        if a == b:
+            return a
+        return 'float' if 'float' in (a, b) else 'number'
+
+    # no calls and no operators that can fail on integers
+    def pure(self, node):
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, str):
+                continue
+            if node[0] == 'FACTOR':
+                stack.append(node[2])
+            elif node[0] in BASIC_PURE and node[1] != 'DIV':
+                stack.extend(node[2:])
+            else:
+                return False
+        return True
+
+    def simplify(self, node):
+        tag = node[0]
+        if tag == 'DEF':
+            return node
+        if tag == 'FACTOR':
+            (FACTOR, sign, operand) = node
+            if isinstance(operand, str):
+                return node
+            if operand[0] == 'FACTOR':
+                value = basic_value(operand)
+                if value is not NOT_CONSTANT and not isinstance(value, str):
+                    return basic_const(sign * value) or node
+                return ('FACTOR', sign * operand[1], operand[2])
+            if sign == 1 and operand[0] != 'FUNC':
+                # parentheses: the operator node stands on its own
+                return operand
+            return node
+        elif tag == 'FUNC':
+            (FUNC, name, args) = node
+            if name in self.functions or name not in BUILTINS or name in IMPURE_BUILTINS:
+                return node
+            values = [basic_value(arg) for arg in args]
+            if NOT_CONSTANT in values:
+                return node
+            return self.compute(lambda: BUILTINS[name](*values), node)
+        elif tag == 'UNARY':
+            value = basic_value(node[2])
+            if value is NOT_CONSTANT:
+                return node
+            return basic_const(FALSE if value else TRUE)
+        elif tag not in ('EXPR', 'TERM', 'POWER', 'COMPARE', 'LOGIC'):
+            return node
+        (tag, op, left, right) = node
+        a = basic_value(left)
+        b = basic_value(right)
+        if a is not NOT_CONSTANT and b is not NOT_CONSTANT:
+            if tag == 'LOGIC':
+                if op == 'AND':
+                    return basic_const(TRUE if a and b else FALSE)
+                return basic_const(TRUE if a or b else FALSE)
+            if op == 'POW' and not small_power(a, b):
+                return node
+            return self.compute(lambda: BINARY[op](a, b), node)
+        return self.identity(op, left, right, a, b) or node
+
+    # the constant of what compute gives, or node when it fails
+    def compute(self, compute, node):
+        try:
+            value = compute()
+        except (ArithmeticError, TypeError, ValueError):
+            return node
+        return basic_const(value) or node
+
+    def identity(self, op, left, right, a, b):
+        for (x, c, commutes) in ((left, right, False), (right, left, True)):
+            value = b if not commutes else a
+            if value is NOT_CONSTANT or isinstance(value, str):
+                continue
+            if commutes and op not in ('ADD', 'MUL'):
+                continue
+            t = self.type_of(x)
+            if t not in ARITHMETIC_TYPES:
+                continue
+            keeps_type = isinstance(value, int) or t == 'float'
+            if value == 0 and op in ('ADD', 'SUB') and keeps_type:
+                return x
+            if value == 1 and op in ('MUL', 'POW') and keeps_type:
+                return x
+            if value == 1 and op == 'DIV' and t == 'float':
+                return x
+            if value == 0 and op == 'MUL' and t == 'int' and isinstance(value, int) and self.pure(x):
+                return c
+        return None
+
+    def fold(self, statements):
+        folded = []
+        for statement in statements:
+            if statement[0] == 'DEF':
+                # the parameters hide the variables of the same name
+                (DEF, name, parameters, body) = statement
+                self.parameters = set(parameters)
+                (body, eliminated) = rebuild(body, self.simplify)
+                statement = ('DEF', name, parameters, body)
+                self.parameters = set()
+            else:
+                (statement, eliminated) = rebuild(statement, self.simplify)
+            self.eliminated += eliminated
+            folded.append(statement)
+        return folded
+
+# an integer power whose result is of a reasonable size
+def small_power(a, b):
+    if isinstance(a, int) and isinstance(b, int) and abs(a) > 1:
+        return abs(b) * math.log2(abs(a)) < 4096
+    return True
+
+def fold_basic(statements):
+    folder = BasicFolder(statements)
+    statements = folder.fold(statements)
+    return (statements, folder.eliminated)
@@ -0,0 +1,117 @@
+import sys
+
+# Hash-consing of vintage_fe and parser_1 trees.
+#
+# A NodeFactory keeps one copy of each distinct subtree: intern(tree)
+# returns the tree with every tuple and list that is equal to one seen
+# before replaced by that one, so trees from many programs share their
+# common subroutines, expressions and constants (like the zero CONST of
+# every element of an array declared without an initializer).  The trees
+# are interned bottom up without recursion, so a node is looked up by its
+# kind and the identity of its already interned children, in constant
+# time.  Numbers are told apart by type, and floats by their bits, so 1,
+# 1.0, True and -0.0 stay what they were.
+#
+# Interned trees are shared and must not be changed in place.  The rewrite
+# passes (fold, optimize, symbols) build new nodes, so they are safe.
+#
+# The table is weak-valued: collect() drops every entry no tree outside
+# the table still uses.  Tuples cannot be weakly referenced, so this is
+# done by reference count rather than with weakref; entries are visited
+# newest first, so a node goes in the same pass as the parents that kept
+# it alive.  Both parsers take an optional factory (Parser(lexer,
+# factory), vintage_fe.parse(stream, factory=factory)); stats() gives the
+# number of nodes interned, how many were shared, and the bytes saved.
+
+class NodeFactory:
+    def __init__(self):
+        # key -> the one tuple or list with that structure
+        self.table = {}
+        self.nodes = 0
+        self.shared = 0
+        self.bytes_saved = 0
+
+    # the key of a node whose children are interned
+    def key(self, node):
+        parts = [type(node)]
+        for child in node:
+            kind = type(child)
+            if kind is str:
+                parts.append(child)
+            elif kind is tuple or kind is list:
+                parts.append(id(child))
+            elif kind is float:
+                parts.append((float, child.hex()))
+            else:
+                parts.append((kind, child))
+        return tuple(parts)
+
+    # the interned copy of a node whose children are interned
+    def node(self, node):
+        self.nodes += 1
+        key = self.key(node)
+        found = self.table.get(key)
+        if found is None:
+            self.table[key] = node
+            return node
+        if found is not node:
+            self.shared += 1
+            self.bytes_saved += sys.getsizeof(node)
+        return found
+
+    # the tree with its tuples and lists interned.  Each frame is a node,
+    # the index of its next child and its children so far
+    def intern(self, tree):
+        if not isinstance(tree, (tuple, list)):
+            return tree
+        stack = [[tree, 0, []]]
+        while True:
+            frame = stack[-1]
+            (node, index, children) = frame
+            while index < len(node):
+                child = node[index]
+                index += 1
+                if isinstance(child, (tuple, list)):
+                    break
+                children.append(child)
+            else:
+                stack.pop()
+                for (new, old) in zip(children, node):
+                    if new is not old:
+                        node = tuple(children) if isinstance(node, tuple) else children
+                        break
+                node = self.node(node)
+                if not stack:
+                    return node
+                stack[-1][2].append(node)
+                continue
+            frame[1] = index
+            stack.append([child, 0, []])
+
+    def references(self, table, key):
+        node = table[key]
+        return sys.getrefcount(node)
+
+    # drop the nodes only the table holds; returns how many
+    def collect(self):
+        # the count of a node nothing else holds, taken the same way from
+        # a probe, as it depends on the Python version
+        probe = {None: tuple([None])}
+        unused = self.references(probe, None)
+        dropped = 0
+        for key in reversed(list(self.table)):
+            if self.references(self.table, key) <= unused:
+                del self.table[key]
+                dropped += 1
+        return dropped
+
+    def stats(self):
+        return {
+            'nodes': self.nodes,
+            'shared': self.shared,
+            'unique': len(self.table),
+            'bytes_saved': self.bytes_saved,
+        }
+
+    def __str__(self):
+        return '%(nodes)d nodes, %(shared)d shared, %(unique)d unique, %(bytes_saved)d bytes saved' % self.stats()
@@ -0,0 +1,267 @@
+import re
+from bisect import bisect_right
+
+from lexer import Lexer, Token
+from parser_1 import Diagnostic, Parser, ProgramIndex
+
+# Incremental lexing and parsing for editors.
+#
+# A line is the text up to and including a ';' EOL (the last line may have
+# no EOL).  The buffer is kept as segments of whole lines, each lexed and
+# parsed on its own, so line numbers come from the segment's position and
+# columns are relative to the start of their line.  The parser does not see
+# EOLs, so a statement can run on past one: the body of a FOR, the
+# statement after THEN, an expression continued on the next line.  A
+# segment is therefore grown, a line at a time, until a full parse would
+# start a statement at the first token after it; that is decided by parsing
+# the segment with that one token after it, its follow.  A line with no
+# tokens stays with the segment before it.  An edit re-lexes and re-parses
+# only the segments it touches, and the one before them when the token that
+# follows it changes.  Every other segment, with its token buffer,
+# statements and diagnostics, is reused as is.
+
+# Only strings and EOLs matter for finding line boundaries.  Both are
+# matched exactly as the master scanner matches them, and no other token
+# can contain a '"' or a ';'.
+BOUNDARY = re.compile(r'"[^"]*"|;')
+
+# A run of lines, with its tokens, statements and diagnostics.  follow is
+# the first token of the line after the segment, as lexed on its own line,
+# or None at the end of the buffer.
+class Segment:
+    def __init__(self, text, lexer_class, follow=None):
+        self.text = text
+        lexer = lexer_class(text)
+        self.tokens = lexer.get_tokens()
+        # the EOLs in the segment: the line after it, counted from its start
+        self.lines = lexer.line_num - 1
+        self.follow = follow
+        tokens = self.tokens
+        if follow is not None:
+            tokens = _Followed(tokens, Token(follow.kind, follow.value, lexer.line_num, follow.column))
+        parser = Parser(_SegmentLexer(tokens))
+        # statements starting in the segment, each with the (line, column)
+        # it starts at; a statement may run on into the follow
+        self.statements = []
+        self.positions = []
+        end = len(self.tokens)
+        while parser.current_token_index < end:
+            start = parser.current_token_index
+            parser.failure = None
+            statement = parser.parse_statement()
+            if statement is None and parser.failure is None:
+                parser.fail('a statement')
+            if parser.failure is None:
+                token = tokens[start]
+                self.statements.append(statement)
+                self.positions.append((token.line_num, token.column))
+            else:
+                parser.errors.append(parser.failure)
+                parser.synchronise(max(start + 1, parser.failure_index))
+        # Diagnostic for each statement that failed to parse, with line
+        # numbers counted from the segment's start
+        self.errors = parser.errors
+        # whether a full parse starts a statement at the follow
+        self.closed = parser.current_token_index == end
+        # set if the line has a '"' that does not start a string; such a
+        # quote is the last one in the buffer, and a later '"' closes it
+        strings = 0
+        for mo in BOUNDARY.finditer(text):
+            if mo.group() != ';':
+                strings += 1
+        self.open_quote = text.count('"') - 2 * strings
+
+class _SegmentLexer:
+    def __init__(self, tokens):
+        self.tokens = tokens
+
+    def get_tokens(self):
+        return self.tokens
+
+# a segment's tokens with its follow after them
+class _Followed:
+    def __init__(self, tokens, follow):
+        self.tokens = tokens
+        self.follow = follow
+
+    def __len__(self):
+        return len(self.tokens) + 1
+
+    def __getitem__(self, index):
+        if index == len(self.tokens):
+            return self.follow
+        return self.tokens[index]
+
+def same_token(a, b):
+    if a is None or b is None:
+        return a is b
+    return (a.kind, a.value, a.column) == (b.kind, b.value, b.column)
+
+# What an edit cost: how much was reused and how much was redone
+class EditStats:
+    def __init__(self, tokens_reused, statements_reused, tokens_relexed,
+                 statements_reparsed, segments_relexed):
+        self.tokens_reused = tokens_reused
+        self.statements_reused = statements_reused
+        self.tokens_relexed = tokens_relexed
+        self.statements_reparsed = statements_reparsed
+        self.segments_relexed = segments_relexed
+
+    def __str__(self):
+        return ('EditStats(tokens reused %d, statements reused %d, '
+                'tokens relexed %d, statements reparsed %d, segments relexed %d)'
+                % (self.tokens_reused, self.statements_reused, self.tokens_relexed,
+                   self.statements_reparsed, self.segments_relexed))
+
+class Document:
+    def __init__(self, text='', lexer_class=Lexer):
+        self.lexer_class = lexer_class
+        self.segments = []
+        self.starts = []
+        self.length = 0
+        self.token_count = 0
+        self.statement_count = 0
+        self.replace(0, 0, self.split(text))
+
+    @property
+    def text(self):
+        return ''.join(segment.text for segment in self.segments)
+
+    def statements(self):
+        return [s for segment in self.segments for s in segment.statements]
+
+    # tokens of the whole buffer, with line numbers and columns as a full
+    # lex of the text would give them
+    def tokens(self):
+        line = 0
+        for segment in self.segments:
+            for token in segment.tokens:
+                yield Token(token.kind, token.value, line + token.line_num, token.column)
+            line += segment.lines
+
+    # the diagnostics a full parse of the buffer gives, in its order: each
+    # statement that failed to parse, then each line named that no
+    # statement starts on
+    def errors(self):
+        errors = []
+        index = ProgramIndex()
+        line = 0
+        for segment in self.segments:
+            for error in segment.errors:
+                errors.append(Diagnostic(error.message, line + error.line_num, error.column))
+            for (statement, (line_num, column)) in zip(segment.statements, segment.positions):
+                index.add(statement, line + line_num, column)
+            line += segment.lines
+        for (target, line_num, column) in index.undefined():
+            errors.append(Diagnostic('undefined line %s' % target, line_num, column))
+        return errors
+
+    # the first token of text's first line, as lexed on its own, or None
+    # when that line has none
+    def head(self, text):
+        for token in self.lexer_class.iter_tokens(text):
+            return token if token.line_num == 1 else None
+        return None
+
+    # text as segments, the last one followed by follow
+    def split(self, text, follow=None):
+        lines = []
+        start = 0
+        for mo in BOUNDARY.finditer(text):
+            if mo.group() == ';':
+                lines.append(text[start:mo.end()])
+                start = mo.end()
+        if start < len(text) or not lines:
+            lines.append(text[start:])
+        # the token following lines[:i + 1]
+        follows = [self.head(line) for line in lines[1:]] + [follow]
+        segments = []
+        first = 0
+        while first < len(lines):
+            last = first
+            while True:
+                while last + 1 < len(lines) and follows[last] is None:
+                    last += 1
+                segment = Segment(''.join(lines[first:last + 1]), self.lexer_class, follows[last])
+                if segment.closed or last + 1 == len(lines):
+                    break
+                last += 1
+            segments.append(segment)
+            first = last + 1
+        return segments
+
+    # swap segments[first:last] for new ones and bring the offsets and the
+    # running totals up to date
+    def replace(self, first, last, segments):
+        for segment in self.segments[first:last]:
+            self.token_count -= len(segment.tokens)
+            self.statement_count -= len(segment.statements)
+        for segment in segments:
+            self.token_count += len(segment.tokens)
+            self.statement_count += len(segment.statements)
+        self.segments[first:last] = segments
+        del self.starts[first:]
+        offset = self.starts[-1] + len(self.segments[first - 1].text) if first else 0
+        for segment in self.segments[first:]:
+            self.starts.append(offset)
+            offset += len(segment.text)
+        self.length = offset
+
+    def segment_at(self, offset):
+        return max(bisect_right(self.starts, offset) - 1, 0)
+
+    # Replace `deleted` characters at `offset` with `inserted`.  The touched
+    # segments are relexed, growing the region until it ends on an EOL that
+    # existed before, after a statement that does not run on past it, with
+    # no unmatched quote that a later line closes; and until it starts with
+    # the token the segment before it was parsed against.
+    def edit(self, offset, deleted, inserted):
+        end = offset + deleted
+        if offset < 0 or deleted < 0 or end > self.length:
+            raise ValueError("edit out of range: offset {} length {}".format(offset, deleted))
+        first = self.segment_at(offset)
+        last = self.segment_at(max(end - 1, offset))
+        if '"' in inserted:
+            # an inserted quote closes an earlier unmatched one
+            for i in range(first):
+                if self.segments[i].open_quote:
+                    first = i
+                    break
+        region = ''.join(segment.text for segment in self.segments[first:last + 1])
+        region = (region[:offset - self.starts[first]] + inserted
+                  + region[end - self.starts[first]:])
+        while True:
+            follow = None
+            if last + 1 < len(self.segments):
+                follow = self.head(self.segments[last + 1].text)
+            segments = self.split(region, follow)
+            target = last
+            if not segments[-1].text.endswith(';') or not segments[-1].closed:
+                target = last + 1
+            if any(segment.open_quote for segment in segments):
+                # relex up to the next quote, which now closes a string
+                for j in range(last + 1, len(self.segments)):
+                    if '"' in self.segments[j].text:
+                        target = max(target, j)
+                        break
+            target = min(target, len(self.segments) - 1)
+            before = first
+            if first and not same_token(self.segments[first - 1].follow, self.head(region)):
+                before = first - 1
+            if target == last and before == first:
+                break
+            region = (''.join(segment.text for segment in self.segments[before:first]) + region
+                      + ''.join(segment.text for segment in self.segments[last + 1:target + 1]))
+            (first, last) = (before, target)
+        old_tokens = self.token_count
+        old_statements = self.statement_count
+        for segment in self.segments[first:last + 1]:
+            old_tokens -= len(segment.tokens)
+            old_statements -= len(segment.statements)
+        self.replace(first, last + 1, segments)
+        if len(self.segments) > 1 and not self.segments[-1].text:
+            self.replace(len(self.segments) - 1, len(self.segments), [])
+        return EditStats(old_tokens, old_statements,
+                         sum(len(s.tokens) for s in segments),
+                         sum(len(s.statements) for s in segments),
+                         len(segments))
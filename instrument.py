@@ -0,0 +1,192 @@
+import json
+import sys
+import time
+from contextlib import contextmanager
+from functools import wraps
+from types import FunctionType
+
+# Phase and rule timings for the front ends.
+#
+# A Profiler times phases (with profiler.phase('lex'): ...), keeps counts
+# (tokens, statements) to give rates with, and, while it is instrumenting,
+# counts the calls and cumulative time of every vintage_fe rule function
+# (the functions taking the token stream) and every parser_1.Parser
+# parse_* method.  Instrumenting replaces those functions, in their module
+# or class and in the dispatch tables that refer to them, with wrappers,
+# and restore() puts the originals back; nothing is wrapped otherwise, so
+# when no Profiler is instrumenting the parsers run as they always do.
+# The time of a rule counts each outermost call once, so a recursive rule
+# is not counted again for its inner calls.
+#
+#     with Profiler() as profiler:
+#         profile_vintage(text, profiler)
+#     print(profiler)
+#     profiler.save('stats.json')
+#
+# vintage_iter keeps its own references to the vintage_fe functions and is
+# not instrumented.
+
+class Profiler:
+    def __init__(self):
+        # phase -> seconds, in the order the phases first ran
+        self.phases = {}
+        # what was counted -> how many
+        self.counts = {}
+        # rule -> [calls, cumulative seconds, calls active now]
+        self.rules = {}
+        # (namespace, key, original) for each replacement, to restore
+        self.patched = []
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - start
+
+    def count(self, name, number):
+        self.counts[name] = self.counts.get(name, 0) + number
+
+    # what counted per second of phase
+    def rate(self, name, phase):
+        seconds = self.phases.get(phase)
+        if not seconds or name not in self.counts:
+            return None
+        return self.counts[name] / seconds
+
+    def wrap(self, name, function):
+        stats = self.rules.setdefault(name, [0, 0.0, 0])
+        clock = time.perf_counter
+
+        @wraps(function)
+        def rule(*args, **kwargs):
+            stats[0] += 1
+            stats[2] += 1
+            start = clock()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                stats[2] -= 1
+                if not stats[2]:
+                    stats[1] += clock() - start
+        return rule
+
+    # replace the functions of namespace (a module or class) that select
+    # picks, and their entries in the dicts and lists it holds
+    def patch(self, namespace, prefix, select):
+        wrappers = {}
+        for (name, value) in list(vars(namespace).items()):
+            if isinstance(value, FunctionType) and select(name, value):
+                wrappers[value] = self.wrap(prefix + name, value)
+                self.patched.append((namespace, name, value))
+                setattr(namespace, name, wrappers[value])
+        for value in list(vars(namespace).values()):
+            if isinstance(value, dict):
+                entries = value.items()
+            elif isinstance(value, list):
+                entries = enumerate(value)
+            else:
+                continue
+            for (key, entry) in list(entries):
+                if isinstance(entry, FunctionType) and entry in wrappers:
+                    self.patched.append((value, key, entry))
+                    value[key] = wrappers[entry]
+
+    def instrument(self):
+        if self.patched:
+            return
+        import parser_1
+        import vintage_fe
+        self.patch(vintage_fe, 'vintage_fe.',
+                   lambda name, function: function.__code__.co_varnames[:1] == ('stream',))
+        self.patch(parser_1.Parser, 'parser_1.Parser.',
+                   lambda name, function: name.startswith('parse_'))
+
+    def restore(self):
+        while self.patched:
+            (namespace, key, original) = self.patched.pop()
+            if isinstance(namespace, (dict, list)):
+                namespace[key] = original
+            else:
+                setattr(namespace, key, original)
+
+    def __enter__(self):
+        self.instrument()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.restore()
+
+    def to_dict(self):
+        rates = {}
+        for (name, phase) in (('tokens', 'lex'), ('statements', 'parse')):
+            rate = self.rate(name, phase)
+            if rate is not None:
+                rates[name + '_per_second'] = rate
+        return {
+            'phases': dict(self.phases),
+            'counts': dict(self.counts),
+            'rates': rates,
+            'rules': {name: {'calls': calls, 'seconds': seconds}
+                      for (name, (calls, seconds, active)) in self.rules.items() if calls},
+        }
+
+    def to_json(self, indent=None):
+        return json.dumps(self.to_dict(), indent=indent)
+
+    def save(self, path):
+        with open(path, 'w') as file:
+            json.dump(self.to_dict(), file, indent=2)
+            file.write('\n')
+
+    def __str__(self):
+        stats = self.to_dict()
+        lines = ['%-44s %10s' % ('phase', 'ms')]
+        for (phase, seconds) in stats['phases'].items():
+            lines.append('%-44s %10.3f' % (phase, seconds * 1e3))
+        for (name, number) in stats['counts'].items():
+            lines.append('%-44s %10d' % (name, number))
+        for (name, rate) in stats['rates'].items():
+            lines.append('%-44s %10.0f' % (name.replace('_', ' '), rate))
+        rules = sorted(stats['rules'].items(), key=lambda item: -item[1]['seconds'])
+        if rules:
+            lines.append('%-44s %10s %10s' % ('rule', 'calls', 'ms'))
+            for (name, rule) in rules:
+                lines.append('%-44s %10d %10.3f' % (name, rule['calls'], rule['seconds'] * 1e3))
+        return '\n'.join(lines)
+
+# Lex, parse and dump vintage_fe source in phases, the tokens listed first
+# so lexing is timed on its own.  The tree is dumped in format to file
+# (stdout by default), or not at all when format is None; returns it
+def profile_vintage(text, profiler, format='tree', file=None):
+    import vintage_fe
+    from lexer import TokenList, VintageLexer
+    with profiler.phase('lex'):
+        tokens = TokenList(VintageLexer.iter_tokens(text))
+    profiler.count('tokens', len(tokens.tokens))
+    with profiler.phase('parse'):
+        tree = vintage_fe.parse_tokens(tokens)
+    profiler.count('statements', len(tree[1]))
+    if format is not None:
+        from dumpast import dump
+        with profiler.phase('dump'):
+            dump(tree, file or sys.stdout, format)
+    return tree
+
+# the same for BASIC source and parser_1; returns the parser
+def profile_basic(text, profiler, format=None, file=None):
+    from lexer import Lexer, TokenList
+    from parser_1 import Parser
+    with profiler.phase('lex'):
+        tokens = TokenList(Lexer.iter_tokens(text))
+    profiler.count('tokens', len(tokens.tokens))
+    with profiler.phase('parse'):
+        parser = Parser(tokens)
+        parser.parse()
+    profiler.count('statements', len(parser.statements))
+    if format is not None:
+        from dumpast import dump
+        with profiler.phase('dump'):
+            dump(parser.statements, file or sys.stdout, format)
+    return parser
@@ -1,4 +1,40 @@
+import mmap
+import os
 import re
+from array import array
+from itertools import chain
+
+# Build the master scanner for a token table.  Keywords (the lowercase
+# literal entries) are folded into a single WORD rule and resolved with a
+# dict lookup afterwards, instead of being tried one alternative at a time.
+# With binary=True everything is compiled for scanning bytes instead.
+def compile_scanner(token_types, binary=False, word=r'[a-z]+'):
+    keywords = {}
+    rules = [('WORD', word)]
+    for (kind, pattern) in token_types:
+        if re.fullmatch(r'[a-z]+', pattern):
+            keywords[pattern] = kind
+        else:
+            rules.append((kind, pattern))
+    scanner = '|'.join('(?P<%s>%s)' % pair for pair in rules)
+    # a lowercase word that is not a keyword is split into keyword prefixes
+    # exactly like the old alternation did (everything else is skipped)
+    keyword_scanner = '|'.join('(?P<%s>%s)' % (kind, pattern)
+                               for (pattern, kind) in keywords.items())
+    if binary:
+        keywords = {pattern.encode('ascii'): kind for (pattern, kind) in keywords.items()}
+        scanner = scanner.encode('ascii')
+        keyword_scanner = keyword_scanner.encode('ascii')
+    return keywords, re.compile(scanner), re.compile(keyword_scanner)
+
+# The scanner with the whitespace before a token taken into its match, so
+# that spaces are not matches of their own; the token is then the span of
+# the group lastgroup names, not the whole match
+def spaced_scanner(token_types, scanner):
+    space = dict(token_types)['SPACE']
+    if isinstance(scanner.pattern, bytes):
+        return re.compile(b'(?:%s)?(?:%s)' % (space.encode('ascii'), scanner.pattern))
+    return re.compile('(?:%s)?(?:%s)' % (space, scanner.pattern))
 
 class Lexer:
     # List of token types
@@ -27,6 +63,9 @@ class Lexer:
         ('RESTORE',   r'restore'),
         ('RETURN',    r'return'),
         ('STOP',      r'stop'),
+        ('AND',       r'and'),
+        ('OR',        r'or'),
+        ('NOT',       r'not'),
         ('NUMBER', r'([0-9]*[.])?[0-9]+'),  # for INTEGER and FLOAT see below
         ('STRING', r'\"[^\"]*\"'),
         ('ADD', r'\+'),             # plus sign
@@ -42,40 +81,584 @@ class Lexer:
         ('GREQ',   r'=>'),
         ('LPAREN', r'\('),           # left parenthesis
         ('RPAREN', r'\)'),           # right parenthesis
+        ('COMMA', r','),             # argument separator
         ('ID', r'[A-Z][A-Z0-9]*'),   # identifier
         ('FUNC', r'[A-Z]+\('),       # function
         ('EOL', r';'),               # end of line
         ('SPACE', r'\s+')            # whitespace
     ]
 
+    # compiled once per class, shared by every instance
+    KEYWORDS, SCANNER, KEYWORD_SCANNER = compile_scanner(TOKEN_TYPES)
+    # the scanners the lexers use
+    SPACED_SCANNER = spaced_scanner(TOKEN_TYPES, SCANNER)
+    # small-int codes for the token kinds, as stored in a TokenBuffer
+    KIND_NAMES = [kind for (kind, pattern) in TOKEN_TYPES]
+    KIND_CODES = {kind: code for (code, kind) in enumerate(KIND_NAMES)}
+
+    # the same scanner over bytes, for Lexer.from_path()
+    BYTES_KEYWORDS, BYTES_SCANNER, BYTES_KEYWORD_SCANNER = compile_scanner(TOKEN_TYPES, binary=True)
+    BYTES_SPACED_SCANNER = spaced_scanner(TOKEN_TYPES, BYTES_SCANNER)
+    # token kinds that are skipped, and kind -> conversion of the text of
+    # the tokens iter_tokens() yields
+    SKIP = ('SPACE',)
+    VALUES = {}
+    # the kind of a word that is not a keyword, or None when split() tells
+    WORD_KIND = None
+
+    # the token that ends a line, which nothing but a string can contain,
+    # so the source can be split after one outside a string; None when
+    # there is no such token
+    BOUNDARY = ';'
+
     def __init__(self, input_string):
-        # Create a regular expression to match all valid tokens
-        token_regex = '|'.join('(?P<%s>%s)' % pair for pair in self.TOKEN_TYPES)
-        self.line_num = 1
-        self.line_start = 0
-        self.tokens = []
-        for mo in re.finditer(token_regex, input_string):
+        self.scan(TokenBuffer(input_string, self.KIND_NAMES),
+                  self.SPACED_SCANNER, self.KEYWORDS, self.KEYWORD_SCANNER)
+
+    # Lex a string in worker processes, giving the same tokens as
+    # cls(text).  The text is split after BOUNDARY tokens outside strings
+    # into a few pieces per worker; each piece is lexed on its own, and its
+    # offsets and line numbers are moved by where it starts and the lines
+    # before it.  executor is a concurrent.futures executor to use, so a
+    # warm pool can be kept; otherwise a pool of jobs processes is started
+    # for the call.  jobs is one per core by default, and text is cut in
+    # pieces of at least min_chunk, so short text is lexed here.
+    @classmethod
+    def parallel(cls, text, jobs=None, executor=None, min_chunk=65536):
+        jobs = jobs or os.cpu_count() or 1
+        pieces = min(4 * jobs, len(text) // min_chunk)
+        if pieces < 2 or cls.BOUNDARY is None:
+            return cls(text)
+        points = cls.split_points(text, pieces)
+        chunks = [text[start:end] for (start, end) in zip(points, points[1:])]
+        if executor is None:
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(jobs) as executor:
+                results = list(executor.map(lex_chunk, [cls] * len(chunks), chunks))
+        else:
+            results = list(executor.map(lex_chunk, [cls] * len(chunks), chunks))
+        lexer = cls.__new__(cls)
+        lexer.tokens = tokens = TokenBuffer(text, cls.KIND_NAMES)
+        lines_before = 0
+        for (start, (kinds, starts, ends, lines, line_starts)) in zip(points, results):
+            tokens.kinds.extend(kinds)
+            if start:
+                tokens.starts.extend(map(start.__add__, starts))
+                tokens.ends.extend(map(start.__add__, ends))
+                tokens.line_starts.extend(map(start.__add__, line_starts[1:]))
+            else:
+                tokens.starts.extend(starts)
+                tokens.ends.extend(ends)
+                tokens.line_starts.extend(line_starts[1:])
+            if lines_before:
+                tokens.lines.extend(map(lines_before.__add__, lines))
+            else:
+                tokens.lines.extend(lines)
+            lines_before += len(line_starts) - 1
+        lexer.line_num = lines_before + 1
+        lexer.line_start = tokens.line_starts[-1]
+        return lexer
+
+    # Offsets splitting text into at most pieces parts of about the same
+    # size, from 0 to len(text), each but the last ending just after a
+    # BOUNDARY outside a string.  Strings are the text between a quote and
+    # the next one, so a boundary is outside them when an even number of
+    # quotes comes before it; after a quote with no closing one the rest
+    # is not split.
+    @classmethod
+    def split_points(cls, text, pieces):
+        points = [0]
+        # the quotes in text[:counted]
+        quotes = 0
+        counted = 0
+        for piece in range(1, pieces):
+            at = max(len(text) * piece // pieces, points[-1])
+            while True:
+                boundary = text.find(cls.BOUNDARY, at)
+                if boundary == -1:
+                    break
+                quotes += text.count('"', counted, boundary)
+                counted = boundary
+                if quotes % 2 == 0:
+                    break
+                # inside a string: look again after its closing quote
+                close = text.find('"', boundary)
+                if close == -1:
+                    boundary = -1
+                    break
+                quotes += text.count('"', counted, close + 1)
+                counted = at = close + 1
+            if boundary == -1 or boundary + 1 >= len(text):
+                break
+            points.append(boundary + 1)
+        points.append(len(text))
+        return points
+
+    # Lex a file without reading it into a string: the file is mmap'ed and
+    # scanned with the bytes scanner.  Tokens only hold offsets into the
+    # mapping and values are decoded when asked for; columns are counted
+    # in bytes.
+    @classmethod
+    def from_path(cls, path):
+        with open(path, 'rb') as f:
+            try:
+                source = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # an empty file cannot be mapped
+                source = b''
+        lexer = cls.__new__(cls)
+        lexer.scan(BytesTokenBuffer(source, cls.KIND_NAMES),
+                   cls.BYTES_SPACED_SCANNER, cls.BYTES_KEYWORDS, cls.BYTES_KEYWORD_SCANNER)
+        return lexer
+
+    # scanner is a spaced_scanner(); the token arrays are appended to
+    # directly, and the line kept in locals, as this runs once per token
+    def scan(self, tokens, scanner, keywords, keyword_scanner):
+        self.tokens = tokens
+        source = tokens.source
+        codes = self.KIND_CODES
+        skip = self.SKIP
+        kinds = tokens.kinds.append
+        starts = tokens.starts.append
+        ends = tokens.ends.append
+        lines = tokens.lines.append
+        line_starts = tokens.line_starts.append
+        line_num = 1
+        line_start = 0
+        for mo in scanner.finditer(source):
             kind = mo.lastgroup
-            value = mo.group()
+            if kind in skip:
+                continue
             if kind == 'EOL':
-                self.line_start = mo.end()
-                self.line_num += 1
-            elif kind == 'SPACE':
-                pass
-            else:
-                column = mo.start() - self.line_start
-                self.tokens.append(Token(kind, value, self.line_num, column))
+                line_start = mo.end()
+                line_num += 1
+                line_starts(line_start)
+                continue
+            (start, end) = mo.span(kind)
+            if kind == 'WORD':
+                kind = keywords.get(source[start:end])
+                if kind is None:
+                    self.line_num = line_num
+                    self.split_word(keyword_scanner, source[start:end], start)
+                    continue
+            kinds(codes[kind])
+            starts(start)
+            ends(end)
+            lines(line_num)
+        self.line_num = line_num
+        self.line_start = line_start
+
+    def split_word(self, keyword_scanner, word, start):
+        for (kind, value, offset) in self.split(keyword_scanner, word):
+            self.tokens.append(self.KIND_CODES[kind],
+                               start + offset, start + offset + len(value), self.line_num)
+
+    # the tokens a word that is not a keyword stands for, as (kind, value,
+    # offset in the word): the keywords it starts with, as the old
+    # alternation scanned it
+    @classmethod
+    def split(cls, keyword_scanner, word):
+        for mo in keyword_scanner.finditer(word):
+            yield (mo.lastgroup, mo.group(), mo.start())
     
     def get_tokens(self):
         return self.tokens
 
+    # Lex a string lazily, yielding Token objects one at a time, for a
+    # TokenList or a TokenStream
+    @classmethod
+    def iter_tokens(cls, text):
+        keywords = cls.KEYWORDS
+        skip = cls.SKIP
+        values = cls.VALUES
+        word_kind = cls.WORD_KIND
+        line_num = 1
+        line_start = 0
+        for mo in cls.SPACED_SCANNER.finditer(text):
+            kind = mo.lastgroup
+            if kind in skip:
+                continue
+            if kind == 'EOL':
+                line_start = mo.end()
+                line_num += 1
+                continue
+            (start, end) = mo.span(kind)
+            value = text[start:end]
+            column = start - line_start
+            if kind == 'WORD':
+                kind = keywords.get(value, word_kind)
+                if kind is None:
+                    for (kind, part, offset) in cls.split(cls.KEYWORD_SCANNER, value):
+                        yield Token(kind, part, line_num, column + offset)
+                    continue
+            if kind in values:
+                value = values[kind](value)
+            yield Token(kind, value, line_num, column)
+
+    # Lex a file object chunk by chunk, yielding Token objects as soon as
+    # they are complete.  The last match of a chunk (it may continue in the
+    # next one) and anything from an unmatched quote on (it may open a
+    # string that closes later) are carried over and scanned again.
+    @classmethod
+    def iter_file(cls, file, chunk_size=65536):
+        keywords = cls.KEYWORDS
+        values = cls.VALUES
+        line_num = 1
+        line_start = 0
+        base = 0
+        buf = ''
+        eof = False
+        while not eof:
+            chunk = file.read(chunk_size)
+            eof = not chunk
+            buf += chunk
+            # a match is only handled once the next one shows it is complete;
+            # at end of input a final None flushes the last one
+            matches = cls.SCANNER.finditer(buf)
+            if eof:
+                matches = chain(matches, [None])
+            held = None
+            # the first quote not inside a match handled so far
+            quote = buf.find('"')
+            for mo in matches:
+                if not eof and 0 <= quote < mo.start():
+                    break
+                if mo is not None and 0 <= quote < mo.end():
+                    quote = buf.find('"', mo.end())
+                if held is not None:
+                    kind = held.lastgroup
+                    if kind == 'EOL':
+                        line_start = base + held.end()
+                        line_num += 1
+                    elif kind not in cls.SKIP:
+                        value = held.group()
+                        column = base + held.start() - line_start
+                        if kind == 'WORD':
+                            kind = keywords.get(value)
+                        if kind is not None:
+                            if kind in values:
+                                value = values[kind](value)
+                            yield Token(kind, value, line_num, column)
+                        else:
+                            for (kind, part, offset) in cls.split(cls.KEYWORD_SCANNER, value):
+                                yield Token(kind, part, line_num, column + offset)
+                held = mo
+            if not eof:
+                restart = held.start() if held is not None else 0
+                base += restart
+                buf = buf[restart:]
+
+# lex one piece of Lexer.parallel() in a worker: its TokenBuffer arrays,
+# with offsets and line numbers counted from the start of the piece
+def lex_chunk(lexer_class, text):
+    tokens = lexer_class(text).tokens
+    return (tokens.kinds, tokens.starts, tokens.ends, tokens.lines, tokens.line_starts)
+
+# The lexer for the cuppa5 dialect vintage_fe parses.  Words are
+# identifiers unless they are keywords, newlines end lines, // starts a
+# comment, and iter_tokens() gives INTEGER and FLOAT tokens their number
+# and STRING tokens their text without the quotes as value.
+class VintageLexer(Lexer):
+    TOKEN_TYPES = [
+        ('INTEGER_TYPE', r'int'),
+        ('FLOAT_TYPE', r'float'),
+        ('STRING_TYPE', r'string'),
+        ('VOID_TYPE', r'void'),
+        ('WHILE', r'while'),
+        ('IF', r'if'),
+        ('ELSE', r'else'),
+        ('RETURN', r'return'),
+        ('PUT', r'put'),
+        ('GET', r'get'),
+        ('NOT', r'not'),
+        ('FLOAT', r'[0-9]*\.[0-9]+'),
+        ('INTEGER', r'[0-9]+'),
+        ('STRING', r'\"[^\"]*\"'),
+        ('COMMENT', r'//.*'),
+        ('LE', r'=<'),
+        ('EQ', r'=='),
+        ('ASSIGN', r'='),
+        ('PLUS', r'\+'),
+        ('MINUS', r'-'),
+        ('MUL', r'\*'),
+        ('DIV', r'/'),
+        ('LPAREN', r'\('),
+        ('RPAREN', r'\)'),
+        ('LCURLY', r'\{'),
+        ('RCURLY', r'\}'),
+        ('LSQUARE', r'\['),
+        ('RSQUARE', r'\]'),
+        ('SEMI', r';'),
+        ('COMMA', r','),
+        ('ID', r'[a-zA-Z_][a-zA-Z0-9_]*'),
+        ('EOL', r'\n'),
+        ('SPACE', r'[ \t\r]+'),
+    ]
+    WORD = r'[a-zA-Z_][a-zA-Z0-9_]*'
+    KEYWORDS, SCANNER, KEYWORD_SCANNER = compile_scanner(TOKEN_TYPES, word=WORD)
+    SPACED_SCANNER = spaced_scanner(TOKEN_TYPES, SCANNER)
+    KIND_NAMES = [kind for (kind, pattern) in TOKEN_TYPES]
+    KIND_CODES = {kind: code for (code, kind) in enumerate(KIND_NAMES)}
+    BYTES_KEYWORDS, BYTES_SCANNER, BYTES_KEYWORD_SCANNER = compile_scanner(TOKEN_TYPES, binary=True, word=WORD)
+    BYTES_SPACED_SCANNER = spaced_scanner(TOKEN_TYPES, BYTES_SCANNER)
+    SKIP = ('SPACE', 'COMMENT')
+    # a comment can hold a quote, so quotes do not tell where strings are
+    BOUNDARY = None
+    VALUES = {
+        'INTEGER': int,
+        'FLOAT': float,
+        'STRING': lambda text: text[1:-1],
+    }
+
+    WORD_KIND = 'ID'
+
+    @classmethod
+    def split(cls, keyword_scanner, word):
+        yield ('ID', word, 0)
+
+# Lexer over a file object that hands out a TokenStream instead of a
+# materialised token list, for use with Parser.iter_statements()
+class StreamingLexer:
+    def __init__(self, file, chunk_size=65536, lexer_class=Lexer):
+        self.tokens = TokenStream(lexer_class.iter_file(file, chunk_size))
+
+    def get_tokens(self):
+        return self.tokens
+
+# Lookahead ring buffer over a token iterator, shared by both front ends.
+# Tokens are pulled from the iterator only when they are asked for, so
+# the whole token list is never built.
+#
+# vintage_fe reads it with pointer(), match() and end_of_file(): the
+# current token, which past the last one is an EOF token, so no caller
+# checks bounds.  parser_1 indexes it like a list and calls release() with
+# the first index it still needs once a statement is parsed.  The ring
+# holds the tokens from there on, and doubles when a statement is longer
+# than it.  len() is only exact up to one past the highest index read so
+# far, which is all the parser ever asks for.  get_tokens() returns the
+# stream itself, so Parser(TokenStream(Lexer.iter_tokens(text))) works.
+class TokenStream:
+    def __init__(self, tokens, size=16):
+        self.iterator = iter(tokens)
+        # size is a power of two; token i is at ring[i & mask]
+        self.ring = [None] * size
+        self.mask = size - 1
+        # the first token held, the number pulled so far, and the token
+        # pointer() gives
+        self.base = 0
+        self.count = 0
+        self.position = 0
+        self.high = -1
+        self.exhausted = False
+        self.eof = Token('EOF', 'EOF', 1, 0)
+
+    def get_tokens(self):
+        return self
+
+    # pull tokens until index is held or the input ends
+    def fill(self, index):
+        while self.count <= index and not self.exhausted:
+            token = next(self.iterator, None)
+            if token is None:
+                self.exhausted = True
+                if self.count:
+                    # the end of input is where the last token ends
+                    last = self.ring[(self.count - 1) & self.mask]
+                    self.eof.line_num = last.line_num
+                    self.eof.column = last.column + len(str(last.value))
+                break
+            if self.count - self.base > self.mask:
+                self.grow()
+            self.ring[self.count & self.mask] = token
+            self.count += 1
+
+    def grow(self):
+        ring = [None] * (2 * len(self.ring))
+        mask = len(ring) - 1
+        for index in range(self.base, self.count):
+            ring[index & mask] = self.ring[index & self.mask]
+        self.ring = ring
+        self.mask = mask
+
+    def pointer(self):
+        position = self.position
+        if position < self.count:
+            return self.ring[position & self.mask]
+        self.fill(position)
+        if position < self.count:
+            return self.ring[position & self.mask]
+        return self.eof
+
+    def match(self, kind):
+        token = self.pointer()
+        if token.kind != kind:
+            raise SyntaxError("match: expected {} got {}".format(kind, token.value))
+        if token is not self.eof:
+            self.position += 1
+            self.base = self.position
+        return token
+
+    def end_of_file(self):
+        return self.pointer() is self.eof
+
+    def __len__(self):
+        self.fill(self.high + 1)
+        return self.count
+
+    def __getitem__(self, index):
+        if index < self.base:
+            raise IndexError('token %d has been released' % index)
+        if index >= self.count:
+            self.fill(index)
+            if index >= self.count:
+                raise IndexError('token index out of range')
+        if index > self.high:
+            self.high = index
+        return self.ring[index & self.mask]
+
+    def release(self, index):
+        self.base = max(self.base, min(index, self.count))
+
+# The tokens of text that was lexed whole, read like a TokenStream but
+# from a plain list: get_tokens() is the list, which parser_1 indexes as
+# it is, and vintage_fe reads it with pointer(), match() and
+# end_of_file().  There is nothing to pull or release, so when the tokens
+# are in memory anyway this is the faster of the two.
+class TokenList:
+    def __init__(self, tokens):
+        self.tokens = list(tokens)
+        self.position = 0
+        self.eof = Token('EOF', 'EOF', 1, 0)
+        if self.tokens:
+            last = self.tokens[-1]
+            self.eof.line_num = last.line_num
+            self.eof.column = last.column + len(str(last.value))
+
+    def get_tokens(self):
+        return self.tokens
+
+    def pointer(self):
+        try:
+            return self.tokens[self.position]
+        except IndexError:
+            return self.eof
+
+    def match(self, kind):
+        try:
+            token = self.tokens[self.position]
+        except IndexError:
+            token = self.eof
+        if token.kind != kind:
+            raise SyntaxError("match: expected {} got {}".format(kind, token.value))
+        if token is not self.eof:
+            self.position += 1
+        return token
+
+    def end_of_file(self):
+        return self.position >= len(self.tokens)
+
+# Compact token store: one entry per token in parallel arrays (kind code,
+# start/end offset into the source, line number) plus the offset at which
+# each line starts.  Values and columns are computed when asked for.
+class TokenBuffer:
+    def __init__(self, source, kind_names):
+        self.source = source
+        self.kind_names = kind_names
+        self.kinds = array('B')
+        self.starts = array('I')
+        self.ends = array('I')
+        self.lines = array('I')
+        self.line_starts = array('I', [0])
+
+    def append(self, code, start, end, line_num):
+        self.kinds.append(code)
+        self.starts.append(start)
+        self.ends.append(end)
+        self.lines.append(line_num)
+
+    def __len__(self):
+        return len(self.kinds)
+
+    # tokens stay resident; present so a parser can treat it like a TokenStream
+    def release(self, index):
+        pass
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [TokenView(self, i) for i in range(*index.indices(len(self.kinds)))]
+        if index < 0:
+            index += len(self.kinds)
+        if not 0 <= index < len(self.kinds):
+            raise IndexError('token index out of range')
+        return TokenView(self, index)
+
+    def __iter__(self):
+        for i in range(len(self.kinds)):
+            yield TokenView(self, i)
+
+    def kind(self, index):
+        return self.kind_names[self.kinds[index]]
+
+    def value(self, index):
+        return self.source[self.starts[index]:self.ends[index]]
+
+    def line_num(self, index):
+        return self.lines[index]
+
+    def column(self, index):
+        return self.starts[index] - self.line_starts[self.lines[index] - 1]
+
+# TokenBuffer over bytes (a mmap for Lexer.from_path); values are decoded
+# from the source when they are read, as UTF-8, the default
+class BytesTokenBuffer(TokenBuffer):
+    def value(self, index):
+        return self.source[self.starts[index]:self.ends[index]].decode()
+
 # Token class
 class Token:
+    __slots__ = ('kind', 'value', 'line_num', 'column')
+
     def __init__(self, kind, value, line_num, column):
         self.kind = kind
         self.value = value
         self.line_num = line_num
         self.column = column
     
+    # the name vintage_fe reads the kind by
+    @property
+    def type(self):
+        return self.kind
+
+    def __str__(self):
+        return 'Token(%s, %s, %d, %d)' % (self.kind, self.value, self.line_num, self.column)
+
+# A Token read out of a TokenBuffer; it only remembers its position
+class TokenView:
+    __slots__ = ('buffer', 'index')
+
+    def __init__(self, buffer, index):
+        self.buffer = buffer
+        self.index = index
+
+    @property
+    def kind(self):
+        return self.buffer.kind_names[self.buffer.kinds[self.index]]
+
+    @property
+    def value(self):
+        return self.buffer.value(self.index)
+
+    @property
+    def line_num(self):
+        return self.buffer.lines[self.index]
+
+    @property
+    def column(self):
+        return self.buffer.column(self.index)
+
+    @property
+    def type(self):
+        return self.kind
+
     def __str__(self):
-        return 'Token(%s, %s, %d, %d)' % (self.kind, self.value, self.line_num, self.column)
\ No newline at end of file
+        return 'Token(%s, %s, %d, %d)' % (self.kind, self.value, self.line_num, self.column)
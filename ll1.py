@@ -0,0 +1,228 @@
+# LL(1) prediction tables, computed once at import time from the grammars
+# the two front ends implement.
+#
+# A grammar is a dict from nonterminal to a list of alternatives; each
+# alternative is a list of symbols.  A symbol is a nonterminal (a key of
+# the dict), a terminal (any other string) or an EBNF group: ('?', seq)
+# for an optional sequence and ('*', seq) for a repeated one.  Groups are
+# rewritten into helper nonterminals before FIRST/FOLLOW are computed.
+
+EOF = 'EOF'
+
+class Grammar:
+    def __init__(self, rules, start):
+        self.start = start
+        self.rules = {}
+        self.groups = 0
+        for (name, alternatives) in rules.items():
+            self.rules[name] = [self.desugar(alt) for alt in alternatives]
+        self.nullable = set()
+        self.first = {name: frozenset() for name in self.rules}
+        self.follow = {name: frozenset() for name in self.rules}
+        self.compute_first()
+        self.compute_follow()
+        # nonterminal -> {terminal: alternative index}
+        self.predict = {}
+        # (nonterminal, terminal, alternative kept, alternative dropped);
+        # a conflict is resolved in favour of the earlier alternative, which
+        # makes optional parts greedy (e.g. the dangling ELSE)
+        self.conflicts = []
+        self.compute_predict()
+
+    def desugar(self, alternative):
+        seq = []
+        for symbol in alternative:
+            if isinstance(symbol, tuple):
+                (op, group) = symbol
+                self.groups += 1
+                name = '<%s%d>' % (op, self.groups)
+                body = self.desugar(group)
+                if op == '?':
+                    self.rules[name] = [body, []]
+                elif op == '*':
+                    self.rules[name] = [body + [name], []]
+                else:
+                    raise ValueError("unknown grammar operator {}".format(op))
+                seq.append(name)
+            else:
+                seq.append(symbol)
+        return seq
+
+    def is_terminal(self, symbol):
+        return symbol not in self.rules
+
+    # FIRST of a sequence of symbols and whether all of it can derive empty
+    def first_of(self, seq):
+        result = set()
+        for symbol in seq:
+            if self.is_terminal(symbol):
+                result.add(symbol)
+                return frozenset(result), False
+            result |= self.first[symbol]
+            if symbol not in self.nullable:
+                return frozenset(result), False
+        return frozenset(result), True
+
+    def compute_first(self):
+        changed = True
+        while changed:
+            changed = False
+            for (name, alternatives) in self.rules.items():
+                for alt in alternatives:
+                    (first, nullable) = self.first_of(alt)
+                    if not first <= self.first[name]:
+                        self.first[name] = self.first[name] | first
+                        changed = True
+                    if nullable and name not in self.nullable:
+                        self.nullable.add(name)
+                        changed = True
+
+    def compute_follow(self):
+        self.follow[self.start] = frozenset([EOF])
+        changed = True
+        while changed:
+            changed = False
+            for (name, alternatives) in self.rules.items():
+                for alt in alternatives:
+                    for (i, symbol) in enumerate(alt):
+                        if self.is_terminal(symbol):
+                            continue
+                        (first, nullable) = self.first_of(alt[i + 1:])
+                        follow = first | self.follow[name] if nullable else first
+                        if not follow <= self.follow[symbol]:
+                            self.follow[symbol] = self.follow[symbol] | follow
+                            changed = True
+
+    def compute_predict(self):
+        for (name, alternatives) in self.rules.items():
+            table = {}
+            for (index, alt) in enumerate(alternatives):
+                (first, nullable) = self.first_of(alt)
+                if nullable:
+                    first = first | self.follow[name]
+                for terminal in first:
+                    if terminal in table:
+                        self.conflicts.append((name, terminal, table[terminal], index))
+                    else:
+                        table[terminal] = index
+            self.predict[name] = table
+
+    # For a rule whose alternatives each start with a distinct symbol:
+    # terminal -> that leading symbol (a keyword or a nonterminal name)
+    def dispatch(self, name):
+        alternatives = self.rules[name]
+        return {terminal: alternatives[index][0]
+                for (terminal, index) in self.predict[name].items()
+                if alternatives[index]}
+
+# the cuppa5 dialect parsed by vintage_fe; this is the grammar written in
+# the comments above each rule function there
+VINTAGE_RULES = {
+    'stmt_list': [[('*', ['stmt'])]],
+    'stmt': [
+        ['VOID_TYPE', 'ID', 'LPAREN', ('?', ['formal_args']), 'RPAREN', 'stmt'],
+        ['data_type', 'ID', 'decl_suffix'],
+        ['ID', 'id_suffix'],
+        ['GET', 'ID', ('?', ['SEMI'])],
+        ['PUT', 'exp', ('?', ['SEMI'])],
+        ['RETURN', ('?', ['exp']), ('?', ['SEMI'])],
+        ['WHILE', 'LPAREN', 'exp', 'RPAREN', 'stmt'],
+        ['IF', 'LPAREN', 'exp', 'RPAREN', 'stmt', ('?', ['ELSE', 'stmt'])],
+        ['LCURLY', 'stmt_list', 'RCURLY'],
+    ],
+    'data_type': [['primitive_type', ('?', ['LSQUARE', 'INTEGER', 'RSQUARE'])]],
+    'primitive_type': [['INTEGER_TYPE'], ['FLOAT_TYPE'], ['STRING_TYPE']],
+    'decl_suffix': [
+        ['LPAREN', ('?', ['formal_args']), 'RPAREN', 'stmt'],
+        ['ASSIGN', 'initializer', ('?', ['SEMI'])],
+        [('?', ['SEMI'])],
+    ],
+    'initializer': [
+        ['exp'],
+        ['LCURLY', 'exp', ('*', ['COMMA', 'exp']), 'RCURLY'],
+    ],
+    'id_suffix': [
+        ['LPAREN', ('?', ['actual_args']), 'RPAREN',
+         ('?', ['LSQUARE', 'exp', 'RSQUARE', 'ASSIGN', 'exp']), ('?', ['SEMI'])],
+        ['LSQUARE', 'exp', 'RSQUARE', 'ASSIGN', 'exp', ('?', ['SEMI'])],
+        ['ASSIGN', 'exp', ('?', ['SEMI'])],
+    ],
+    'exp': [['exp_low']],
+    'exp_low': [['exp_med', ('*', ['exp_low_op', 'exp_med'])]],
+    'exp_low_op': [['EQ'], ['LE']],
+    'exp_med': [['exp_high', ('*', ['exp_med_op', 'exp_high'])]],
+    'exp_med_op': [['PLUS'], ['MINUS']],
+    'exp_high': [['primary', ('*', ['exp_high_op', 'primary'])]],
+    'exp_high_op': [['MUL'], ['DIV']],
+    'primary': [
+        ['INTEGER'],
+        ['FLOAT'],
+        ['STRING'],
+        ['ID', ('?', ['id_exp_suffix'])],
+        ['LPAREN', 'exp', 'RPAREN'],
+        ['MINUS', 'primary'],
+        ['NOT', 'primary'],
+    ],
+    'id_exp_suffix': [
+        ['LPAREN', ('?', ['actual_args']), 'RPAREN', ('?', ['LSQUARE', 'exp', 'RSQUARE'])],
+        ['LSQUARE', 'exp', 'RSQUARE'],
+    ],
+    'formal_args': [['data_type', 'ID', ('*', ['COMMA', 'data_type', 'ID'])]],
+    'actual_args': [['exp', ('*', ['COMMA', 'exp'])]],
+}
+
+# grammar.txt, spelled with the token kinds of lexer.Lexer and following
+# what parser_1 accepts where the two differ (LET and FOR use EQ, a FOR
+# and an IF THEN take a statement, PRINT takes one expression).  INPUT,
+# RANDOMIZE and STOP have no parser; they are here so that error recovery
+# resumes at them.  tests/test_ll1.py checks the tables against the parsers
+BASIC_RULES = {
+    'basic_program': [[('*', ['prog_stmt'])]],
+    'prog_stmt': [
+        ['data_stmt'], ['def_stmt'], ['end_stmt'], ['for_stmt'], ['gosub_stmt'],
+        ['goto_stmt'], ['if_stmt'], ['input_stmt'], ['let_stmt'], ['next_stmt'],
+        ['on_stmt'], ['print_stmt'], ['randomize_stmt'], ['read_stmt'],
+        ['rem_stmt'], ['restore_stmt'], ['return_stmt'], ['stop_stmt'],
+    ],
+    'data_stmt': [['DATA', 'literal', ('*', ['COMMA', 'literal'])]],
+    'def_stmt': [['DEF', 'FN', 'ID', 'LPAREN', 'ID', ('*', ['COMMA', 'ID']), 'RPAREN', 'EQ', 'expr']],
+    'end_stmt': [['END']],
+    'for_stmt': [['FOR', 'ID', 'EQ', 'expr', 'TO', 'expr', ('?', ['STEP', 'expr']), ('?', ['prog_stmt'])]],
+    'gosub_stmt': [['GOSUB', 'NUMBER']],
+    'goto_stmt': [['GOTO', 'NUMBER']],
+    'if_stmt': [['IF', 'expr', 'THEN', 'prog_stmt']],
+    'input_stmt': [['INPUT', ('?', ['STRING', 'EOL']), 'ID', ('*', ['COMMA', 'ID'])]],
+    'let_stmt': [['LET', 'ID', 'EQ', 'expr']],
+    'next_stmt': [['NEXT', 'ID']],
+    'on_stmt': [['ON', 'expr', 'on_jump', 'NUMBER', ('*', ['COMMA', 'NUMBER'])]],
+    'on_jump': [['GOSUB'], ['GOTO']],
+    'print_stmt': [['PRINT', 'expr']],
+    'randomize_stmt': [['RANDOMIZE']],
+    'read_stmt': [['READ', 'ID', ('*', ['COMMA', 'ID'])]],
+    'rem_stmt': [['REM']],
+    'restore_stmt': [['RESTORE', ('?', ['NUMBER'])]],
+    'return_stmt': [['RETURN']],
+    'stop_stmt': [['STOP']],
+    'expr': [['expr_lgc']],
+    'expr_lgc': [['expr_eql', ('*', ['lgc_op', 'expr_eql'])]],
+    'lgc_op': [['OR'], ['AND']],
+    'expr_eql': [['expr_opmed', ('*', ['eql_op', 'expr_opmed'])]],
+    'eql_op': [['LEQ'], ['EQ'], ['NEQ'], ['LSS'], ['GRT'], ['GREQ']],
+    'expr_opmed': [['expr_ophigh', ('*', ['opmed_op', 'expr_ophigh'])]],
+    'opmed_op': [['ADD'], ['SUB']],
+    'expr_ophigh': [['unary', ('*', ['ophigh_op', 'unary'])]],
+    'ophigh_op': [['MUL'], ['DIV'], ['POW']],
+    'unary': [['SUB', 'unary'], ['ADD', 'unary'], ['NOT', 'unary'], ['primary']],
+    'primary': [
+        ['literal'],
+        ['ID', ('?', ['LPAREN', ('?', ['actual_args']), 'RPAREN'])],
+        ['FUNC', ('?', ['actual_args']), 'RPAREN'],
+        ['LPAREN', 'expr', 'RPAREN'],
+    ],
+    # a number or a string; FLOAT_TYPE is the float keyword, not a number
+    'literal': [['NUMBER'], ['STRING']],
+    'actual_args': [['expr', ('*', ['COMMA', 'expr'])]],
+}
+
+VINTAGE = Grammar(VINTAGE_RULES, 'stmt_list')
+BASIC = Grammar(BASIC_RULES, 'basic_program')
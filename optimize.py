@@ -0,0 +1,442 @@
+from array import array
+
+from engine import is_name, literal_value
+from fold import count_nodes, fold_basic, rebuild
+
+# DEF FN inlining and common subexpression elimination for parser_1
+# programs.
+#
+# optimize(statements, lines) returns a new statement list and its
+# statement lines: calls of DEF FN functions are replaced by the function
+# body with the arguments in place of the parameters, the result is folded
+# (fold.fold_basic), and then expressions computed more than once within a
+# basic block are computed once into a temporary variable.
+#
+# A call is inlined when the function is not recursive, the number of
+# arguments is right and inlining cannot change what is evaluated.  An
+# argument that can raise or has an effect (any operator but NOT, AND, OR,
+# = and <>, or any call) must be used exactly once, where the body always
+# evaluates it, and the body must evaluate such arguments in their order
+# before anything else in it that can raise: the call would have raised
+# on the argument before the body ran.
+#
+# A basic block is a run of statements that control enters only at the
+# first and leaves only after the last: a GOTO/GOSUB/ON target, or the
+# statement after a jump, IF, FOR or NEXT, starts a new one.  Only the
+# expressions every pass through the block evaluates are shared: not the
+# statement after THEN or on the FOR line, nor the right operand of AND
+# and OR, as the temporary is computed whether or not they are.  Two
+# occurrences are the same when the trees are equal and no variable in
+# them is assigned between the two.  The temporary (CSE1, CSE2, ...) is assigned by a LET placed
+# before the statement with the first occurrence, on the same line, so a
+# jump to the line computes it too.
+
+# an inlined call may be at most this many nodes
+MAX_INLINE_NODES = 256
+
+# statements that end a basic block; READ ends one as the variables it
+# assigns are not counted in the versions
+BLOCK_ENDS = {'GOTO', 'GOSUB', 'ON', 'RETURN', 'END', 'IF', 'FOR', 'NEXT', 'READ'}
+# operators worth computing once
+OPERATORS = {'EXPR', 'TERM', 'POWER', 'COMPARE', 'LOGIC', 'UNARY'}
+IMPURE_BUILTINS = {'RND'}
+
+def walk_expression(node):
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, str):
+            yield node
+            continue
+        yield node
+        if node[0] == 'FACTOR':
+            stack.append(node[2])
+        elif node[0] == 'FUNC':
+            stack.extend(node[2])
+        elif node[0] == 'UNARY':
+            stack.append(node[2])
+        else:
+            stack.extend(node[2:])
+
+# whether the operator of node can raise, or has an effect, once its
+# operands are evaluated
+def raises(node):
+    tag = node[0]
+    if tag == 'FACTOR':
+        operand = node[2]
+        return node[1] != 1 and not (isinstance(operand, str) and not is_name(operand)
+                                     and not operand.startswith('"'))
+    elif tag == 'UNARY' or tag == 'LOGIC':
+        return False
+    elif tag == 'COMPARE':
+        return node[1] != 'EQ' and node[1] != 'NEQ'
+    return True
+
+def safe(node):
+    return not any(isinstance(n, tuple) and raises(n) for n in walk_expression(node))
+
+# The names read in an expression and its operators that can raise (as
+# None), in the order the engine evaluates them, each with whether every
+# evaluation of the expression reaches it: the right operand of AND and OR
+# is not always evaluated.
+def evaluation(node):
+    events = []
+    stack = [(node, True, False)]
+    while stack:
+        (node, always, operands_done) = stack.pop()
+        if isinstance(node, str):
+            if is_name(node):
+                events.append((node, always))
+            continue
+        if operands_done:
+            if raises(node):
+                events.append((None, always))
+            continue
+        stack.append((node, always, True))
+        tag = node[0]
+        if tag == 'FUNC':
+            operands = [(arg, always) for arg in node[2]]
+        elif tag == 'FACTOR' or tag == 'UNARY':
+            operands = [(node[2], always)]
+        elif tag == 'LOGIC':
+            operands = [(node[2], always), (node[3], False)]
+        else:
+            operands = [(node[2], always), (node[3], always)]
+        for (operand, reached) in reversed(operands):
+            stack.append((operand, reached, False))
+    return events
+
+# each subexpression of node with whether every evaluation of node reaches
+# it, as evaluation() decides it
+def reached(node):
+    stack = [(node, True)]
+    while stack:
+        (node, always) = stack.pop()
+        yield (node, always)
+        if isinstance(node, str):
+            continue
+        tag = node[0]
+        if tag == 'FUNC':
+            stack.extend((arg, always) for arg in node[2])
+        elif tag == 'FACTOR' or tag == 'UNARY':
+            stack.append((node[2], always))
+        elif tag == 'LOGIC':
+            stack.extend(((node[2], always), (node[3], False)))
+        else:
+            stack.extend((operand, always) for operand in node[2:])
+
+def calls(node):
+    return [n[1] for n in walk_expression(node) if isinstance(n, tuple) and n[0] == 'FUNC']
+
+def names(node):
+    return [n for n in walk_expression(node) if isinstance(n, str) and is_name(n)]
+
+# the statements inside a statement: after THEN, on the FOR line
+def nested(statement):
+    yield statement
+    while statement is not None:
+        if statement[0] == 'IF':
+            statement = statement[2]
+        elif statement[0] == 'FOR':
+            statement = statement[5]
+        else:
+            break
+        if statement is not None:
+            yield statement
+
+class Inliner:
+    def __init__(self, statements):
+        self.functions = {}
+        for statement in statements:
+            if statement[0] == 'DEF':
+                (DEF, name, parameters, body) = statement
+                self.functions.setdefault(name, (parameters, body))
+        # a function is recursive when it can reach itself through calls
+        graph = {name: set(calls(body)) & set(self.functions)
+                 for (name, (parameters, body)) in self.functions.items()}
+        self.recursive = set()
+        for name in graph:
+            seen = set()
+            stack = list(graph[name])
+            while stack:
+                callee = stack.pop()
+                if callee == name:
+                    self.recursive.add(name)
+                    break
+                if callee not in seen:
+                    seen.add(callee)
+                    stack.extend(graph[callee])
+        self.inlined = 0
+        # bodies with their own calls inlined, by name
+        self.bodies = {}
+
+    def body(self, name):
+        if name not in self.bodies:
+            (parameters, body) = self.functions[name]
+            self.bodies[name] = self.expression(body)
+        return self.bodies[name]
+
+    def expression(self, node):
+        return rebuild(node, self.simplify)[0]
+
+    def simplify(self, node):
+        if node[0] != 'FUNC':
+            return node
+        (FUNC, name, args) = node
+        if name not in self.functions or name in self.recursive:
+            return node
+        (parameters, body) = self.functions[name]
+        if len(parameters) != len(args):
+            return node
+        body = self.body(name)
+        unsafe = [parameter for (parameter, arg) in zip(parameters, args) if not safe(arg)]
+        if unsafe:
+            events = [(n, always) for (n, always) in evaluation(body) if n is None or n in unsafe]
+            if events[:len(unsafe)] != [(parameter, True) for parameter in unsafe]:
+                return node
+            if any(n is not None for (n, always) in events[len(unsafe):]):
+                return node
+        bound = dict(zip(parameters, args))
+        def substitute(n):
+            if n[0] == 'FACTOR' and isinstance(n[2], str) and n[2] in bound:
+                return ('FACTOR', n[1], bound[n[2]])
+            return n
+        inlined = rebuild(body, substitute)[0]
+        if count_nodes(inlined) > MAX_INLINE_NODES:
+            return node
+        self.inlined += 1
+        return inlined
+
+    def statements(self, statements):
+        result = []
+        for statement in statements:
+            if statement[0] != 'DEF':
+                statement = rebuild(statement, self.simplify)[0]
+            result.append(statement)
+        return result
+
+# calls of DEF FN functions replaced by their bodies: the statements and
+# the number of calls inlined
+def inline_functions(statements):
+    inliner = Inliner(statements)
+    return (inliner.statements(statements), inliner.inlined)
+
+# the statement index each line number jumps to, for the lines jumped to
+def jump_targets(statements, lines):
+    first = {}
+    for (index, line_num) in enumerate(lines):
+        first.setdefault(line_num, index)
+    targets = set()
+    for statement in statements:
+        for inner in nested(statement):
+            if inner[0] == 'GOTO' or inner[0] == 'GOSUB':
+                numbers = [inner[1]]
+            elif inner[0] == 'ON':
+                numbers = inner[3]
+            else:
+                continue
+            for number in numbers:
+                index = first.get(literal_value(number))
+                if index is not None:
+                    targets.add(index)
+    return targets
+
+# the expressions a statement always evaluates, in order, and the variable
+# it assigns after each (or None)
+def evaluated(statement):
+    kind = statement[0]
+    if kind == 'LET':
+        return [(statement[2], statement[1])]
+    elif kind == 'PRINT' or kind == 'IF' or kind == 'ON':
+        return [(statement[1], None)]
+    elif kind == 'FOR':
+        (FOR, name, start, end, step, loop_statement) = statement
+        # the variable is set before the limit and step are evaluated
+        slots = [(start, name), (end, None)]
+        if step is not None:
+            slots.append((step, None))
+        return slots
+    return []
+
+# the statement with the expressions it evaluates replaced, in order
+def replace_evaluated(statement, expressions):
+    kind = statement[0]
+    if kind == 'LET':
+        return ('LET', statement[1], expressions[0])
+    elif kind == 'PRINT':
+        return ('PRINT', expressions[0])
+    elif kind == 'IF':
+        return ('IF', expressions[0]) + statement[2:]
+    elif kind == 'ON':
+        return ('ON', expressions[0]) + statement[2:]
+    elif kind == 'FOR':
+        step = expressions[2] if len(expressions) > 2 else None
+        return ('FOR', statement[1], expressions[0], expressions[1], step, statement[5])
+    return statement
+
+class Eliminator:
+    def __init__(self, statements):
+        self.functions = set(s[1] for s in statements if s[0] == 'DEF')
+        self.taken = set()
+        for statement in statements:
+            for inner in nested(statement):
+                if inner[0] in ('LET', 'FOR', 'NEXT'):
+                    self.taken.add(inner[1])
+                elif inner[0] == 'DEF':
+                    self.taken.update(inner[2])
+                elif inner[0] == 'READ':
+                    self.taken.update(inner[1])
+                for (expression, assigned) in evaluated(inner):
+                    self.taken.update(names(expression))
+                if inner[0] == 'DEF':
+                    self.taken.update(names(inner[3]))
+        self.temporaries = 0
+        self.eliminated = 0
+
+    def temporary(self):
+        while True:
+            self.temporaries += 1
+            name = 'CSE%d' % self.temporaries
+            if name not in self.taken:
+                self.taken.add(name)
+                return name
+
+    # node -> key for each subexpression of an expression: the tree with
+    # each variable paired with the number of times it has been assigned
+    def keys(self, node, versions, keys):
+        if isinstance(node, str):
+            key = (node, versions.get(node, 0)) if is_name(node) else node
+        elif node[0] == 'FUNC':
+            key = ('FUNC', node[1], tuple(self.keys(arg, versions, keys) for arg in node[2]))
+        elif node[0] == 'FACTOR':
+            key = ('FACTOR', node[1], self.keys(node[2], versions, keys))
+        elif node[0] == 'UNARY':
+            key = ('UNARY', node[1], self.keys(node[2], versions, keys))
+        else:
+            key = (node[0], node[1], self.keys(node[2], versions, keys), self.keys(node[3], versions, keys))
+        keys[id(node)] = key
+        return key
+
+    # whether node may be computed once for all its occurrences, and is
+    # worth it
+    def candidate(self, node):
+        if isinstance(node, str):
+            return False
+        if node[0] == 'FUNC':
+            if node[1] in self.functions or node[1] in IMPURE_BUILTINS:
+                return False
+        elif node[0] not in OPERATORS:
+            return False
+        work = 0
+        for n in walk_expression(node):
+            if isinstance(n, tuple) and n[0] == 'FUNC':
+                if n[1] in self.functions or n[1] in IMPURE_BUILTINS:
+                    return False
+                work += 2
+            elif isinstance(n, tuple) and n[0] in OPERATORS:
+                work += 1
+        return work >= 2
+
+    # one pass over a block; returns the new statements and lines, or None
+    # when nothing was shared
+    def block(self, statements, lines):
+        counts = {}
+        versions = {}
+        for statement in statements:
+            for (expression, assigned) in evaluated(statement):
+                keys = {}
+                self.keys(expression, versions, keys)
+                for (n, always) in reached(expression):
+                    if always and self.candidate(n):
+                        key = keys[id(n)]
+                        counts[key] = counts.get(key, 0) + 1
+                if assigned is not None:
+                    versions[assigned] = versions.get(assigned, 0) + 1
+        if all(count < 2 for count in counts.values()):
+            return None
+        # the second pass replaces the shared expressions, outermost first
+        temporaries = {}
+        versions = {}
+        result = []
+        result_lines = array('I')
+        for (statement, line_num) in zip(statements, lines):
+            definitions = []
+            expressions = []
+            for (expression, assigned) in evaluated(statement):
+                keys = {}
+                self.keys(expression, versions, keys)
+                def replace(node, in_factor, always=True):
+                    if isinstance(node, str) or not always:
+                        return node
+                    key = keys[id(node)]
+                    if counts.get(key, 0) >= 2 and self.candidate(node):
+                        if key not in temporaries:
+                            temporaries[key] = self.temporary()
+                            definitions.append(('LET', temporaries[key], node))
+                        else:
+                            self.eliminated += count_nodes(node) - (0 if in_factor else 1)
+                        name = temporaries[key]
+                        return name if in_factor else ('FACTOR', 1, name)
+                    if node[0] == 'FACTOR':
+                        operand = replace(node[2], True)
+                        return node if operand is node[2] else ('FACTOR', node[1], operand)
+                    if node[0] == 'FUNC':
+                        args = [replace(arg, False) for arg in node[2]]
+                        if all(new is old for (new, old) in zip(args, node[2])):
+                            return node
+                        return ('FUNC', node[1], args)
+                    if node[0] == 'UNARY':
+                        operand = replace(node[2], False)
+                        return node if operand is node[2] else ('UNARY', node[1], operand)
+                    (tag, op, left, right) = node
+                    (new_left, new_right) = (replace(left, False), replace(right, False, tag != 'LOGIC'))
+                    if new_left is left and new_right is right:
+                        return node
+                    return (tag, op, new_left, new_right)
+                expressions.append(replace(expression, False))
+                if assigned is not None:
+                    versions[assigned] = versions.get(assigned, 0) + 1
+            for definition in definitions:
+                result.append(definition)
+                result_lines.append(line_num)
+            result.append(replace_evaluated(statement, expressions))
+            result_lines.append(line_num)
+        return (result, result_lines)
+
+    def program(self, statements, lines):
+        targets = jump_targets(statements, lines)
+        result = []
+        result_lines = array('I')
+        start = 0
+        for index in range(len(statements) + 1):
+            ends = index == len(statements) or index in targets or \
+                   index > start and statements[index - 1][0] in BLOCK_ENDS
+            if not ends or index == start:
+                continue
+            block = (statements[start:index], lines[start:index])
+            # sharing the largest expressions can leave smaller ones shared
+            # by the temporaries' definitions
+            while True:
+                shared = self.block(*block)
+                if shared is None:
+                    break
+                block = shared
+            result.extend(block[0])
+            result_lines.extend(block[1])
+            start = index
+        return (result, result_lines)
+
+# expressions computed more than once in a basic block computed once into
+# temporaries: the statements, their lines and the number of nodes removed
+def eliminate_common(statements, lines):
+    eliminator = Eliminator(statements)
+    (statements, lines) = eliminator.program(statements, lines)
+    return (statements, lines, eliminator.eliminated)
+
+# inlining, folding and common subexpressions: the statements, their lines
+# and what each step did
+def optimize(statements, lines):
+    (statements, inlined) = inline_functions(statements)
+    (statements, folded) = fold_basic(statements)
+    (statements, lines, shared) = eliminate_common(statements, array('I', lines))
+    return (statements, lines, {'inlined': inlined, 'folded': folded, 'shared': shared})
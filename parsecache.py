@@ -0,0 +1,176 @@
+import hashlib
+import importlib
+import marshal
+import os
+import tempfile
+from array import array
+
+from ll1 import BASIC_RULES, VINTAGE_RULES
+
+# On-disk cache of parse results, shared between processes.
+#
+# An entry is the marshalled tree of one source text, in a file named by
+# the SHA-256 of the text, the parser and its versions: the parser
+# version is a digest of the source of the modules that build the tree,
+# and the grammar version one of its ll1 rules, so changing either makes
+# the old entries unreachable.  Only sources that parse without errors
+# are stored, and only trees marshal can write: one nested deeper than
+# its limit is parsed again each time.
+#
+# An entry is written to a temporary file in the cache directory and
+# renamed into place, so a reader sees a whole entry or none; a reader
+# that finds a damaged file, or none because another process evicted it,
+# parses the source as if it were not cached.  Each hit touches the file,
+# and when the directory grows past max_bytes the entries used longest
+# ago are removed until it is back under three quarters of that.  Other
+# processes write to the directory too, so its size is looked at again
+# every RESCAN writes.
+
+MAGIC = b'PCA1'
+SUFFIX = '.ast'
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+RESCAN = 64
+
+# parser -> (modules building its trees, the rules of its grammar)
+PARSERS = {
+    'basic': (('lexer', 'parser_1'), BASIC_RULES),
+    'vintage': (('vintage_fe', 'vintage_iter'), VINTAGE_RULES),
+}
+
+def module_digest(names):
+    digest = hashlib.sha256()
+    for name in names:
+        with open(importlib.import_module(name).__file__, 'rb') as file:
+            digest.update(file.read())
+    return digest.hexdigest()
+
+def grammar_digest(rules):
+    return hashlib.sha256(repr(sorted(rules.items())).encode('utf-8')).hexdigest()
+
+class ParseCache:
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        # parser -> (parser version, grammar version)
+        self.versions = {}
+        # bytes this process believes the directory holds; None until it
+        # has looked
+        self.size = None
+        self.writes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def version(self, parser):
+        if parser not in self.versions:
+            (modules, rules) = PARSERS[parser]
+            self.versions[parser] = (module_digest(modules), grammar_digest(rules))
+        return self.versions[parser]
+
+    def path(self, parser, source):
+        if isinstance(source, str):
+            source = source.encode('utf-8')
+        digest = hashlib.sha256(source)
+        for part in (parser,) + self.version(parser):
+            digest.update(b'\0' + part.encode('ascii'))
+        return os.path.join(self.directory, digest.hexdigest() + SUFFIX)
+
+    # the cached value for source, or None
+    def get(self, parser, source):
+        path = self.path(parser, source)
+        try:
+            with open(path, 'rb') as file:
+                data = file.read()
+            if data[:len(MAGIC)] != MAGIC:
+                raise ValueError("not a cache entry")
+            value = marshal.loads(data[len(MAGIC):])
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except (OSError, ValueError, EOFError, TypeError):
+            self.misses += 1
+            self.remove(path)
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self.hits += 1
+        return value
+
+    def put(self, parser, source, value):
+        try:
+            data = MAGIC + marshal.dumps(value)
+        except ValueError:
+            # too deeply nested to marshal
+            return
+        path = self.path(parser, source)
+        (fd, temporary) = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                file.write(data)
+            os.replace(temporary, path)
+        except BaseException:
+            self.remove(temporary)
+            raise
+        self.writes += 1
+        if self.size is None or self.writes % RESCAN == 0:
+            self.size = self.scan()[1]
+        else:
+            self.size += len(data)
+        if self.size > self.max_bytes:
+            self.evict()
+
+    def remove(self, path):
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+    # the entries as (last used, size, path), and their total size
+    def scan(self):
+        entries = []
+        total = 0
+        with os.scandir(self.directory) as found:
+            for entry in found:
+                if not entry.name.endswith(SUFFIX):
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+        return (entries, total)
+
+    def evict(self):
+        (entries, total) = self.scan()
+        entries.sort()
+        for (used, size, path) in entries:
+            if total <= self.max_bytes * 3 // 4:
+                break
+            self.remove(path)
+            total -= size
+        self.size = total
+
+    # the statements of BASIC source and the line each starts on, as
+    # engine.parse_source gives them
+    def parse_basic(self, source):
+        cached = self.get('basic', source)
+        if cached is not None:
+            (statements, lines) = cached
+            return (statements, array('I', lines))
+        from engine import parse_source
+        (statements, lines) = parse_source(source)
+        self.put('basic', source, (statements, list(lines)))
+        return (statements, lines)
+
+    # the tree of vintage_fe source, as vintage_fe.parse gives it
+    def parse_vintage(self, source, iterative=False):
+        cached = self.get('vintage', source)
+        if cached is not None:
+            return cached
+        from vintage_fe import parse
+        tree = parse(source, iterative)
+        self.put('vintage', source, tree)
+        return tree
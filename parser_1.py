@@ -1,44 +1,296 @@
+from array import array
+from bisect import bisect_left, bisect_right
+
+from ll1 import BASIC
+
+# a statement that failed to parse: what was expected and where
+class Diagnostic:
+    __slots__ = ('message', 'line_num', 'column')
+
+    def __init__(self, message, line_num, column):
+        self.message = message
+        self.line_num = line_num
+        self.column = column
+
+    def __str__(self):
+        return 'line %d, column %d: %s' % (self.line_num, self.column, self.message)
+
+# the value of a NUMBER or STRING token
+def literal_value(text):
+    if text.startswith('"'):
+        return text[1:-1]
+    if '.' in text:
+        return float(text)
+    return int(text)
+
+# the lines a GOTO, GOSUB, ON or RESTORE statement names, not counting
+# the statements nested in it
+def line_targets(node):
+    kind = node[0]
+    if kind == 'GOTO' or kind == 'GOSUB':
+        return (node[1],)
+    elif kind == 'ON':
+        return node[3]
+    elif kind == 'RESTORE' and node[1] is not None:
+        return (node[1],)
+    return ()
+
+# the statement and the statements nested in it, after THEN and ELSE and
+# on a FOR line
+def nested_statements(statement):
+    stack = [statement]
+    while stack:
+        node = stack.pop()
+        if node is None:
+            continue
+        yield node
+        if node[0] == 'IF':
+            stack.extend((node[3], node[2]))
+        elif node[0] == 'FOR':
+            stack.append(node[5])
+
+# The index the parser builds alongside the statements.  starts holds the
+# source line each statement starts on, in order, as the lexer numbers
+# them; lines maps each line a GOTO, GOSUB, ON or RESTORE names to the
+# first statement starting on it.  data holds the value of every DATA
+# literal in program order, and data_before the position in data of the
+# first literal at or after each statement, so READ is a cursor into data
+# and RESTORE to a line one lookup.  A line named before any statement
+# starts on it is pending, with where it was named, until one does;
+# undefined() gives those left at the end.  The arrays grow with every
+# statement; a stream parsed without them is checked with a LineRuns.
+class ProgramIndex:
+    def __init__(self):
+        self.starts = array('I')
+        self.lines = {}
+        self.data = []
+        self.data_before = array('I')
+        self.pending = {}
+
+    # the index of a program parsed already
+    @classmethod
+    def of(cls, statements, lines=None):
+        if lines is None:
+            lines = range(1, len(statements) + 1)
+        index = cls()
+        for (statement, line_num) in zip(statements, lines):
+            index.add(statement, line_num)
+        return index
+
+    def add(self, statement, line_num, column=0):
+        if (not self.starts or self.starts[-1] != line_num) and line_num in self.pending:
+            self.lines[line_num] = len(self.starts)
+            del self.pending[line_num]
+        self.starts.append(line_num)
+        self.data_before.append(len(self.data))
+        for node in nested_statements(statement):
+            if node[0] == 'DATA':
+                self.data.extend(node[1])
+            for target in line_targets(node):
+                self.reference(target, line_num, column)
+
+    # the first statement starting on a line, or None
+    def find(self, line_num):
+        index = bisect_left(self.starts, line_num)
+        if index < len(self.starts) and self.starts[index] == line_num:
+            return index
+        return None
+
+    def reference(self, target, line_num, column):
+        number = literal_value(target)
+        if number in self.lines:
+            return
+        index = self.find(number)
+        if index is None:
+            self.pending.setdefault(number, []).append((target, line_num, column))
+        else:
+            self.lines[number] = index
+
+    # the position in data RESTORE to the given line number reads from next
+    def restore(self, line_num):
+        line_num = literal_value(line_num)
+        index = self.lines.get(line_num)
+        if index is None:
+            index = self.find(line_num)
+            if index is None:
+                raise ValueError("undefined line {}".format(line_num))
+        return self.data_before[index]
+
+    # (line number, source line, column) for each reference to a line
+    # with no statement, in the order they appear
+    def undefined(self):
+        references = [reference for named in self.pending.values() for reference in named]
+        return sorted(references, key=lambda reference: reference[1:])
+
+# What a Parser keeps instead of a ProgramIndex when it is not to index
+# the statements: the lines statements start on, as runs of consecutive
+# lines, and the lines named that no statement has started on yet.  Lines
+# named are still checked, but only a gap between lines that start
+# statements takes memory, so a stream is parsed in constant memory.
+class LineRuns:
+    def __init__(self):
+        # the first and last line of each run
+        self.firsts = array('I')
+        self.lasts = array('I')
+        self.pending = {}
+
+    def add(self, statement, line_num, column=0):
+        if self.lasts and line_num <= self.lasts[-1] + 1:
+            self.lasts[-1] = line_num
+        else:
+            self.firsts.append(line_num)
+            self.lasts.append(line_num)
+        self.pending.pop(line_num, None)
+        for node in nested_statements(statement):
+            for target in line_targets(node):
+                self.reference(target, line_num, column)
+
+    # whether a statement starts on a line
+    def find(self, line_num):
+        run = bisect_right(self.firsts, line_num) - 1
+        return run >= 0 and line_num <= self.lasts[run]
+
+    def reference(self, target, line_num, column):
+        number = literal_value(target)
+        if not self.find(number):
+            self.pending.setdefault(number, []).append((target, line_num, column))
+
+    undefined = ProgramIndex.undefined
+
 class Parser:
-    def __init__(self, lexer):
+    # factory is an optional hashcons.NodeFactory the statements are
+    # interned in as they are parsed.  With index false the parser keeps
+    # nothing for each statement (no index and no statement_lines), for
+    # iter_statements() over a stream that is too large to hold.
+    def __init__(self, lexer, factory=None, index=True):
         self.lexer = lexer
+        self.factory = factory
         self.tokens = lexer.get_tokens()
         self.current_token_index = 0
+        # the line, DATA and jump target index of the statements parsed,
+        # or the LineRuns checking the lines named
+        self.index = ProgramIndex() if index else LineRuns()
+        # source line each parsed statement starts on, for line number jumps
+        self.statement_lines = self.index.starts if index else None
+        # Diagnostic for each statement that failed to parse
+        self.errors = []
+        self.failure = None
+        self.failure_index = 0
+        self.statements = None
+        self.cfg = None
 
     def parse(self):
-        statements = []
+        self.statements = list(self.iter_statements())
+        return self.statements
+
+    # the cfg.ControlFlowGraph of the parsed program, built on first use
+    def control_flow(self):
+        if self.statement_lines is None:
+            raise ValueError("the parser keeps no statement lines")
+        if self.cfg is None:
+            if self.statements is None:
+                self.parse()
+            from cfg import ControlFlowGraph
+            self.cfg = ControlFlowGraph(self.statements, self.statement_lines)
+        return self.cfg
+
+    # yield each statement as soon as it is complete; the tokens it was
+    # parsed from are released, so with a StreamingLexer and index false
+    # the parser runs in constant memory.
+    # A statement that fails to parse is reported in self.errors and the
+    # parser resumes at the next statement boundary, so one pass finds
+    # every error in the input.  A GOTO, GOSUB, ON or RESTORE naming a line
+    # that no statement starts on is reported at the end.
+    def iter_statements(self):
+        # a plain list of tokens holds them all anyway
+        release = getattr(self.tokens, 'release', None)
         while self.current_token_index < len(self.tokens):
+            start = self.current_token_index
+            self.failure = None
             statement = self.parse_statement()
-            if statement:
-                statements.append(statement)
+            if statement is None and self.failure is None:
+                self.fail('a statement')
+            if self.failure is None:
+                if self.factory is not None:
+                    statement = self.factory.intern(statement)
+                token = self.tokens[start]
+                self.index.add(statement, token.line_num, token.column)
+                yield statement
             else:
-                # if we can't parse a statement, skip the current token and try again
-                self.current_token_index += 1
-        return statements
+                self.errors.append(self.failure)
+                self.synchronise(max(start + 1, self.failure_index))
+            if release is not None:
+                release(self.current_token_index)
+        for (target, line_num, column) in self.index.undefined():
+            self.errors.append(Diagnostic('undefined line %s' % target, line_num, column))
+
+    # panic mode: skip to the first token from index on that starts a
+    # statement or a new line
+    def synchronise(self, index):
+        if index < len(self.tokens):
+            line_num = self.tokens[index - 1].line_num
+            while index < len(self.tokens):
+                token = self.tokens[index]
+                if token.kind in self.STATEMENT_KINDS or token.line_num != line_num:
+                    break
+                index += 1
+        self.current_token_index = index
+
+    # record why the current statement failed, at the current token; the
+    # first failure (the innermost rule) is the one reported.  Returns None
+    # so that a rule can `return self.fail(...)`
+    def fail(self, expected):
+        if self.failure is None:
+            index = self.current_token_index
+            if index < len(self.tokens):
+                token = self.tokens[index]
+                message = 'expected %s, got %s %r' % (expected, token.kind, token.value)
+                self.failure = Diagnostic(message, token.line_num, token.column)
+            else:
+                message = 'expected %s, got end of input' % expected
+                if index:
+                    token = self.tokens[index - 1]
+                    self.failure = Diagnostic(message, token.line_num, token.column + len(token.value))
+                else:
+                    self.failure = Diagnostic(message, 1, 0)
+            self.failure_index = index
+        return None
+
+    # kind of the current token, or None at the end of the input
+    def peek(self):
+        try:
+            return self.tokens[self.current_token_index].kind
+        except IndexError:
+            return None
+
+    # grammar.txt statement rule -> method parsing it
+    STATEMENT_PARSERS = {
+        'print_stmt': 'parse_print_statement',
+        'let_stmt': 'parse_assignment_statement',
+        'if_stmt': 'parse_if_statement',
+        'goto_stmt': 'parse_goto_statement',
+        'gosub_stmt': 'parse_gosub_statement',
+        'return_stmt': 'parse_return_statement',
+        'for_stmt': 'parse_for_loop',
+        'next_stmt': 'parse_next_statement',
+        'on_stmt': 'parse_on_statement',
+        'def_stmt': 'parse_def_statement',
+        'data_stmt': 'parse_data_statement',
+        'read_stmt': 'parse_read_statement',
+        'restore_stmt': 'parse_restore_statement',
+        'end_stmt': 'parse_end_statement',
+        'rem_stmt': 'parse_remark_statement',
+    }
+    # token kinds that start a literal
+    LITERAL_KINDS = BASIC.first['literal']
+    # token kinds that start a statement, where error recovery resumes
+    STATEMENT_KINDS = BASIC.first['prog_stmt']
 
     def parse_statement(self):
-        token = self.tokens[self.current_token_index]
-        if token.kind == 'PRINT':
-            return self.parse_print_statement()
-        elif token.kind == 'LET':
-            return self.parse_assignment_statement()
-        elif token.kind == 'IF':
-            return self.parse_if_statement()
-        elif token.kind == 'GOTO':
-            return self.parse_goto_statement()
-        elif token.kind == 'GOSUB':
-            return self.parse_gosub_statement()
-        elif token.kind == 'RETURN':
-            return self.parse_return_statement()
-        elif token.kind == 'FOR':
-            return self.parse_for_loop()
-        elif token.kind == 'NEXT':
-            return self.parse_next_statement()
-        elif token.kind == 'END':
-            return self.parse_end_statement()
-        elif token.kind == 'REM':
-            return self.parse_remark_statement()
-        else:
+        parse = self.STATEMENT_DISPATCH.get(self.peek())
+        if parse is None:
             return None
+        return parse(self)
     
     def parse_print_statement(self):
         # consume the PRINT token
@@ -53,13 +305,15 @@ class Parser:
         # parse the condition
         condition = self.parse_expression()
         # check for the THEN token
-        if self.tokens[self.current_token_index].kind != 'THEN':
-            return None
+        if self.peek() != 'THEN':
+            return self.fail('THEN')
         self.current_token_index += 1
         # parse the statement to be executed if the condition is true
         true_statement = self.parse_statement()
+        if true_statement is None:
+            return self.fail('a statement')
         # check for an ELSE clause
-        if self.current_token_index < len(self.tokens) and self.tokens[self.current_token_index].kind == 'ELSE':
+        if self.peek() == 'ELSE':
             self.current_token_index += 1
             # parse the statement to be executed if the condition is false
             false_statement = self.parse_statement()
@@ -71,13 +325,13 @@ class Parser:
         # consume the LET token
         self.current_token_index += 1
         # parse the variable being assigned to
-        variable        = self.tokens[self.current_token_index]
-        if variable.kind != 'ID':
-            return None
+        if self.peek() != 'ID':
+            return self.fail('ID')
+        variable = self.tokens[self.current_token_index]
         self.current_token_index += 1
         # check for the equals sign
-        if self.tokens[self.current_token_index].kind != 'EQ':
-            return None
+        if self.peek() != 'EQ':
+            return self.fail('EQ')
         self.current_token_index += 1
         # parse the expression being assigned
         expression = self.parse_expression()
@@ -87,9 +341,9 @@ class Parser:
         # consume the GOTO token
         self.current_token_index += 1
         # parse the line number
+        if self.peek() != 'NUMBER':
+            return self.fail('a line number')
         line_number = self.tokens[self.current_token_index]
-        if line_number.kind != 'NUMBER':
-            return None
         self.current_token_index += 1
         return ('GOTO', line_number.value)
     
@@ -97,9 +351,9 @@ class Parser:
         # consume the GOSUB token
         self.current_token_index += 1
         # parse the line number
+        if self.peek() != 'NUMBER':
+            return self.fail('a line number')
         line_number = self.tokens[self.current_token_index]
-        if line_number.kind != 'NUMBER':
-            return None
         self.current_token_index += 1
         return ('GOSUB', line_number.value)
     def parse_return_statement(self):
@@ -111,24 +365,24 @@ class Parser:
         # consume the FOR token
         self.current_token_index += 1
         # parse the loop variable
+        if self.peek() != 'ID':
+            return self.fail('ID')
         loop_variable = self.tokens[self.current_token_index]
-        if loop_variable.kind != 'ID':
-            return None
         self.current_token_index += 1
         # check for the equals sign
-        if self.tokens[self.current_token_index].kind != 'EQ':
-            return None
+        if self.peek() != 'EQ':
+            return self.fail('EQ')
         self.current_token_index += 1
         # parse the starting value
         start_value = self.parse_expression()
         # check for the TO token
-        if self.tokens[self.current_token_index].kind != 'TO':
-            return None
+        if self.peek() != 'TO':
+            return self.fail('TO')
         self.current_token_index += 1
         # parse the ending value
         end_value = self.parse_expression()
         # check for an optional STEP clause
-        if self.current_token_index < len(self.tokens) and self.tokens[self.current_token_index].kind == 'STEP':
+        if self.peek() == 'STEP':
             self.current_token_index += 1
             # parse the step value
             step_value = self.parse_expression()
@@ -142,12 +396,112 @@ class Parser:
         # consume the NEXT token
         self.current_token_index += 1
         # parse the loop variable
+        if self.peek() != 'ID':
+            return self.fail('ID')
         loop_variable = self.tokens[self.current_token_index]
-        if loop_variable.kind != 'ID':
-            return None
         self.current_token_index += 1
         return ('NEXT', loop_variable.value)
     
+    def parse_on_statement(self):
+        # consume the ON token
+        self.current_token_index += 1
+        # parse the expression selecting the target
+        selector = self.parse_expression()
+        # check for GOTO or GOSUB
+        jump = self.peek()
+        if jump != 'GOTO' and jump != 'GOSUB':
+            return self.fail('GOTO or GOSUB')
+        self.current_token_index += 1
+        # parse the line numbers, separated by commas
+        targets = []
+        while True:
+            if self.peek() != 'NUMBER':
+                return self.fail('a line number')
+            targets.append(self.tokens[self.current_token_index].value)
+            self.current_token_index += 1
+            if self.peek() != 'COMMA':
+                break
+            self.current_token_index += 1
+        return ('ON', selector, jump, targets)
+
+    def parse_def_statement(self):
+        # consume the DEF token
+        self.current_token_index += 1
+        # check for the FN token
+        if self.peek() != 'FN':
+            return self.fail('FN')
+        self.current_token_index += 1
+        # parse the function name
+        if self.peek() != 'ID':
+            return self.fail('ID')
+        name = self.tokens[self.current_token_index].value
+        self.current_token_index += 1
+        # parse the parameters, in parentheses and separated by commas
+        if self.peek() != 'LPAREN':
+            return self.fail('LPAREN')
+        self.current_token_index += 1
+        parameters = []
+        while True:
+            if self.peek() != 'ID':
+                return self.fail('ID')
+            parameters.append(self.tokens[self.current_token_index].value)
+            self.current_token_index += 1
+            if self.peek() != 'COMMA':
+                break
+            self.current_token_index += 1
+        if self.peek() != 'RPAREN':
+            return self.fail('RPAREN')
+        self.current_token_index += 1
+        # check for the equals sign
+        if self.peek() != 'EQ':
+            return self.fail('EQ')
+        self.current_token_index += 1
+        # parse the function body; FN F(X) is called as F(X)
+        expression = self.parse_expression()
+        return ('DEF', name, parameters, expression)
+
+    def parse_data_statement(self):
+        # consume the DATA token
+        self.current_token_index += 1
+        # parse the numbers and strings, separated by commas; they are
+        # converted once here, for READ to take as they are
+        values = []
+        while True:
+            if self.peek() != 'NUMBER' and self.peek() != 'STRING':
+                return self.fail('a number or a string')
+            values.append(literal_value(self.tokens[self.current_token_index].value))
+            self.current_token_index += 1
+            if self.peek() != 'COMMA':
+                break
+            self.current_token_index += 1
+        return ('DATA', values)
+
+    def parse_read_statement(self):
+        # consume the READ token
+        self.current_token_index += 1
+        # parse the variables, separated by commas
+        names = []
+        while True:
+            if self.peek() != 'ID':
+                return self.fail('ID')
+            names.append(self.tokens[self.current_token_index].value)
+            self.current_token_index += 1
+            if self.peek() != 'COMMA':
+                break
+            self.current_token_index += 1
+        return ('READ', names)
+
+    def parse_restore_statement(self):
+        # consume the RESTORE token
+        self.current_token_index += 1
+        # parse the optional line number to read from, on the same line
+        line_num = self.tokens[self.current_token_index - 1].line_num
+        if self.peek() != 'NUMBER' or self.tokens[self.current_token_index].line_num != line_num:
+            return ('RESTORE', None)
+        line_num = self.tokens[self.current_token_index].value
+        self.current_token_index += 1
+        return ('RESTORE', line_num)
+
     def parse_end_statement(self):
         # consume the END token
         self.current_token_index += 1
@@ -156,111 +510,154 @@ class Parser:
     def parse_remark_statement(self):
         # consume the REM token
         self.current_token_index += 1
-        # parse the rest of the line as the remark
+        # parse the rest of the line as the remark; the lexer drops the EOL,
+        # so the line ends where the line number changes
+        line_num = self.tokens[self.current_token_index - 1].line_num
         remark = ''
-        while self.current_token_index < len(self.tokens) and self.tokens[self.current_token_index].kind != 'EOL':
+        while (self.current_token_index < len(self.tokens)
+               and self.tokens[self.current_token_index].line_num == line_num):
             remark += self.tokens[self.current_token_index].value
             self.current_token_index += 1
         return ('REM', remark)
     
-    def parse_expression(self):
-        # parse a term
-        term = self.parse_term()
-        if not term:
+    # Binary operators for precedence climbing: kind -> (precedence, node
+    # tag, right associative).  The levels follow grammar.txt: expr_lgc
+    # (OR, AND), expr_eql (comparisons), expr_opmed (ADD, SUB), expr_ophigh
+    # (MUL, DIV), and POW binding tighter than the unary signs.
+    BINARY_OPERATORS = {
+        'OR':   (1, 'LOGIC', False),
+        'AND':  (2, 'LOGIC', False),
+        'LEQ':  (4, 'COMPARE', False),
+        'EQ':   (4, 'COMPARE', False),
+        'NEQ':  (4, 'COMPARE', False),
+        'LSS':  (4, 'COMPARE', False),
+        'GRT':  (4, 'COMPARE', False),
+        'GREQ': (4, 'COMPARE', False),
+        'ADD':  (5, 'EXPR', False),
+        'SUB':  (5, 'EXPR', False),
+        'MUL':  (6, 'TERM', False),
+        'DIV':  (6, 'TERM', False),
+        'POW':  (8, 'POWER', True),
+    }
+    # prefix operators and the precedence their operand is parsed at
+    UNARY_OPERATORS = {
+        'NOT': 3,
+        'ADD': 7,
+        'SUB': 7,
+    }
+
+    # expression parsing by precedence climbing: binary operators become
+    # (tag, operator, left, right), e.g. ('EXPR', 'ADD', left, right)
+    def parse_expression(self, min_precedence=1):
+        left = self.parse_unary()
+        if left is None:
             return None
-        # check for additional terms separated by + or -
-        terms = [term]
-        while self.current_token_index < len(self.tokens) and self:
-          terms.append(self.parse_term())
-        # if we have more than one term, return a tuple representing the expression
-        if len(terms) > 1:
-            return ('EXPR', terms)
-        # otherwise, return the single term
-        return term
-    
-    def parse_term(self):
-        # parse a factor
-        factor = self.parse_factor()
-        if not factor:
+        operators = self.BINARY_OPERATORS
+        while self.current_token_index < len(self.tokens):
+            kind = self.peek()
+            operator = operators.get(kind)
+            if operator is None or operator[0] < min_precedence:
+                break
+            (precedence, tag, right_associative) = operator
+            self.current_token_index += 1
+            right = self.parse_expression(precedence if right_associative else precedence + 1)
+            if right is None:
+                return None
+            left = (tag, kind, left, right)
+        return left
+
+    def parse_unary(self):
+        kind = self.peek()
+        precedence = self.UNARY_OPERATORS.get(kind)
+        if precedence is None:
+            return self.parse_factor()
+        self.current_token_index += 1
+        operand = self.parse_expression(precedence)
+        if operand is None:
             return None
-        # check for additional factors separated by * or /
-        factors = [factor]
-        while self.current_token_index < len(self.tokens) and self.tokens[self.current_token_index].kind in ['MUL', 'DIV', 'MOD']:
-            factors.append(self.parse_factor())
-        # if we have more than one factor, return a tuple representing the term
-        if len(factors) > 1:
-            return ('TERM', factors)
-        # otherwise, return the single factor
-        return factor
+        if kind == 'NOT':
+            return ('UNARY', 'NOT', operand)
+        sign = -1 if kind == 'SUB' else 1
+        # signs fold into a factor: -X is ('FACTOR', -1, 'X')
+        if operand[0] == 'FACTOR':
+            return ('FACTOR', sign * operand[1], operand[2])
+        return ('FACTOR', sign, operand)
     
+    # literals, variables, calls and parenthesised expressions; signs are
+    # applied by parse_unary
     def parse_factor(self):
-        # check for a leading sign
-        sign = 1
-        if self.tokens[self.current_token_index].kind in ['ADD', 'SUB']:
-            if self.tokens[self.current_token_index].kind == 'SUB':
-                sign = -1
-            self.current_token_index += 1
         # check for an opening parenthesis
-        if self.tokens[self.current_token_index].kind == 'LPAREN':
+        if self.peek() == 'LPAREN':
             self.current_token_index += 1
             # parse the expression inside the parenthesis
             expression = self.parse_expression()
-            # check for the closing parenthesis
-            if self.tokens[self.current_token_index].kind != 'RPAREN':
+            if expression is None:
                 return None
+            # check for the closing parenthesis
+            if self.peek() != 'RPAREN':
+                return self.fail('RPAREN')
             self.current_token_index += 1
-            # return the expression inside the parenthesis with the correct sign
-            return ('FACTOR', sign, expression)
-        # check for a number
-        if self.tokens[self.current_token_index].kind in ['NUMBER', 'FLOAT_TYPE']:
+            # return the expression inside the parenthesis
+            return ('FACTOR', 1, expression)
+        # check for a number or a string
+        if self.peek() in self.LITERAL_KINDS:
             number = self.tokens[self.current_token_index]
             self.current_token_index += 1
-            # return the number with the correct sign
-            return ('FACTOR', sign, number.value)
+            # return the literal
+            return ('FACTOR', 1, number.value)
         # check for an identifier
-        if self.tokens[self.current_token_index].kind == 'ID':
+        if self.peek() == 'ID':
             identifier = self.tokens[self.current_token_index]
             self.current_token_index += 1
             # check for an opening parenthesis, indicating a function call
-            if self.current_token_index < len(self.tokens) and self.tokens[self.current_token_index].kind == 'LPAREN':
+            if self.peek() == 'LPAREN':
                 self.current_token_index += 1
                 # parse the arguments to the function
                 arguments = self.parse_arguments()
                 # check for the closing parenthesis
-                if self.tokens[self.current_token_index].kind != 'RPAREN':
-                    return None
+                if self.peek() != 'RPAREN':
+                    return self.fail('RPAREN')
                 self.current_token_index += 1
-                # return the function call with the correct sign
-                return ('FACTOR', sign, ('FUNC', identifier.value, arguments))
-            # return the identifier with the correct sign
-            return ('FACTOR', sign, identifier.value)
+                # return the function call
+                return ('FACTOR', 1, ('FUNC', identifier.value, arguments))
+            # return the identifier
+            return ('FACTOR', 1, identifier.value)
         # check for a function
-        if self.tokens[self.current_token_index].kind == 'FUNC':
+        if self.peek() == 'FUNC':
             func = self.tokens[self.current_token_index]
             self.current_token_index += 1
             # parse the arguments to the function
             arguments = self.parse_arguments()
             # check for the closing parenthesis
-            if self.tokens[self.current_token_index].kind != 'RPAREN':
-                return None
+            if self.peek() != 'RPAREN':
+                return self.fail('RPAREN')
             self.current_token_index += 1
-            # return the function call with the correct sign
-            return ('FACTOR', sign, ('FUNC', func.value[:-1], arguments))
+            # return the function call
+            return ('FACTOR', 1, ('FUNC', func.value[:-1], arguments))
         # if we couldn't parse a factor, return None
-        return None
+        return self.fail('an expression')
     
     def parse_arguments(self):
         # list to hold the arguments
         arguments = []
+        # no arguments
+        if self.peek() == 'RPAREN':
+            return arguments
         # parse the first argument
         argument = self.parse_expression()
         if argument:
             arguments.append(argument)
         # parse any additional arguments separated by commas
-        while self.current_token_index < len(self.tokens) and self.tokens[self.current_token_index].kind == 'COMMA':
+        while self.peek() == 'COMMA':
             self.current_token_index += 1
             argument = self.parse_expression()
             if argument:
                 arguments.append(argument)
         # return the list of arguments
         return arguments
+
+# The LL(1) table predicts the statement rule from its first token; the
+# statements with a parser above are dispatched straight to it
+Parser.STATEMENT_DISPATCH = {kind: getattr(Parser, Parser.STATEMENT_PARSERS[rule])
+                             for (kind, rule) in BASIC.dispatch('prog_stmt').items()
+                             if rule in Parser.STATEMENT_PARSERS}
@@ -0,0 +1,245 @@
+import sys
+
+from engine import is_name
+from parser_1 import nested_statements
+
+# Symbol resolution for vintage_fe and parser_1 trees.
+#
+# Every identifier is interned, and every variable, array and function is
+# given a dense integer slot in the frame it lives in.  In the resolved
+# tree a name is the node ('SLOT', name, depth, index): slot index of the
+# frame at lexical depth depth, the globals being depth 0.  Each name
+# resolves to the one SLOT tuple of its declaration, shared by every use.
+#
+# This is a resolution pass: it checks the vintage_fe scoping rules and
+# says where each name lives.  The engine keeps its dict environment;
+# indexing a list frame instead measured within noise of it, as a name's
+# hash is cached in the string and a dict lookup costs little more than
+# indexing a list.
+#
+# vintage_fe: variables, arrays and functions share one namespace and are
+# declared before they are used.  A function is declared in the scope it
+# appears in before its body is resolved, so it can call itself.  Its
+# formal arguments and the variables declared in its body get a frame of
+# their own, one level deeper.  A block is a scope of its own in the frame
+# it is in.  Declaring a name twice in a scope, or using one that was not
+# declared, raises ValueError.
+#
+# parser_1: variables are global and come into being when first used; a
+# DEF FN function's parameters are the frame of the function.  Functions
+# are a namespace of their own (FNA and A are different things), the frame
+# in SymbolTable.functions, and are known before their DEF, as the engine
+# defines them for the whole program.  Builtin calls keep their names.
+#
+# The trees are walked without recursion, so trees from the explicit-stack
+# parser of any depth can be resolved.
+
+# a frame: the name in each of its slots
+class Frame:
+    __slots__ = ('name', 'depth', 'names')
+
+    def __init__(self, name, depth):
+        # the function the frame is for, None for the globals
+        self.name = name
+        self.depth = depth
+        self.names = []
+
+    def allocate(self, name):
+        self.names.append(name)
+        return len(self.names) - 1
+
+    def __len__(self):
+        return len(self.names)
+
+    def __str__(self):
+        return '%s (depth %d): %s' % (self.name or 'globals', self.depth, ', '.join(
+            '%d %s' % (index, name) for (index, name) in enumerate(self.names)))
+
+class SymbolTable:
+    def __init__(self):
+        self.globals = Frame(None, 0)
+        # every frame, in the order they were opened
+        self.frames = [self.globals]
+        # the frames open now, innermost last, and the scopes open in each:
+        # name -> SLOT node
+        self.open = [self.globals]
+        self.scopes = [[{}]]
+        # the frame of parser_1 DEF FN functions
+        self.functions = Frame('functions', 0)
+        self.function_slots = {}
+
+    def slot(self, frame, name):
+        return ('SLOT', name, frame.depth, frame.allocate(name))
+
+    # name in the innermost scope; ValueError if it is there already
+    def declare(self, name):
+        name = sys.intern(name)
+        scope = self.scopes[-1][-1]
+        if name in scope:
+            raise ValueError("symbol {} already declared".format(name))
+        node = scope[name] = self.slot(self.open[-1], name)
+        return node
+
+    # the SLOT node of name in the innermost scope that has it; with
+    # implicit a name no scope has is declared as a global, otherwise it
+    # is a ValueError
+    def lookup(self, name, implicit=False):
+        for scopes in reversed(self.scopes):
+            for scope in reversed(scopes):
+                if name in scope:
+                    return scope[name]
+        if not implicit:
+            raise ValueError("symbol {} not declared".format(name))
+        name = sys.intern(name)
+        node = self.scopes[0][0][name] = self.slot(self.globals, name)
+        return node
+
+    def function(self, name):
+        if name not in self.function_slots:
+            name = sys.intern(name)
+            self.function_slots[name] = self.slot(self.functions, name)
+        return self.function_slots[name]
+
+    def push_scope(self):
+        self.scopes[-1].append({})
+
+    def pop_scope(self):
+        self.scopes[-1].pop()
+
+    def push_frame(self, name):
+        frame = Frame(name, len(self.open))
+        self.frames.append(frame)
+        self.open.append(frame)
+        self.scopes.append([{}])
+        return frame
+
+    def pop_frame(self):
+        self.open.pop()
+        self.scopes.pop()
+
+    def __str__(self):
+        frames = self.frames + ([self.functions] if len(self.functions) else [])
+        return '\n'.join(str(frame) for frame in frames)
+
+# Rebuild a tree of tuples and lists, calling enter(node) on each tuple on
+# the way down and leave(node) on the way up.  enter returns the node to
+# descend into, and leave the node to put in its place; a SLOT node, or
+# any tuple with a kind in leaves, is not descended into.  Each frame is a
+# node, the index of its next child and its children so far.
+def transform(tree, enter, leave, leaves=()):
+    stops = ('SLOT',) + tuple(leaves)
+    if isinstance(tree, tuple):
+        tree = enter(tree)
+        if tree[0] in stops:
+            return tree
+    elif not isinstance(tree, list):
+        return tree
+    stack = [[tree, 0, []]]
+    while True:
+        frame = stack[-1]
+        (node, index, children) = frame
+        # take the children up to the next one to descend into
+        while index < len(node):
+            child = node[index]
+            index += 1
+            if isinstance(child, tuple):
+                child = enter(child)
+                if child[0] not in stops:
+                    break
+            elif isinstance(child, list):
+                break
+            children.append(child)
+        else:
+            stack.pop()
+            for (new, old) in zip(children, node):
+                if new is not old:
+                    node = tuple(children) if isinstance(node, tuple) else children
+                    break
+            if isinstance(node, tuple):
+                node = leave(node)
+            if not stack:
+                return node
+            stack[-1][2].append(node)
+            continue
+        frame[1] = index
+        stack.append([child, 0, []])
+
+class VintageResolver:
+    def __init__(self):
+        self.table = SymbolTable()
+
+    def enter(self, node):
+        kind = node[0]
+        table = self.table
+        if kind == 'ID':
+            return table.lookup(node[1])
+        elif kind == 'VARDECL' or kind == 'ARRAYDECL':
+            # the initializer is a constant, so the order does not matter
+            return (kind, table.declare(node[1][1])) + node[2:]
+        elif kind == 'FUNDECL':
+            (FUNDECL, (ID, name), type, args, body) = node
+            slot = table.declare(name)
+            table.push_frame(slot[1])
+            return (FUNDECL, slot, type, args, body)
+        elif kind == 'FORMALARG':
+            (FORMALARG, type, (ID, name)) = node
+            return (FORMALARG, type, table.declare(name))
+        elif kind == 'BLOCK':
+            table.push_scope()
+        return node
+
+    def leave(self, node):
+        if node[0] == 'FUNDECL':
+            self.table.pop_frame()
+        elif node[0] == 'BLOCK':
+            self.table.pop_scope()
+        return node
+
+# the vintage_fe tree with every ('ID', name) resolved to a SLOT node, and
+# its SymbolTable
+def resolve_vintage(tree):
+    resolver = VintageResolver()
+    tree = transform(tree, resolver.enter, resolver.leave, leaves=('CONST',))
+    return (tree, resolver.table)
+
+class BasicResolver:
+    def __init__(self, statements):
+        self.table = SymbolTable()
+        for statement in statements:
+            for node in nested_statements(statement):
+                if node[0] == 'DEF':
+                    self.table.function(node[1])
+
+    def variable(self, name):
+        return self.table.lookup(name, implicit=True)
+
+    def enter(self, node):
+        kind = node[0]
+        if kind == 'FACTOR':
+            if isinstance(node[2], str) and is_name(node[2]):
+                return ('FACTOR', node[1], self.variable(node[2]))
+        elif kind == 'FUNC':
+            if node[1] in self.table.function_slots:
+                return ('FUNC', self.table.function(node[1]), node[2])
+        elif kind == 'LET' or kind == 'FOR' or kind == 'NEXT':
+            return (kind, self.variable(node[1])) + node[2:]
+        elif kind == 'READ':
+            return ('READ', [self.variable(name) for name in node[1]])
+        elif kind == 'DEF':
+            (DEF, name, parameters, body) = node
+            self.table.push_frame(name)
+            parameters = [self.table.declare(parameter) for parameter in parameters]
+            return ('DEF', self.table.function(name), parameters, body)
+        return node
+
+    def leave(self, node):
+        if node[0] == 'DEF':
+            self.table.pop_frame()
+        return node
+
+# the parser_1 statements with every variable and DEF FN function
+# resolved to a SLOT node, and their SymbolTable
+def resolve_basic(statements):
+    resolver = BasicResolver(statements)
+    statements = transform(statements, resolver.enter, resolver.leave)
+    return (statements, resolver.table)
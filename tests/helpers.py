@@ -0,0 +1,12 @@
+# test doubles used by more than one test module
+
+def same_tokens(a, b):
+    return [str(t) for t in a] == [str(t) for t in b]
+
+# a lexer whose get_tokens() is a plain list
+class ListLexer:
+    def __init__(self, tokens):
+        self.tokens = tokens
+
+    def get_tokens(self):
+        return self.tokens
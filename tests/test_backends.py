@@ -0,0 +1,178 @@
+import io
+import random
+
+import pytest
+
+import engine
+import transpile
+import vm
+from corpus import LOOP_PROGRAMS, walk
+
+BACKENDS = {
+    'engine': lambda source, output: engine.compile_source(source).run(output),
+    'vm': lambda source, output: vm.compile_source(source).run(output),
+    'python': lambda source, output: transpile.run_source(source, output),
+}
+
+# what each backend prints for source, or the error it stops with
+def outputs(source, backends=BACKENDS):
+    results = {}
+    for (name, run) in backends.items():
+        output = io.StringIO()
+        try:
+            run(source, output)
+            results[name] = output.getvalue()
+        except Exception as e:
+            results[name] = '%s%s: %s' % (output.getvalue(), type(e).__name__, e)
+    return results
+
+def agree(source, backends=BACKENDS):
+    results = outputs(source, backends)
+    assert len(set(results.values())) == 1, (source, results)
+    return results['engine']
+
+NAMES = ['A', 'B', 'C', 'X']
+
+def random_expression(rng, depth=0):
+    if depth > 2 or rng.random() < 0.3:
+        return rng.choice(NAMES + ['0', '1', '2', '3', '0.5'])
+    r = rng.random()
+    if r < 0.1:
+        return 'not %s' % random_expression(rng, depth + 1)
+    if r < 0.2:
+        return '-(%s)' % random_expression(rng, depth + 1)
+    if r < 0.3:
+        return 'ABS(%s)' % random_expression(rng, depth + 1)
+    op = rng.choice(['+', '-', '*', '/', '<', '>', '=<', '=>', '<>', 'and', 'or'])
+    return '(%s %s %s)' % (random_expression(rng, depth + 1), op, random_expression(rng, depth + 1))
+
+def random_statement(rng, depth=0):
+    r = rng.random()
+    if r < 0.4:
+        return 'let %s == %s' % (rng.choice(NAMES), random_expression(rng))
+    if r < 0.6:
+        return 'print %s' % random_expression(rng)
+    if r < 0.8 and depth < 1:
+        return 'if %s then %s' % (random_expression(rng), random_statement(rng, depth + 1))
+    return 'let %s == %s' % (rng.choice(NAMES), random_expression(rng))
+
+def random_program(rng):
+    lines = []
+    for _ in range(rng.randint(1, 8)):
+        if rng.random() < 0.25:
+            name = rng.choice(['I', 'J'])
+            lines.append('for %s == 1 to %d %s;' % (name, rng.randint(1, 4), random_statement(rng)))
+            lines.extend(random_statement(rng) + ';' for _ in range(rng.randint(0, 2)))
+            lines.append('next %s;' % name)
+        else:
+            lines.append(random_statement(rng) + ';')
+    return '\n'.join(lines)
+
+def test_random_programs_agree():
+    rng = random.Random(5)
+    for _ in range(300):
+        agree(random_program(rng))
+
+# arithmetic a vectorised loop can run
+def random_arithmetic(rng, names, depth=0):
+    if depth > 2 or rng.random() < 0.3:
+        return rng.choice(names + ['1', '2', '3', '0.5'])
+    if rng.random() < 0.15:
+        return '%s(%s)' % (rng.choice(['ABS', 'INT']), random_arithmetic(rng, names, depth + 1))
+    op = rng.choice(['+', '-', '*', '/'])
+    return '(%s %s %s)' % (random_arithmetic(rng, names, depth + 1), op, random_arithmetic(rng, names, depth + 1))
+
+# a loop of LETs long enough to be vectorised, then what it left
+def random_loop(rng):
+    lines = ['let %s == %d;' % (name, rng.randint(-3, 3)) for name in NAMES]
+    body = []
+    written = []
+    for name in rng.sample(NAMES, rng.randint(1, 3)):
+        if rng.random() < 0.3:
+            # a running sum of terms that do not use it
+            others = [n for n in NAMES if n != name and n not in written] + ['I']
+            body.append('let %s == %s + %s;' % (name, name, random_arithmetic(rng, others)))
+        else:
+            body.append('let %s == %s;' % (name, random_arithmetic(rng, ['I'] + written)))
+        written.append(name)
+    step = rng.choice(['', ' step 2', ' step -1', ' step 0.5'])
+    bounds = '%d to %d' % ((rng.randint(64, 200), 1) if step == ' step -1' else (1, rng.randint(64, 200)))
+    lines.append('for I == %s%s %s' % (bounds, step, body[0]))
+    lines.extend(body[1:])
+    lines.append('next I;')
+    lines.append('print I; print %s;' % '; print '.join(NAMES))
+    return '\n'.join(lines)
+
+def test_vectorized_loops_agree(monkeypatch):
+    vectorize = pytest.importorskip('vectorize')
+    if vectorize.numpy is None:
+        pytest.skip('numpy is not installed')
+    results = []
+    run = vectorize.Kernel.run
+    def recording(self, *args):
+        results.append(run(self, *args))
+        return results[-1]
+    monkeypatch.setattr(vectorize.Kernel, 'run', recording)
+    backends = dict(BACKENDS, numpy=lambda source, output: engine.compile_source(source, vectorize=True).run(output))
+    rng = random.Random(6)
+    for _ in range(100):
+        agree(random_loop(rng), backends)
+    for source in LOOP_PROGRAMS:
+        agree(source, backends)
+    # most loops ran as kernels; the rest fell back on a division by zero
+    assert results.count(True) > 50
+
+@pytest.mark.parametrize('source', [
+    'gosub 3; end; print 5; print 6; return;',
+    'let I == 0;\nlet I == I + 1;\nif I < 3 then goto 2;\non I - 2 goto 5, 7;\nprint "FOUR"; end; print "FIVE";',
+    'for I == 1 to 3 for J == 1 to 2 print I * J;\nnext J;\nnext I;',
+    'for I == 10 to 1 step -3 print I;\nnext I;',
+    'print SQR(16) + ABS(-2);',
+    'print 1 / 0;',
+    'print 0 and 1 / 0;\nprint 2 or 1 / 0;\nprint 1 and 0 or 5;\nprint 0 or 1 / 0;',
+    'return;',
+    'next I;',
+    'for I == 1 to 2 for J == 1 to 2 print J;\nnext I;\nnext J;',
+])
+def test_control_flow_agrees(source):
+    agree(source)
+
+@pytest.mark.parametrize('source', [
+    'def fn F(X) == X * 2; print F(3);',
+    'def fn F(X) == X + Y;\nlet Y == 10;\nlet X == 7;\nprint F(1);\nprint X;',
+    'def fn G(X, Y) == X * Y + H(X);\ndef fn H(Z) == Z - 1;\nprint G(3, 4) + G(G(1, 2), 3);',
+    # the body's temporaries and the parameter survive a recursive call
+    'def fn F(N) == (N * 10) + ((N > 0) and F(N - 1));\nprint F(2);\nprint F(0) + F(1);',
+    'def fn C(N) == (N > 0) and C(N - 1); let N == 9; print C(5); print N;',
+    'def fn F(X) == X; print F(1, 2);',
+])
+def test_functions_agree(source):
+    agree(source)
+
+@pytest.mark.parametrize('source', [
+    'data 1, 2, 3; read A; read B, C; print A + B + C;',
+    'data 1, 2.5, "HI";\nread A, B;\nread C;\nprint A + B;\nprint C;\nrestore 6;\n'
+    'data 10, 20;\nread D;\nprint D;\nrestore;\nread E;\nprint E;',
+    'read A;',
+    'data 1; read A, B;',
+    'restore 40;',
+    'for I == 1 to 3 restore 2;\ndata 5, 6;\nread X, Y;\nprint X * Y + I;\nnext I;',
+    'data 7;\nlet I == 0;\nlet I == I + 1;\nrestore;\nread X;\nif I < 3 then goto 3;\nprint X + I;',
+])
+def test_data_agrees(source):
+    agree(source)
+
+@pytest.mark.parametrize('name', sorted(LOOP_PROGRAMS))
+def test_tree_walk_counts_the_same_statements(name):
+    program = engine.compile_source(LOOP_PROGRAMS[name])
+    assert walk(program) == program.run()
+
+def test_code_cache_is_bounded():
+    cache = transpile.CodeCache(4)
+    sources = ['print %d;' % i for i in range(10)]
+    for source in sources:
+        transpile.run_source(source, io.StringIO(), cache)
+    assert len(cache) == 4
+    code = transpile.compile_source(sources[-1], cache)
+    assert transpile.compile_source(sources[-1], cache) is code
+    assert transpile.compile_source(sources[-1], None) is not code
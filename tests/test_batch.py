@@ -0,0 +1,97 @@
+import marshal
+import os
+
+import pytest
+
+import batch
+import vintage_fe
+from corpus import VINTAGE_FUNCTION, sample_program
+from engine import parse_source
+
+def write(path, text):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text)
+    return str(path)
+
+def test_expand(tmp_path):
+    a = write(tmp_path / 'src' / 'a.bas', 'goto 10;')
+    b = write(tmp_path / 'src' / 'b.vfe', 'put 1 ;')
+    c = write(tmp_path / 'src' / 'sub' / 'c.bas', 'end;')
+    d = write(tmp_path / 'd.bas', 'end;')
+    # a directory gives every file under it, in order
+    assert list(batch.expand([str(tmp_path / 'src')])) == [a, b, c]
+    assert list(batch.expand([str(tmp_path / '**' / '*.bas')])) == sorted([a, c, d])
+    # a file named twice, or by a directory and a glob, is given once
+    assert list(batch.expand([d, c, str(tmp_path / 'src'), str(tmp_path / '*.bas'), d])) == [d, c, a, b]
+    with pytest.raises(ValueError) as error:
+        list(batch.expand([b, str(tmp_path / '*.none')]))
+    assert str(error.value) == 'no files match %s' % (tmp_path / '*.none')
+
+@pytest.fixture
+def sources(tmp_path):
+    vintage = ''.join(VINTAGE_FUNCTION % i for i in range(10))
+    files = [
+        (write(tmp_path / 'good.bas', sample_program(100)), None),
+        (write(tmp_path / 'bad.bas', 'let X == 1;\nlet == 2;'), 'line 2'),
+        (write(tmp_path / 'good.vfe', vintage), None),
+        (write(tmp_path / 'bad.vfe', 'int = 1 ;'), 'expected ID'),
+    ]
+    (tmp_path / 'binary.bas').write_bytes(b'\xff\xfe')
+    files.append((str(tmp_path / 'binary.bas'), 'cannot read'))
+    for i in range(10):
+        files.append((write(tmp_path / ('more%d.bas' % i), 'let X == %d;\nprint X;' % i), None))
+    return files
+
+def test_parse_files(sources):
+    paths = [path for (path, error) in sources]
+    for jobs in (2, 1):
+        results = list(batch.parse_files(paths, jobs=jobs, keep_trees=True))
+        assert [result.path for result in results] == paths
+        for (result, (path, error)) in zip(results, sources):
+            if error is None:
+                assert result.error is None, result.error
+                with open(path) as file:
+                    text = file.read()
+                if path.endswith('.bas'):
+                    tree = parse_source(text)[0]
+                    assert result.statements == len(tree)
+                else:
+                    tree = vintage_fe.parse(text)
+                    assert result.statements == len(tree[1]) == 10
+                assert marshal.loads(result.tree) == tree
+                assert result.size == len(text)
+                assert str(result).startswith('ok   %s: ' % path)
+            else:
+                assert error in result.error, result.error
+                assert result.statements == 0 and result.tree is None
+                assert str(result).startswith('FAIL %s: ' % path)
+    # trees are only sent back when asked for
+    assert all(result.tree is None for result in batch.parse_files(paths, jobs=2))
+    assert not batch.worker
+
+def test_parse_files_with_a_parser_and_a_cache(sources, tmp_path):
+    paths = [path for (path, error) in sources if path.endswith('.bas') and error is None]
+    cache = str(tmp_path / 'cache')
+    for _ in range(2):
+        results = list(batch.parse_files(paths, jobs=2, parser='basic', cache_directory=cache))
+        assert [result.error for result in results] == [None] * len(paths)
+    assert len(os.listdir(cache)) == len(paths)
+    # a BASIC file read as vintage_fe
+    [result] = batch.parse_files(paths[:1], parser='vintage')
+    assert result.error is not None
+
+def test_main(sources, tmp_path, capsys):
+    assert batch.main(['-j', '2', str(tmp_path)]) == 1
+    output = capsys.readouterr().out.splitlines()
+    assert sum(line.startswith('FAIL ') for line in output) == 3
+    assert output[-3].startswith('%d files, %d ok, 3 failed' % (len(sources), len(sources) - 3))
+    good = [path for (path, error) in sources if error is None]
+    assert batch.main(['-q', '-j', '2'] + good) == 0
+    assert not capsys.readouterr().out.startswith('ok ')
+    assert batch.main([str(tmp_path / '*.none')]) == 2
+    assert 'no files match' in capsys.readouterr().err
+
+def test_deep_tree_with_a_cache(tmp_path):
+    path = write(tmp_path / 'deep.bas', 'print ' + ' + '.join(['1'] * 3000) + ';')
+    [result] = batch.parse_files([path], jobs=1, cache_directory=str(tmp_path / 'cache'))
+    assert result.error is None and result.statements == 1
@@ -0,0 +1,80 @@
+import io
+import random
+
+import pytest
+
+from corpus import LOOP_PROGRAMS
+from engine import Program, parse_program
+from lexer import Lexer
+from parser_1 import Parser
+
+# what a program prints, and the error it stops with
+def run(statements, lines):
+    output = io.StringIO()
+    try:
+        Program(statements, lines).run(output)
+    except Exception as e:
+        return output.getvalue() + type(e).__name__
+    return output.getvalue()
+
+def same_after_pruning(source):
+    parser = Parser(Lexer(source))
+    statements = parser.parse()
+    graph = parser.control_flow()
+    assert graph is parser.control_flow()
+    (pruned, lines, dropped) = graph.pruned()
+    assert len(pruned) == len(statements) - dropped
+    assert run(pruned, lines) == run(statements, parser.statement_lines)
+    return dropped
+
+@pytest.mark.parametrize('source', list(LOOP_PROGRAMS.values()) + [
+    'for I == 1 to 3 for J == 1 to 2 print I * J; next J; next I; next K;',
+    'let I == 0; let I == I + 1; if I < 3 then goto 2; on I - 2 goto 5, 7; print "four"; end; print "five";',
+    'for I == 1 to 3 print I; if I == 2 then next I; print "x"; next I;',
+])
+def test_pruning_keeps_behaviour(source):
+    same_after_pruning(source)
+
+def test_dead_code_is_dropped():
+    source = ('rem START; let X == 1; goto 4;\nprint "dead"; rem DEAD;\nlet X == 2;\n'
+              'print X; end; print "after end";\ndef fn F(A) == A + 1;\nrem TAIL;')
+    assert same_after_pruning(source) >= 3
+    assert same_after_pruning('gosub 3; end; rem SUB; print 5; return; print "dead";') == 1
+
+def random_statement(rng, lines):
+    r = rng.random()
+    if r < 0.15:
+        return 'goto %d' % rng.randint(1, lines)
+    if r < 0.22:
+        return 'end'
+    if r < 0.3:
+        return 'rem HI'
+    if r < 0.38:
+        return 'if A < %d then goto %d' % (rng.randint(0, 5), rng.randint(1, lines))
+    if r < 0.45:
+        return 'gosub %d' % rng.randint(1, lines)
+    if r < 0.5:
+        return 'return'
+    if r < 0.6:
+        return 'for I == 1 to 2'
+    if r < 0.68:
+        return 'next I'
+    return rng.choice(['let A == A + 1', 'print A', 'print I'])
+
+def test_random_programs_keep_behaviour():
+    rng = random.Random(5)
+    tested = 0
+    while tested < 300:
+        count = rng.randint(2, 10)
+        body = [random_statement(rng, count + 1) for _ in range(count)]
+        # only jumps forward, so every program ends
+        if any(s.split()[0] in ('goto', 'gosub', 'if') and int(s.split()[-1]) <= line
+               for (line, s) in enumerate(body, 2)):
+            continue
+        source = 'let A == 0;\n' + ''.join(s + ';\n' for s in body)
+        try:
+            parse_program(source)
+        except SyntaxError:
+            continue
+        same_after_pruning(source)
+        tested += 1
@@ -0,0 +1,75 @@
+import io
+import json
+import tracemalloc
+from contextlib import redirect_stdout
+
+import dumpast
+import vintage_fe
+from corpus import VINTAGE_FUNCTION, legacy_dumpast, sample_program
+from engine import parse_source
+
+def legacy(tree):
+    output = io.StringIO()
+    with redirect_stdout(output):
+        legacy_dumpast(tree)
+    return output.getvalue()
+
+TREES = [
+    parse_source(sample_program(300))[0],
+    vintage_fe.parse(''.join(VINTAGE_FUNCTION % i for i in range(30))),
+    ('A',), [], ('A', [], 1.5, None, True, 'x y'), [[1], [('B',)]], 5, 'str',
+]
+
+def test_tree_is_byte_identical_to_legacy():
+    for tree in TREES:
+        assert dumpast.dumps(tree) == legacy(tree)
+
+def test_dumpast_writes_to_stdout():
+    output = io.StringIO()
+    with redirect_stdout(output):
+        dumpast.dumpast(TREES[0])
+    assert output.getvalue() == legacy(TREES[0])
+
+def test_sexp_and_ndjson():
+    tree = ('A', [], 1.5, None, True, 'x y', '', 'a(b', -3)
+    assert dumpast.dumps(tree, 'sexp') == '(A [] 1.5 None True "x y" "" "a(b" -3)\n'
+    assert dumpast.dumps(tree, 'ndjson') == '["A",[],1.5,null,true,"x y","","a(b",-3]\n'
+    lines = dumpast.dumps(TREES[1], 'ndjson').splitlines()
+    assert len(lines) == len(TREES[1][1])
+    assert [json.loads(line)[0] for line in lines] == [s[0] for s in TREES[1][1]]
+
+def test_unknown_format():
+    try:
+        dumpast.dumps(('A',), 'xml')
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('xml was accepted')
+
+def nested(depth):
+    tree = ('X',)
+    for _ in range(depth):
+        tree = ('N', tree, [tree[0]])
+    return tree
+
+def test_deep_tree():
+    assert dumpast.dumps(nested(300)) == legacy(nested(300))
+    lines = dumpast.dumps(nested(5000)).split('\n')
+    assert len(lines) == 2 * 5000 + 3
+    assert lines[-2] == '  |[ N])'
+    assert lines[5001] == '  |' * 5000 + '(X) '
+
+# the indents of a deep tree are written as they are made, not all held
+def test_deep_tree_memory():
+    tree = nested(3000)
+    written = [0]
+    def write(text):
+        written[0] += len(text)
+    tracemalloc.start()
+    try:
+        dumpast.write_tree(tree, write)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert written[0] > 25000000
+    assert peak < 1000000
@@ -0,0 +1,85 @@
+import gc
+
+import vintage_fe
+from corpus import VINTAGE_FUNCTION, sample_program
+from engine import parse_source
+from hashcons import NodeFactory
+from lexer import Lexer
+from parser_1 import Parser
+
+# every tuple and list in a tree, outermost first
+def nodes(tree):
+    found = []
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, (tuple, list)):
+            found.append(node)
+            stack.extend(reversed(node))
+    return found
+
+def vintage(i):
+    return vintage_fe.parse(VINTAGE_FUNCTION % i)
+
+def test_trees_equal_the_plain_ones():
+    factory = NodeFactory()
+    source = sample_program(200)
+    assert Parser(Lexer(source), factory).parse() == Parser(Lexer(source)).parse()
+    text = ''.join(VINTAGE_FUNCTION % i for i in range(20))
+    assert vintage_fe.parse(text, factory=factory) == vintage_fe.parse(text)
+    assert vintage_fe.parse(text, True, factory) == vintage_fe.parse(text)
+    tree = ('A', [], 1, 1.0, True, -0.0, 0.0, [1.0, 1, None, 'x'], ('A', [], 1))
+    interned = factory.intern(tree)
+    assert interned == tree
+    # equal numbers of other types, and the zeros, are not merged
+    assert [type(x) for x in interned[2:5]] == [int, float, bool]
+    assert str(interned[5]) == '-0.0' and str(interned[6]) == '0.0'
+
+def test_shared_subtrees_are_the_same_objects():
+    factory = NodeFactory()
+    (first, second) = (factory.intern(vintage(1)), factory.intern(vintage(2)))
+    # the functions differ only in their names
+    (body1, body2) = (first[1][0][4], second[1][0][4])
+    assert body1 is body2
+    # lists are shared as well, so an interned tree must not be changed
+    (args1, args2) = (first[1][0][3][1], second[1][0][3][1])
+    assert isinstance(args1, list) and args1 is args2
+    assert first[1][0][1] is not second[1][0][1]
+    assert factory.intern(vintage(1)) is first
+    # the same subtree within a tree is one object too
+    statements = factory.intern(parse_source('let X == Y * 2;\nprint Y * 2;\nlet X == Y * 2;')[0])
+    assert statements[0] is statements[2]
+    assert statements[0][2] is statements[1][1]
+    assert factory.stats()['shared'] > 0
+
+def test_collect_keeps_the_nodes_in_use():
+    factory = NodeFactory()
+    kept = factory.intern(parse_source(sample_program(50))[0])
+    for i in range(5):
+        factory.intern(parse_source('let Z%d == Q * %d + R;\nprint Z%d / (Q - %d);' % (i, i, i, i))[0])
+    gc.collect()
+    before = len(factory.table)
+    dropped = factory.collect()
+    assert dropped > 0 and len(factory.table) == before - dropped
+    # what is kept still interns to the same objects
+    again = factory.intern(parse_source(sample_program(50))[0])
+    assert again is kept
+    assert all(a is b for (a, b) in zip(nodes(again), nodes(kept)))
+    # and everything in the table is in the kept tree
+    in_use = {id(node) for node in nodes(kept)}
+    assert all(id(node) in in_use for node in factory.table.values())
+
+def test_collect_drops_what_is_unused():
+    factory = NodeFactory()
+    tree = factory.intern(vintage(3))
+    count = len(factory.table)
+    assert factory.collect() == 0
+    del tree
+    gc.collect()
+    dropped = factory.collect()
+    assert 0 < dropped <= count
+    # what is left is held by vintage_fe itself, as the constants it puts
+    # in every tree
+    in_use = {id(node) for node in nodes(vintage(4))}
+    assert len(factory.table) == count - dropped
+    assert all(id(node) in in_use for node in factory.table.values())
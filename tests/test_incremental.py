@@ -0,0 +1,90 @@
+import random
+
+from corpus import SAMPLE_LINES, sample_program
+from helpers import same_tokens
+from incremental import Document
+from lexer import Lexer
+from parser_1 import Parser
+
+PIECES = ['goto 10;', ' "a;b" ', '"', '1.5', 'gosub 7', ';', 'X', 'next I', ' ', 'return;', 'end',
+          'for I == 1 to 2', 'if X then', '+ 1', 'let X == 1 +', 'rem A B', 'restore', '\n', 'print']
+
+def full_parse(text):
+    parser = Parser(Lexer(text))
+    statements = parser.parse()
+    return (statements, [str(e) for e in parser.errors])
+
+def test_random_edits_match_a_fresh_document():
+    rng = random.Random(5)
+    for _ in range(200):
+        text = ''.join(rng.choice(PIECES) for _ in range(rng.randint(0, 20)))
+        document = Document(text)
+        for _ in range(10):
+            offset = rng.randint(0, len(text))
+            deleted = rng.randint(0, min(5, len(text) - offset))
+            inserted = ''.join(rng.choice(PIECES) for _ in range(rng.randint(0, 2)))
+            document.edit(offset, deleted, inserted)
+            text = text[:offset] + inserted + text[offset + deleted:]
+            assert document.text == text
+            fresh = Document(text)
+            assert same_tokens(list(document.tokens()), Lexer(text).get_tokens()), text
+            assert document.statements() == fresh.statements()
+            assert (document.token_count, document.statement_count) == (fresh.token_count, fresh.statement_count)
+            assert document.starts == fresh.starts
+            assert (document.statements(), [str(e) for e in document.errors()]) == full_parse(text), text
+
+def test_edits_match_a_full_parse():
+    rng = random.Random(6)
+    lines = sample_program(200).split('\n')
+    document = Document('\n'.join(lines))
+    for _ in range(100):
+        line = rng.randrange(len(lines))
+        offset = sum(len(l) + 1 for l in lines[:line])
+        replacement = rng.choice(SAMPLE_LINES)
+        stats = document.edit(offset, len(lines[line]), replacement)
+        lines[line] = replacement
+        text = '\n'.join(lines)
+        assert document.statements() == Parser(Lexer(text)).parse()
+        # the line, and the one before when the token after it changed
+        assert stats.segments_relexed <= 2
+
+# a statement running on past its EOL is parsed with the lines it takes
+def test_statement_continued_on_the_next_line():
+    for text in ['if X == 1 then;\nprint X;', 'for I == 1 to 3;\nprint I;\nnext I;',
+                 'let X == 1 +;\n2;\nprint X;', 'print X;\n+ 1;', 'rem A;\nrestore;\n10;']:
+        document = Document(text)
+        assert (document.statements(), [str(e) for e in document.errors()]) == full_parse(text), text
+    document = Document('if X == 1 then;\nprint X;')
+    assert [s[0] for s in document.statements()] == ['IF']
+    assert len(document.segments) == 1
+
+def test_editing_a_body_onto_the_line_before():
+    document = Document('print 1;\nfor I == 1 to 3;\nlet Y == 2;\nnext I;')
+    offset = document.text.index('let')
+    document.edit(offset, len('let Y == 2'), 'print I')
+    text = 'print 1;\nfor I == 1 to 3;\nprint I;\nnext I;'
+    assert document.text == text
+    assert document.statements() == Parser(Lexer(text)).parse()
+    # the body is edited with the FOR it belongs to
+    document.edit(document.text.index('print I') + len('print I'), 0, ' * 2')
+    assert document.statements() == Parser(Lexer(document.text)).parse()
+    assert document.statements()[1][5][1][:2] == ('TERM', 'MUL')
+
+def test_syntax_errors_are_kept():
+    document = Document('print 1;\nlet X == 1 +;\nprint 2;\ngoto 7;')
+    assert [str(e) for e in document.errors()] == [
+        "line 3, column 1: expected an expression, got PRINT 'print'",
+        'line 4, column 1: undefined line 7',
+    ]
+    document.edit(document.text.index('+'), 1, '')
+    assert [str(e) for e in document.errors()] == ['line 4, column 1: undefined line 7']
+    assert document.statements() == Parser(Lexer(document.text)).parse()
+
+def test_edit_out_of_range():
+    document = Document('goto 10;')
+    try:
+        document.edit(5, 10, '')
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('the edit was accepted')
@@ -0,0 +1,85 @@
+import io
+import json
+
+import vintage_fe
+from corpus import VINTAGE_FUNCTION, sample_program
+from instrument import Profiler, profile_basic, profile_vintage
+from lexer import Lexer
+from parser_1 import Parser
+
+# every function a namespace holds, directly or in its dicts and lists
+def functions(namespace):
+    found = {}
+    for (name, value) in vars(namespace).items():
+        found[name] = value
+        if isinstance(value, dict):
+            for (key, entry) in value.items():
+                found[(name, key)] = entry
+        elif isinstance(value, list):
+            for (index, entry) in enumerate(value):
+                found[(name, index)] = entry
+    return found
+
+def snapshot():
+    return (functions(vintage_fe), functions(Parser))
+
+def same(a, b):
+    return a.keys() == b.keys() and all(a[key] is b[key] for key in a)
+
+def test_rules_are_counted():
+    vintage = ''.join(VINTAGE_FUNCTION % i for i in range(5))
+    with Profiler() as profiler:
+        profile_vintage(vintage, profiler, format=None)
+        profile_basic(sample_program(100), profiler)
+    rules = profiler.to_dict()['rules']
+    # the statement lists nest, so stmt_list is counted at every level
+    assert rules['vintage_fe.stmt_list']['calls'] > 5
+    # the statement rules are reached through the dispatch dicts
+    assert rules['vintage_fe.stmt_while']['calls'] == 5
+    assert rules['vintage_fe.stmt_if']['calls'] == 5
+    assert rules['vintage_fe.primary_paren']['calls'] == 5
+    statements = Parser(Lexer(sample_program(100))).parse()
+    assert rules['parser_1.Parser.parse_for_loop']['calls'] == sum(s[0] == 'FOR' for s in statements)
+    assert rules['parser_1.Parser.parse_statement']['calls'] > len(statements)
+    assert all(rule['calls'] > 0 and rule['seconds'] >= 0 for rule in rules.values())
+    assert list(profiler.phases) == ['lex', 'parse']
+    assert profiler.counts['statements'] == 5 + len(statements)
+    # nothing is counted once the profiler is done
+    before = profiler.to_dict()
+    vintage_fe.parse(vintage)
+    Parser(Lexer(sample_program(100))).parse()
+    assert profiler.to_dict() == before
+
+def test_originals_are_restored():
+    before = snapshot()
+    profiler = Profiler()
+    with profiler:
+        during = snapshot()
+        assert not same(before[0], during[0]) and not same(before[1], during[1])
+        assert Parser.STATEMENT_DISPATCH['PRINT'] is not before[1][('STATEMENT_DISPATCH', 'PRINT')]
+        assert vintage_fe.stmt_table['ID'] is not before[0][('stmt_table', 'ID')]
+        assert vintage_fe.primary_alternatives[0] is not before[0][('primary_alternatives', 0)]
+        # instrumenting twice does not wrap the wrappers
+        profiler.instrument()
+        assert same(snapshot()[0], during[0])
+    after = snapshot()
+    assert same(before[0], after[0]) and same(before[1], after[1])
+    assert not profiler.patched
+    # restored after an error too
+    try:
+        with Profiler():
+            vintage_fe.parse('int = 1 ;')
+    except SyntaxError:
+        pass
+    after = snapshot()
+    assert same(before[0], after[0]) and same(before[1], after[1])
+
+def test_to_json_round_trips():
+    with Profiler() as profiler:
+        profile_vintage(VINTAGE_FUNCTION % 1, profiler, 'ndjson', io.StringIO())
+    stats = json.loads(profiler.to_json())
+    assert stats == profiler.to_dict()
+    assert list(stats['phases']) == ['lex', 'parse', 'dump']
+    assert stats['counts'] == {'tokens': profiler.counts['tokens'], 'statements': 1}
+    assert set(stats['rates']) == {'tokens_per_second', 'statements_per_second'}
+    assert json.loads(profiler.to_json(indent=2)) == stats
@@ -0,0 +1,112 @@
+import io
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+from corpus import VINTAGE_FUNCTION, legacy_lex, sample_program
+from helpers import same_tokens
+from lexer import Lexer, StreamingLexer, TokenList, TokenStream, VintageLexer
+
+PIECES = ['let X == 1;', 'goto 10;', ' "a;b" ', '"unterminated', '1.5', '=<', '=', '<',
+          'toast', 'print', 'X12', '\n', ';', '  ', '.', '7', 'gosub', 'FOO(', 'format',
+          'restore', 'and', 'or', 'not', '\t', '^', '(', ')', ',']
+
+def random_sources(seed, count, length=40):
+    rng = random.Random(seed)
+    for _ in range(count):
+        yield ''.join(rng.choice(PIECES) for _ in range(rng.randint(0, length)))
+
+def test_master_scanner_matches_legacy():
+    source = sample_program(2000)
+    assert same_tokens(Lexer(source).get_tokens(), legacy_lex(source))
+    for source in random_sources(1, 500):
+        assert same_tokens(Lexer(source).get_tokens(), legacy_lex(source)), source
+
+def test_iter_tokens_matches_buffer():
+    for source in random_sources(2, 300):
+        assert same_tokens(list(Lexer.iter_tokens(source)), Lexer(source).get_tokens()), source
+
+def test_iter_file_matches_buffer():
+    # a quote no token follows is kept to the end of the input
+    for source in list(random_sources(3, 200)) + ['"', 'let X == 1; "', 'print "A" "']:
+        expected = Lexer(source).get_tokens()
+        for chunk_size in (1, 2, 3, 7, 64):
+            tokens = list(Lexer.iter_file(io.StringIO(source), chunk_size))
+            assert same_tokens(tokens, expected), (source, chunk_size)
+
+def test_streaming_lexer_matches_buffer():
+    source = sample_program(500)
+    tokens = StreamingLexer(io.StringIO(source), 16).get_tokens()
+    assert same_tokens(list(tokens), Lexer(source).get_tokens())
+
+def test_from_path_matches_buffer(tmp_path):
+    path = tmp_path / 'source.bas'
+    for source in random_sources(4, 200):
+        path.write_text(source)
+        assert same_tokens(Lexer.from_path(str(path)).get_tokens(), Lexer(source).get_tokens()), source
+
+VINTAGE_PIECES = ['int x = 1;', 'foo', 'while', 'x_1', '"a b"', '"open', '// note "', '1.5', '.5',
+                  '7', '=<', '==', '=', '{', '}', '\n', ' ', '\t', '\r', '(', ')', '@']
+
+def fields(tokens):
+    return [(t.kind, t.value, t.line_num, t.column) for t in tokens]
+
+def test_vintage_iter_file_matches_iter_tokens():
+    rng = random.Random(6)
+    for _ in range(200):
+        source = ''.join(rng.choice(VINTAGE_PIECES) for _ in range(rng.randint(0, 40)))
+        expected = fields(VintageLexer.iter_tokens(source))
+        for chunk_size in (1, 3, 64):
+            assert fields(VintageLexer.iter_file(io.StringIO(source), chunk_size)) == expected, source
+
+def test_vintage_parse_from_text_and_file():
+    import vintage_fe
+    text = ''.join(VINTAGE_FUNCTION % i for i in range(50))
+    tree = vintage_fe.parse(text)
+    assert vintage_fe.parse(io.StringIO(text)) == tree
+    assert vintage_fe.parse_tokens(TokenStream(VintageLexer.iter_tokens(text))) == tree
+    tokens = TokenList(VintageLexer.iter_tokens('int x = 1'))
+    assert tokens.match('INTEGER_TYPE').kind == 'INTEGER_TYPE'
+    assert not tokens.end_of_file()
+    tokens.match('ID')
+    tokens.match('ASSIGN')
+    tokens.match('INTEGER')
+    assert tokens.end_of_file() and tokens.pointer().column == 9
+
+def same_buffers(a, b):
+    (x, y) = (a.tokens, b.tokens)
+    return ((x.kinds, x.starts, x.ends, x.lines, x.line_starts, a.line_num, a.line_start)
+            == (y.kinds, y.starts, y.ends, y.lines, y.line_starts, b.line_num, b.line_start)
+            and same_tokens(x, y))
+
+def test_parallel_matches_sequential():
+    rng = random.Random(5)
+    parts = ['print "A;B";', 'let X == 1;', '\n', 'print "multi\nline; x";', 'rem QUOTE;',
+             'goto 10;', '   ', 'printx;', ';', 'print "";']
+    with ProcessPoolExecutor(2) as executor:
+        for trial in range(10):
+            text = ''.join(rng.choice(parts) for _ in range(rng.randint(0, 1000)))
+            if trial % 3 == 0:
+                text += 'print "unterminated; ' + 'let Y == 2;' * 50
+            if trial % 4 == 0:
+                text = '"' + text
+            for min_chunk in (1, 100):
+                lexer = Lexer.parallel(text, 2, executor, min_chunk)
+                assert same_buffers(lexer, Lexer(text)), (trial, min_chunk)
+        text = 'int x = 1;\n' * 1000
+        assert same_buffers(VintageLexer.parallel(text, 2, executor, 64), VintageLexer(text))
+
+def test_split_points_end_on_eol():
+    text = sample_program(1000)
+    points = Lexer.split_points(text, 8)
+    assert all(text[point - 1] == ';' for point in points[1:-1])
+
+def test_token_stream_buffers_a_window():
+    source = sample_program(200)
+    expected = Lexer(source).get_tokens()
+    stream = TokenStream(Lexer.iter_tokens(source), 4)
+    tokens = []
+    while len(stream) > len(tokens):
+        tokens.append(stream[len(tokens)])
+        stream.release(len(tokens) - 1)
+    assert same_tokens(tokens, expected)
+    assert len(stream.ring) == 4
@@ -0,0 +1,156 @@
+import random
+
+import pytest
+
+import vintage_fe
+from corpus import ListStream, VintageToken
+from helpers import ListLexer
+from lexer import Lexer, Token, VintageLexer
+from ll1 import BASIC, EOF, VINTAGE
+from parser_1 import Parser
+
+# The tables are checked against the parsers with sentences derived from
+# them: each derivation the table itself parses must parse, to its last
+# token, as what it was derived from.
+
+# the number of terminals in the shortest sentence each nonterminal derives
+def shortest(grammar):
+    cost = {name: None for name in grammar.rules}
+    changed = True
+    while changed:
+        changed = False
+        for (name, alternatives) in grammar.rules.items():
+            for alt in alternatives:
+                costs = [1 if grammar.is_terminal(symbol) else cost[symbol] for symbol in alt]
+                if None not in costs and (cost[name] is None or sum(costs) < cost[name]):
+                    cost[name] = sum(costs)
+                    changed = True
+    return cost
+
+# a random sentence of token kinds derived from name; past depth the
+# shortest alternatives are taken, so the derivation ends.  Alternatives
+# starting with a nonterminal in avoid are not taken
+def derive(grammar, name, rng, avoid=(), depth=6):
+    cost = shortest(grammar)
+    sentence = []
+
+    def expand(name, depth):
+        alternatives = [alt for alt in grammar.rules[name] if not (alt and alt[0] in avoid)]
+        if depth <= 0:
+            least = min(sum(1 if grammar.is_terminal(s) else cost[s] for s in alt) for alt in alternatives)
+            alternatives = [alt for alt in alternatives
+                            if sum(1 if grammar.is_terminal(s) else cost[s] for s in alt) == least]
+        for symbol in rng.choice(alternatives):
+            if grammar.is_terminal(symbol):
+                sentence.append(symbol)
+            else:
+                expand(symbol, depth - 1)
+
+    expand(name, depth)
+    return sentence
+
+# whether the predict table of grammar parses kinds as name; where the
+# grammar is ambiguous (an optional exp after RETURN, say) a derivation
+# can take a way the table does not
+def predicted(grammar, name, kinds):
+    stack = [name]
+    position = 0
+    while stack:
+        symbol = stack.pop()
+        lookahead = kinds[position] if position < len(kinds) else EOF
+        if grammar.is_terminal(symbol):
+            if symbol != lookahead:
+                return False
+            position += 1
+            continue
+        index = grammar.predict[symbol].get(lookahead)
+        if index is None:
+            return False
+        stack.extend(reversed(grammar.rules[symbol][index]))
+    return position == len(kinds)
+
+# random sentences derived from name that the table parses
+def sentences(grammar, name, seed, count, avoid=()):
+    rng = random.Random(seed)
+    found = 0
+    while found < count:
+        kinds = derive(grammar, name, rng, avoid)
+        if predicted(grammar, name, kinds):
+            found += 1
+            yield kinds
+
+def terminals(grammar):
+    return {symbol for alternatives in grammar.rules.values() for alt in alternatives
+            for symbol in alt if grammar.is_terminal(symbol)}
+
+BASIC_VALUES = {'NUMBER': '1', 'STRING': '"A"', 'ID': 'X', 'FUNC': 'ABS('}
+
+def basic_tokens(kinds):
+    return [Token(kind, BASIC_VALUES.get(kind, kind.lower()), 1, i) for (i, kind) in enumerate(kinds)]
+
+# the rule of each statement with no parser
+UNPARSED = {rule for alternatives in BASIC.rules['prog_stmt'] for (rule,) in [alternatives]
+            if rule not in Parser.STATEMENT_PARSERS}
+
+def test_tables_use_the_lexer_kinds():
+    assert terminals(BASIC) <= {kind for (kind, pattern) in Lexer.TOKEN_TYPES}
+    assert terminals(VINTAGE) <= {kind for (kind, pattern) in VintageLexer.TOKEN_TYPES}
+    assert not BASIC.conflicts or all(name.startswith('<') for (name, *rest) in BASIC.conflicts)
+
+@pytest.mark.parametrize('rule', sorted(Parser.STATEMENT_PARSERS))
+def test_basic_statements_parse(rule):
+    for kinds in sentences(BASIC, rule, rule, 200, UNPARSED):
+        parser = Parser(ListLexer(basic_tokens(kinds)))
+        statement = parser.parse_statement()
+        assert parser.failure is None, (kinds, str(parser.failure))
+        assert statement is not None and parser.current_token_index == len(kinds), kinds
+        assert parser.STATEMENT_PARSERS[rule] == parser.STATEMENT_DISPATCH[kinds[0]].__name__
+
+@pytest.mark.parametrize('rule', sorted(UNPARSED))
+def test_statements_without_a_parser_are_errors(rule):
+    kinds = derive(BASIC, rule, random.Random(rule))
+    parser = Parser(ListLexer(basic_tokens(kinds)))
+    parser.parse()
+    assert parser.statements == [] and parser.errors
+
+# PRINT takes the token after it when it can start an expression, and
+# fails at it otherwise
+def test_only_expressions_follow_print():
+    for (kind, pattern) in Lexer.TOKEN_TYPES:
+        parser = Parser(ListLexer(basic_tokens(['PRINT', kind])))
+        parser.parse()
+        rejected = bool(parser.errors) and parser.errors[0].column == 1
+        assert rejected != (kind in BASIC.first['expr']), kind
+
+@pytest.mark.parametrize('source', [
+    'print float;',
+    'let A == float + 1;',
+    'print 1, 2;',
+    'data float;',
+])
+def test_rejected(source):
+    parser = Parser(Lexer(source))
+    parser.parse()
+    assert parser.errors
+
+VINTAGE_VALUES = {'INTEGER': 1, 'FLOAT': 1.5, 'STRING': 'A', 'ID': 'x'}
+
+# an initializer that is not a constant is well formed, and refused after
+# it is parsed
+@pytest.mark.parametrize('iterative', [False, True])
+def test_vintage_statements_parse(iterative):
+    parsed = 0
+    for kinds in sentences(VINTAGE, 'stmt_list', 5, 500):
+        tokens = [VintageToken(kind, VINTAGE_VALUES.get(kind, kind.lower())) for kind in kinds]
+        try:
+            tree = vintage_fe.parse_tokens(ListStream(tokens), iterative)
+        except ValueError as e:
+            assert str(e) == 'only constants are allowed in initializers', kinds
+            continue
+        assert tree[0] == 'STMTLIST', kinds
+        parsed += 1
+    assert parsed > 250
+
+def test_void_function_without_parameters():
+    tree = vintage_fe.parse('void f() put 1;')
+    assert tree[1][0][2] == ('FUNCTION_TYPE', ('VOID_TYPE',), ('LIST', []))
@@ -0,0 +1,99 @@
+import io
+import random
+
+import fold
+import optimize
+from engine import Program, parse_source
+
+# what a program prints, and the kind of error it stops with
+def run(statements, lines):
+    output = io.StringIO()
+    try:
+        Program(statements, lines).run(output)
+    except Exception as e:
+        return output.getvalue() + type(e).__name__
+    return output.getvalue()
+
+def same_when_optimized(source):
+    (statements, lines) = parse_source(source)
+    expected = run(statements, lines)
+    assert run(fold.fold_basic(statements)[0], lines) == expected, source
+    (optimized, optimized_lines, stats) = optimize.optimize(statements, lines)
+    assert run(optimized, optimized_lines) == expected, source
+    return stats
+
+NAMES = ['A', 'B', 'C']
+
+def random_expression(rng, depth=0, functions=True):
+    r = rng.random()
+    if depth > 2 or r < 0.3:
+        return rng.choice(NAMES + ['1', '2', '0', '0.5', '3'])
+    if functions and r < 0.4:
+        return '%s(%s, %s)' % (rng.choice('FG'), random_expression(rng, depth + 1), random_expression(rng, depth + 1))
+    if r < 0.45:
+        return 'ABS(%s)' % random_expression(rng, depth + 1, functions)
+    if r < 0.5:
+        return '-%s' % random_expression(rng, depth + 1, functions)
+    op = rng.choice(['+', '-', '*', '/', '<', '==', 'and', 'or'])
+    return '(%s %s %s)' % (random_expression(rng, depth + 1, functions), op,
+                           random_expression(rng, depth + 1, functions))
+
+def random_program(rng):
+    lines = [
+        'def fn F(X, Y) == %s;' % random_expression(rng, 1, False).replace('A', 'X').replace('B', 'Y'),
+        'def fn G(X, Y) == F(X, Y) + %s;' % random_expression(rng, 2, False).replace('A', 'X'),
+    ]
+    if rng.random() < 0.1:
+        lines.append('let %s == "S";' % rng.choice(NAMES))
+    for _ in range(rng.randint(1, 6)):
+        statement = rng.choice(['let %s == %s' % (rng.choice(NAMES), random_expression(rng)),
+                                'print %s' % random_expression(rng),
+                                'if %s then print %s' % (random_expression(rng), random_expression(rng))])
+        if rng.random() < 0.2:
+            statement = 'for I == 1 to 3 %s;\nprint %s;\nnext I' % (statement, random_expression(rng))
+        lines.append(statement + ';')
+    return '\n'.join(lines)
+
+def test_random_programs_behave_the_same_optimized():
+    rng = random.Random(11)
+    for _ in range(1000):
+        source = random_program(rng)
+        try:
+            parse_source(source)
+        except SyntaxError:
+            continue
+        same_when_optimized(source)
+
+def test_an_argument_that_raises_is_evaluated():
+    source = ('def fn F(X, Y) == ((1 - 1) and (1 - Y));\n'
+              'let C == 1;\nprint F(C, C / (2 < 0));')
+    same_when_optimized(source)
+    # unused, or used after something else that can raise
+    same_when_optimized('def fn F(X, Y) == X; print F(1, 1 / 0);')
+    same_when_optimized('def fn F(X, Y) == SQR(-1) + X + Y; print F(1, "S" + 1);')
+
+def test_what_is_inlined():
+    def inlined(source):
+        return same_when_optimized(source)['inlined']
+    assert inlined('def fn D(X, Y) == SQR(X * X + Y * Y); let A == 3; print D(A, A == 1);') == 1
+    # -B raises when B is a string, and Y is read twice
+    assert inlined('def fn D(X, Y) == SQR(X * X + Y * Y); let B == 4; print D(1, -B);') == 0
+    # X is read once, ahead of anything else that can raise
+    assert inlined('def fn H(X, Y) == X * 2 + Y; let A == 3; print H(A / 2, A);') == 1
+    # Y * 2 can raise before X is read
+    assert inlined('def fn H(X, Y) == Y * 2 + X; let A == 3; print H(A / 2, A);') == 0
+    assert inlined('def fn H(X, Y) == (Y == 2) + X; let A == 3; print H(A / 2, A);') == 1
+    assert inlined('def fn H(X, Y) == X / Y; let A == 3; print H(A / 2, A * 2);') == 1
+    assert inlined('def fn H(X, Y) == Y / X; let A == 3; print H(A / 2, A * 2);') == 0
+
+# the right operand of AND and OR is not always evaluated, so what is only
+# there is not computed ahead of the statement
+def test_conditional_operand_is_not_shared():
+    source = 'let X == 0; print (X <> 0) and (Y / X > 1); print (X == 1) and (Y / X > 1);'
+    (statements, lines) = parse_source(source)
+    assert run(statements, lines) == '0\n0\n'
+    (optimized, optimized_lines, stats) = optimize.optimize(statements, lines)
+    assert run(optimized, optimized_lines) == '0\n0\n'
+    assert stats['shared'] == 0
+    # an occurrence every evaluation reaches is still shared
+    assert same_when_optimized('let X == 2; print (Y / X + 1) and (Y / X > 1); print Y / X + 1;')['shared'] > 0
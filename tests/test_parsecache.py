@@ -0,0 +1,118 @@
+import os
+
+import pytest
+
+import parsecache
+import vintage_fe
+from corpus import VINTAGE_FUNCTION, sample_program
+from dumpast import dumps
+from engine import parse_source
+from parsecache import MAGIC, SUFFIX, ParseCache
+
+def entries(directory):
+    return sorted(name for name in os.listdir(directory) if name.endswith(SUFFIX))
+
+def test_hit_gives_the_parsed_tree(tmp_path):
+    cache = ParseCache(str(tmp_path))
+    source = sample_program(100)
+    expected = parse_source(source)
+    for _ in range(2):
+        (statements, lines) = cache.parse_basic(source)
+        assert (statements, list(lines)) == (expected[0], list(expected[1]))
+        assert type(lines) is type(expected[1])
+    assert (cache.hits, cache.misses) == (1, 1)
+    text = ''.join(VINTAGE_FUNCTION % i for i in range(5))
+    assert cache.parse_vintage(text) == vintage_fe.parse(text)
+    assert cache.parse_vintage(text) == vintage_fe.parse(text)
+    assert cache.hits == 2
+    # another process sees the same entries
+    assert ParseCache(str(tmp_path)).get('basic', source) == (expected[0], list(expected[1]))
+    assert len(entries(tmp_path)) == 2
+
+@pytest.mark.parametrize('damage', [
+    lambda data: data[:len(data) // 2],
+    lambda data: data[:len(MAGIC)],
+    lambda data: b'',
+    lambda data: b'XXXX' + data[len(MAGIC):],
+    lambda data: MAGIC + b'\xff' * 16,
+])
+def test_damaged_entry_is_a_miss(tmp_path, damage):
+    cache = ParseCache(str(tmp_path))
+    source = sample_program(50)
+    cache.parse_basic(source)
+    path = cache.path('basic', source)
+    with open(path, 'rb') as file:
+        data = file.read()
+    with open(path, 'wb') as file:
+        file.write(damage(data))
+    assert cache.get('basic', source) is None
+    assert not os.path.exists(path)
+    (statements, lines) = cache.parse_basic(source)
+    assert statements == parse_source(source)[0]
+    assert cache.get('basic', source) is not None
+
+def test_key_changes_with_the_versions(tmp_path, monkeypatch):
+    module = tmp_path / 'modules' / 'fake_parser.py'
+    module.parent.mkdir()
+    module.write_text('VERSION = 1\n')
+    monkeypatch.syspath_prepend(str(module.parent))
+    rules = {'prog': [['stmt']]}
+    monkeypatch.setitem(parsecache.PARSERS, 'fake', (('fake_parser',), rules))
+    directory = str(tmp_path / 'cache')
+    path = ParseCache(directory).path('fake', 'text')
+    assert ParseCache(directory).path('fake', 'text') == path
+    assert ParseCache(directory).path('fake', 'other text') != path
+    assert ParseCache(directory).path('basic', 'text') != path
+    # the parser's source changes
+    module.write_text('VERSION = 2\n')
+    changed = ParseCache(directory).path('fake', 'text')
+    assert changed != path
+    # the grammar changes
+    monkeypatch.setitem(parsecache.PARSERS, 'fake', (('fake_parser',), {'prog': [['stmt', 'prog']]}))
+    assert ParseCache(directory).path('fake', 'text') not in (path, changed)
+
+def test_eviction_keeps_the_directory_under_max_bytes(tmp_path, monkeypatch):
+    # the size is looked at on every write
+    monkeypatch.setattr(parsecache, 'RESCAN', 1)
+    sources = [sample_program(20 + i) for i in range(40)]
+    cache = ParseCache(str(tmp_path))
+    cache.parse_basic(sources[0])
+    entry = os.path.getsize(cache.path('basic', sources[0]))
+    max_bytes = 10 * entry
+    cache = ParseCache(str(tmp_path), max_bytes)
+    for (i, source) in enumerate(sources):
+        cache.parse_basic(source)
+        os.utime(cache.path('basic', source), (i, i))
+        assert sum(os.path.getsize(tmp_path / name) for name in entries(tmp_path)) <= max_bytes
+    # the entries used longest ago went first
+    assert os.path.exists(cache.path('basic', sources[-1]))
+    assert not os.path.exists(cache.path('basic', sources[0]))
+    # a hit makes an entry the newest
+    kept = [source for source in sources if os.path.exists(cache.path('basic', source))]
+    assert cache.get('basic', kept[0]) is not None
+    assert os.path.getmtime(cache.path('basic', kept[0])) > len(sources)
+    cache.evict()
+    assert os.path.exists(cache.path('basic', kept[0]))
+    assert not any(name.endswith('.tmp') for name in os.listdir(tmp_path))
+
+def test_syntax_error_is_not_cached(tmp_path):
+    cache = ParseCache(str(tmp_path))
+    for _ in range(2):
+        with pytest.raises(SyntaxError):
+            cache.parse_basic('let == 2;')
+        with pytest.raises(SyntaxError):
+            cache.parse_vintage('int = 1 ;')
+    assert entries(tmp_path) == []
+    assert (cache.hits, cache.misses, cache.writes) == (0, 4, 0)
+
+# marshal refuses trees nested past its limit; they are parsed every time
+def test_deep_tree_is_not_cached(tmp_path):
+    cache = ParseCache(str(tmp_path))
+    source = 'print ' + ' + '.join(['1'] * 3000) + ';'
+    text = 'int x = 1 ; put ' + ' + '.join(['x'] * 3000) + ' ;'
+    for _ in range(2):
+        # compared as dumps, as == recurses
+        assert dumps(cache.parse_basic(source)[0]) == dumps(parse_source(source)[0])
+        assert dumps(cache.parse_vintage(text, iterative=True)) == dumps(vintage_fe.parse(text, iterative=True))
+    assert entries(tmp_path) == []
+    assert (cache.hits, cache.misses, cache.writes) == (0, 4, 0)
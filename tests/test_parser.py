@@ -0,0 +1,79 @@
+import io
+import tracemalloc
+
+from corpus import GeneratedSource, sample_program
+from helpers import ListLexer
+from lexer import Lexer, StreamingLexer, TokenStream
+from parser_1 import Parser
+
+BROKEN = '''let X == 1;
+let == 2;
+print (X + ;
+goto X;
+for I == 1 2 print I;
+if X then;
+print F(1, 2) + G();
+let Y == X X;
+gosub'''
+
+def test_streaming_parse_matches_full_parse():
+    source = sample_program(1000)
+    expected = Parser(Lexer(source)).parse()
+    assert Parser(StreamingLexer(io.StringIO(source), 8)).parse() == expected
+    assert Parser(TokenStream(Lexer.iter_tokens(source))).parse() == expected
+    assert list(Parser(Lexer(source)).iter_statements()) == expected
+
+def test_streaming_diagnostics_match():
+    expected = Parser(Lexer(BROKEN))
+    expected.parse()
+    assert len(expected.errors) > 5
+    streamed = Parser(StreamingLexer(io.StringIO(BROKEN)))
+    streamed.parse()
+    assert [str(e) for e in streamed.errors] == [str(e) for e in expected.errors]
+
+def test_generated_stream_is_parsed_to_the_end():
+    parser = Parser(StreamingLexer(GeneratedSource(1000)))
+    assert sum(1 for _ in parser.iter_statements()) == 4000
+
+def test_plain_token_list():
+    source = sample_program(100)
+    assert Parser(ListLexer(list(Lexer.iter_tokens(source)))).parse() == Parser(Lexer(source)).parse()
+
+def test_streaming_without_index_is_flat():
+    def peak(lines):
+        tracemalloc.start()
+        try:
+            parser = Parser(StreamingLexer(GeneratedSource(lines), 4096), index=False)
+            assert sum(1 for _ in parser.iter_statements()) == 4 * lines
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    # the index would take 32 bytes a line
+    assert peak(16000) < 1.5 * peak(2000)
+
+def test_lines_checked_without_index():
+    # lines 3 and 4 are empty
+    source = 'goto 3;\nprint 1;\n;;let X == 1; goto 4; gosub 12;\non X goto 1, 2, 3, 5, 6;\nrestore 9;\nrem;'
+    for lexer in (Lexer(source), StreamingLexer(io.StringIO(source), 4)):
+        parser = Parser(lexer, index=False)
+        assert parser.parse() == Parser(Lexer(source)).parse()
+        assert parser.statement_lines is None
+        expected = Parser(Lexer(source))
+        expected.parse()
+        assert [str(e) for e in parser.errors] == [str(e) for e in expected.errors]
+        assert len(parser.errors) == 4
+
+def test_remark_ends_at_the_line():
+    statements = Parser(Lexer('rem SOME TEXT;\nprint 1;')).parse()
+    assert [s[0] for s in statements] == ['REM', 'PRINT']
+    assert len(Parser(Lexer(sample_program(90))).parse()) == 90
+
+def test_program_index():
+    parser = Parser(Lexer('data 1, 2.5, "HI";\nread A, B;\nrestore 1;\ngoto 2;\ngosub 9;'))
+    parser.parse()
+    index = parser.index
+    assert list(index.starts) == [1, 2, 3, 4, 5]
+    assert index.data == [1, 2.5, 'HI']
+    assert index.restore('1') == 0
+    assert index.restore('2') == 3
+    assert [(target, line) for (target, line, column) in index.undefined()] == [('9', 5)]
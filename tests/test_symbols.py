@@ -0,0 +1,119 @@
+import pytest
+
+import symbols
+import vintage_fe
+from corpus import VINTAGE_FUNCTION
+from engine import parse_source
+
+# every SLOT node in a tree, in order
+def slots(tree):
+    found = []
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, tuple) and node and node[0] == 'SLOT':
+            found.append(node)
+        elif isinstance(node, (tuple, list)):
+            stack.extend(reversed(node))
+    return found
+
+# the SLOT nodes of each name, by name
+def uses(tree):
+    by_name = {}
+    for node in slots(tree):
+        by_name.setdefault(node[1], []).append(node)
+    return by_name
+
+VINTAGE = '''
+int g = 1 ;
+int f ( int a , int b ) {
+    int x = 2 ;
+    { int y = 3 ; y = a + x + g ; }
+    { int y = 4 ; put y ; }
+    int h ( int c ) return c + a ;
+    x = b + h ( x ) ;
+    return f ( x , g ) ;
+}
+put f ( g , 2 ) ;
+'''
+
+def test_uses_share_the_slot_of_their_declaration():
+    (tree, table) = symbols.resolve_vintage(vintage_fe.parse(VINTAGE))
+    by_name = uses(tree)
+    for (name, nodes) in by_name.items():
+        if name != 'y':
+            assert all(node is nodes[0] for node in nodes), name
+    # the two y are declared in blocks of their own
+    (first, second) = (by_name['y'][0], by_name['y'][-1])
+    assert first is not second
+    assert [node is first for node in by_name['y']] == [True, True, False, False]
+    assert [node is second for node in by_name['y']] == [False, False, True, True]
+    assert "('ID'," not in repr(tree)
+
+def test_depth_and_index():
+    (tree, table) = symbols.resolve_vintage(vintage_fe.parse(VINTAGE))
+    by_name = uses(tree)
+    where = {name: nodes[0][2:] for (name, nodes) in by_name.items()}
+    assert (where['g'], where['f']) == ((0, 0), (0, 1))
+    # the formal arguments come first in the function's frame, then its
+    # variables, blocks included
+    assert (where['a'], where['b'], where['x']) == ((1, 0), (1, 1), (1, 2))
+    assert (by_name['y'][0][2:], by_name['y'][-1][2:]) == ((1, 3), (1, 4))
+    assert (where['h'], where['c']) == ((1, 5), (2, 0))
+    assert [frame.name for frame in table.frames] == [None, 'f', 'h']
+    assert table.frames[1].names == ['a', 'b', 'x', 'y', 'y', 'h']
+
+@pytest.mark.parametrize('source, message', [
+    ('int x = 1 ; float x = 2.0 ;', 'symbol x already declared'),
+    ('int f ( int a , int a ) return a ;', 'symbol a already declared'),
+    ('put x ;', 'symbol x not declared'),
+    ('int f ( int a ) return b ;', 'symbol b not declared'),
+    # a block's names are gone after it
+    ('{ int y = 1 ; } put y ;', 'symbol y not declared'),
+])
+def test_vintage_errors(source, message):
+    with pytest.raises(ValueError) as error:
+        symbols.resolve_vintage(vintage_fe.parse(source))
+    assert str(error.value) == message
+
+def test_vintage_shadowing():
+    (tree, table) = symbols.resolve_vintage(vintage_fe.parse('int x = 1 ; { int x = 2 ; put x ; } put x ;'))
+    [outer, inner, inner_use, outer_use] = slots(tree)
+    assert inner_use is inner and outer_use is outer and inner is not outer
+
+def test_deep_vintage_tree():
+    depth = 5000
+    tree = vintage_fe.parse('int x = 1 ; ' + '{ ' * depth + 'put x ; ' + '} ' * depth, iterative=True)
+    (resolved, table) = symbols.resolve_vintage(tree)
+    assert len(slots(resolved)) == 2
+
+def test_functions_are_resolved_where_they_are_called():
+    text = 'int g ( int p , int q ) return p ;' + ''.join(VINTAGE_FUNCTION % i for i in range(3))
+    (tree, table) = symbols.resolve_vintage(vintage_fe.parse(text))
+    assert all(node is uses(tree)['g'][0] for node in uses(tree)['g'])
+
+def test_basic_function_used_before_its_definition():
+    source = 'print F(2);\ndef fn F(X) == X + Y;\nlet Y == 1;\nprint F(Y) + X;'
+    (statements, lines) = parse_source(source)
+    (resolved, table) = symbols.resolve_basic(statements)
+    by_name = uses(resolved)
+    assert len(by_name['F']) == 3 and all(node is by_name['F'][0] for node in by_name['F'])
+    assert table.functions.names == ['F']
+    # the parameter is the function's frame; the global X is another name
+    (parameter, body_use, global_use) = by_name['X']
+    assert body_use is parameter and parameter[2:] == (1, 0)
+    assert global_use is not parameter and global_use[2] == 0
+    # Y is a global first used in the body
+    assert all(node is by_name['Y'][0] for node in by_name['Y']) and by_name['Y'][0][2:] == (0, 0)
+
+def test_basic_variables_are_globals_in_order_of_use():
+    source = 'let B == 1;\nfor I == 1 to 2 let A == A + I;\nnext I;\nread C, B;\nprint ABS(A);'
+    (statements, lines) = parse_source(source)
+    (resolved, table) = symbols.resolve_basic(statements)
+    assert table.globals.names == ['B', 'I', 'A', 'C']
+    by_name = uses(resolved)
+    for (name, nodes) in by_name.items():
+        assert all(node is nodes[0] for node in nodes), name
+        assert nodes[0] == ('SLOT', name, 0, table.globals.names.index(name))
+    # a builtin keeps its name
+    assert resolved[-1] == ('PRINT', ('FACTOR', 1, ('FUNC', 'ABS', [('FACTOR', 1, by_name['A'][0])])))
@@ -0,0 +1,114 @@
+import io
+
+import pytest
+
+import engine
+import vectorize
+
+needs_numpy = pytest.mark.skipif(vectorize.numpy is None, reason='numpy is not installed')
+
+# what source prints, or the error it stops with
+def output(source, vectorized):
+    out = io.StringIO()
+    try:
+        engine.compile_source(source, vectorize=vectorized).run(out)
+    except Exception as e:
+        return '%s%s: %s' % (out.getvalue(), type(e).__name__, e)
+    return out.getvalue()
+
+# the loop variables of the loops find_kernels picks out
+def kernels(source):
+    program = engine.compile_source(source, vectorize=True)
+    return [kernel.variable for (kernel, last) in program.kernels.values()]
+
+# the result of each Kernel.run while source runs vectorised, and what it
+# prints, which must be what the scalar engine prints
+def run(source, monkeypatch, same=True):
+    results = []
+    original = vectorize.Kernel.run
+    def recording(self, env, start, end, step):
+        results.append(original(self, env, start, end, step))
+        return results[-1]
+    monkeypatch.setattr(vectorize.Kernel, 'run', recording)
+    printed = output(source, True)
+    if same:
+        assert printed == output(source, False), source
+    return (results, printed)
+
+VECTORIZED = [
+    'for I == 1 to 100 let A == I * 2 + 1;\nlet B == A / 4 - I ^ 2;\nnext I;\nprint A; print B;',
+    'for I == -40 to 40 let X == ABS(I) + INT(I / 3);\nlet Y == INT(-I / 7) * 0.5;\nnext I;\nprint X; print Y;',
+    # a running sum, adding in the order the scalar loop does
+    'let S == 0;\nlet T == 1;\nfor I == 1 to 1000 let S == S + I * I;\nlet T == T - 1 / I + 0.1;\nnext I;\nprint S; print T;',
+    # the loop variable after the loop, as the scalar loop leaves it
+    'for I == 1 to 200 let A == I;\nnext I;\nprint I; print A;',
+    'for I == 100 to 1 step -1 let A == I * I;\nnext I;\nprint I; print A;',
+    'for I == 0 to 10 step 0.125 let A == I * 3;\nnext I;\nprint I; print A;',
+    'let K == 3;\nfor I == 1 to 70 let A == K * I;\nlet B == A + K;\nnext I;\nprint A + B;',
+]
+
+@needs_numpy
+@pytest.mark.parametrize('source', VECTORIZED)
+def test_kernels_run_and_agree(source, monkeypatch):
+    assert kernels(source) == ['I']
+    (results, printed) = run(source, monkeypatch)
+    assert results == [True]
+
+@needs_numpy
+def test_kernel_runs_each_time_its_loop_is_entered(monkeypatch):
+    source = 'for J == 1 to 3 for I == 1 to 100 let A == I * J;\nnext I;\nprint A;\nnext J;'
+    assert kernels(source) == ['I']
+    (results, printed) = run(source, monkeypatch)
+    assert results == [True, True, True]
+    assert printed.split() == ['100', '200', '300']
+
+# SIN, COS, SQR and EXP may differ from the math module in the last bit
+@needs_numpy
+def test_transcendental_functions(monkeypatch):
+    source = 'for I == 1 to 64 let X == SIN(I) + COS(I);\nlet Y == SQR(I) * EXP(I / 100);\nnext I;\nprint X; print Y;'
+    assert kernels(source) == ['I']
+    (results, printed) = run(source, monkeypatch, same=False)
+    assert results == [True]
+    assert [float(line) for line in printed.split()] == pytest.approx([float(line) for line in output(source, False).split()], rel=1e-14)
+
+@pytest.mark.parametrize('source', [
+    # an iteration reads what the one before it wrote
+    'for I == 1 to 100 let A == A * 2 + I;\nnext I;\nprint A;',
+    'for I == 1 to 100 let B == A;\nlet A == I;\nnext I;\nprint B;',
+    # a running sum is read elsewhere in the loop
+    'for I == 1 to 100 let A == A + I;\nlet B == A;\nnext I;\nprint B;',
+    'for I == 1 to 100 let A == A + I;\nlet A == 2;\nnext I;\nprint A;',
+    'for I == 1 to 100 let I == I + 1;\nnext I;',
+    # statements other than LET
+    'for I == 1 to 100 let A == I;\nprint A;\nnext I;',
+    'for I == 1 to 100 let A == I;\nif A > 50 then goto 3;\nnext I;\nprint A;',
+    'let A == 0;\ngoto 4;\nfor I == 1 to 100 let A == I;\nnext I;\nprint A;',
+    'for I == 1 to 100 let A == I;\ngosub 4;\nnext I;\nend; let B == 1;\nreturn;',
+    # what a kernel cannot compute
+    'for I == 1 to 100 let A == RND(I);\nnext I;',
+    'for I == 1 to 100 let A == "X";\nnext I;\nprint A;',
+    'for I == 1 to 100 let A == I < 50;\nnext I;\nprint A;',
+    'for I == 1 to 100 let A == F(I);\nnext I;\ndef fn F(X) == X * 2;',
+])
+def test_loops_that_are_not_vectorised(source):
+    assert kernels(source) == []
+    assert output(source, True) == output(source, False)
+
+@needs_numpy
+@pytest.mark.parametrize('source', [
+    # too few iterations
+    'for I == 1 to 63 let A == I * 2;\nnext I;\nprint A; print I;',
+    'let N == 10;\nfor I == 1 to N let A == I * 2;\nnext I;\nprint A;',
+    # a floating point error, which the scalar loop raises or not as it does
+    'for I == 1 to 100 let A == 1 / (I - 50);\nnext I;\nprint A;',
+    'for I == 1 to 100 let A == SQR(50 - I);\nnext I;\nprint A;',
+    'for I == 1 to 100 let A == 10 ^ (I * 10);\nnext I;\nprint A;',
+    # a value that is not a number, or an integer past 2**53
+    'let S == "X";\nfor I == 1 to 100 let A == S;\nnext I;\nprint A;',
+    'let S == 9007199254740000;\nfor I == 1 to 100 let S == S + I;\nnext I;\nprint S;',
+    'for I == 1 to 100 let A == I * 100000000000000000;\nnext I;\nprint A;',
+])
+def test_kernels_fall_back_to_the_scalar_loop(source, monkeypatch):
+    assert kernels(source) == ['I']
+    (results, printed) = run(source, monkeypatch)
+    assert results == [False]
@@ -0,0 +1,461 @@
+import hashlib
+import sys
+from collections import OrderedDict
+
+from engine import (
+    BUILTINS,
+    FALSE,
+    TRUE,
+    Layout,
+    format_value,
+    is_name,
+    literal_value,
+    parse_program,
+    )
+from parser_1 import ProgramIndex
+
+# Translation of parser_1 programs into Python source, compiled with
+# compile() so that CPython runs them natively.
+#
+# The program becomes one function, `program(_print)`, with every BASIC
+# variable a local.  It works on the flat engine.Layout: an IF whose
+# statement contains no jump target becomes a Python `if`, and a FOR whose
+# NEXT follows it in the same block, with no jumps or jump targets in
+# between, becomes a `while` loop.  DEF FN functions become local
+# functions.  Anything else (GOTO, GOSUB, ON, RETURN and loops entered or
+# left by a jump) runs as a state machine: the code is cut into blocks at
+# every jump target and a `while` loop dispatches on the label `_pc` of
+# the block to run next.  A program with no jumps is straight-line code.
+# The DATA values of the program's ProgramIndex are a tuple constant of the
+# code, read from the local _position, which RESTORE sets.
+
+# bumped when the generated code changes, so cached code objects are not
+# reused across versions
+VERSION = 2
+
+# name of the helper for each builtin, as the generated code calls it
+def builtin_name(name):
+    return '_' + name
+
+BINARY_OPERATORS = {
+    'ADD': '+', 'SUB': '-', 'MUL': '*', 'DIV': '/', 'POW': '**',
+    'EQ': '==', 'NEQ': '!=', 'LSS': '<', 'GRT': '>', 'LEQ': '<=', 'GREQ': '>=',
+}
+
+JUMPS = ('GOTO', 'GOSUB', 'ON', 'RETURN')
+
+class Translator:
+    def __init__(self, statements, lines=None, index=None):
+        layout = Layout(statements, lines)
+        self.entries = layout.entries
+        self.target = layout.target
+        if index is None:
+            index = ProgramIndex.of(statements, lines)
+        self.index = index
+        self.lines = []
+        self.loops = 0
+        self.functions = {node[1]: (node[2], node[3]) for node in self.entries if node[0] == 'DEF'}
+        self.find_labels()
+
+    # Labels are where control can arrive other than from the entry
+    # before: jump and return targets, and the body of a loop that is not
+    # a while loop.  An IF whose statement holds a label needs a label
+    # after it as well, since it can no longer be a Python `if`.
+    def find_labels(self):
+        labels = {0}
+        for (index, node) in enumerate(self.entries):
+            kind = node[0]
+            if kind == 'GOTO':
+                labels.add(self.target(node[1]))
+            elif kind == 'GOSUB':
+                labels.add(self.target(node[1]))
+                labels.add(index + 1)
+            elif kind == 'ON':
+                labels.update(self.target(line_num) for line_num in node[3])
+                labels.add(index + 1)
+        self.labels = labels
+        self.unstructured = set()
+        self.loop_ends = {}
+        changed = True
+        while changed:
+            changed = False
+            self.find_loops()
+            for (index, node) in enumerate(self.entries):
+                if node[0] == 'FOR' and index not in self.loop_ends and index + 1 not in self.labels:
+                    self.labels.add(index + 1)
+                    changed = True
+                if node[0] == 'IF' and index not in self.unstructured:
+                    if self.has_label(index + 1, self.if_end(index)):
+                        self.unstructured.add(index)
+                        self.labels.add(node[2])
+                        if self.entries[node[2] - 1][0] == 'JUMP':
+                            self.labels.add(self.entries[node[2] - 1][1])
+                        changed = True
+
+    # RETURN and a NEXT that is not the end of a while loop continue the
+    # dispatch loop even when nothing jumps
+    def needs_dispatch(self):
+        loop_ends = set(self.loop_ends.values())
+        for (index, node) in enumerate(self.entries):
+            if node[0] == 'RETURN' or node[0] == 'NEXT' and index not in loop_ends:
+                return True
+        return False
+
+    def has_label(self, start, end):
+        return any(start <= label < end for label in self.labels)
+
+    # the entry after an IF and its statements, including any ELSE part
+    def if_end(self, index):
+        end = self.entries[index][2]
+        if self.entries[end - 1][0] == 'JUMP' and end - 1 > index:
+            end = self.entries[end - 1][1]
+        return end
+
+    # FOR entries that become while loops: FOR index -> NEXT index.  The
+    # NEXT must close the innermost open FOR in the same statement list,
+    # and nothing in between may jump or be jumped to.
+    def find_loops(self):
+        self.loop_ends = {}
+        self.pair_loops(0, len(self.entries))
+
+    def pair_loops(self, start, end):
+        open_loops = []
+        index = start
+        while index < end:
+            node = self.entries[index]
+            kind = node[0]
+            if kind == 'FOR':
+                open_loops.append([index, True])
+            elif kind == 'NEXT':
+                if open_loops and self.entries[open_loops[-1][0]][1] == node[1]:
+                    (first, clean) = open_loops.pop()
+                    if clean and not self.has_label(first + 1, index + 1):
+                        self.loop_ends[first] = index
+                else:
+                    # a NEXT closing an outer loop, or none
+                    for loop in open_loops:
+                        loop[1] = False
+            elif kind in JUMPS:
+                for loop in open_loops:
+                    loop[1] = False
+            elif kind == 'IF':
+                stop = self.if_end(index)
+                # loops inside the statement of an IF stay state machine
+                # loops, as do the loops around one that jumps
+                for inner in range(index + 1, stop):
+                    if self.entries[inner][0] in JUMPS + ('FOR', 'NEXT'):
+                        for loop in open_loops:
+                            loop[1] = False
+                        break
+                index = stop
+                continue
+            index += 1
+
+    def emit(self, depth, line):
+        self.lines.append('    ' * depth + line)
+
+    def source(self):
+        self.emit(0, 'def program(_print):')
+        names = set()
+        for node in self.entries:
+            names.update(self.variables(node))
+        for (parameters, body) in self.functions.values():
+            names.update(set(self.variables(body)) - set(parameters))
+        for name in sorted(names):
+            self.emit(1, '%s = 0' % name)
+        if any(node[0] == 'READ' for node in self.entries):
+            self.emit(1, '_data = %r' % (tuple(self.index.data),))
+            self.emit(1, '_position = 0')
+        for (name, (parameters, body)) in sorted(self.functions.items()):
+            self.emit(1, 'def %s(%s):' % (name, ', '.join(parameters)))
+            self.emit(2, 'return %s' % self.expression(body))
+        if self.labels == {0} and not self.needs_dispatch():
+            self.emit_range(1, 0, len(self.entries))
+        else:
+            self.emit(1, '_returns = []')
+            self.emit(1, '_frames = []')
+            self.emit(1, '_pc = 0')
+            self.emit(1, 'while True:')
+            # a jump to the end of the program lands on a block that returns
+            end = len(self.entries)
+            labels = sorted(label for label in self.labels if label < end)
+            self.emit_dispatch(2, labels + [end, end + 1])
+        return '\n'.join(self.lines) + '\n'
+
+    # an if tree over the labels, finding a block in log(labels) tests
+    def emit_dispatch(self, depth, labels):
+        if len(labels) == 2:
+            self.emit_block(depth, labels[0], labels[1])
+            return
+        middle = len(labels) // 2
+        self.emit(depth, 'if _pc < %d:' % labels[middle])
+        self.emit_dispatch(depth + 1, labels[:middle + 1])
+        self.emit(depth, 'else:')
+        self.emit_dispatch(depth + 1, labels[middle:])
+
+    def emit_block(self, depth, start, end):
+        if start >= len(self.entries):
+            self.emit(depth, 'return')
+            return
+        self.emit_range(depth, start, end)
+        # no fall through after a block ending in a jump
+        if self.lines[-1] in ('    ' * depth + 'continue', '    ' * depth + 'return'):
+            return
+        if end < len(self.entries):
+            self.emit(depth, '_pc = %d' % end)
+        else:
+            self.emit(depth, 'return')
+
+    def emit_range(self, depth, start, end):
+        index = start
+        first = len(self.lines)
+        while index < end:
+            index = self.emit_entry(depth, index)
+        if len(self.lines) == first:
+            self.emit(depth, 'pass')
+
+    # emit one entry, or the structure it starts; returns the next index
+    def emit_entry(self, depth, index):
+        node = self.entries[index]
+        kind = node[0]
+        if kind == 'LET':
+            self.emit(depth, '%s = %s' % (node[1], self.expression(node[2])))
+        elif kind == 'PRINT':
+            self.emit(depth, '_print(_format(%s))' % self.expression(node[1]))
+        elif kind == 'IF' and index not in self.unstructured:
+            self.emit(depth, 'if %s:' % self.condition(node[1]))
+            end = node[2]
+            if self.entries[end - 1][0] == 'JUMP' and end - 1 > index:
+                self.emit_range(depth + 1, index + 1, end - 1)
+                self.emit(depth, 'else:')
+                self.emit_range(depth + 1, end, self.entries[end - 1][1])
+                return self.entries[end - 1][1]
+            self.emit_range(depth + 1, index + 1, end)
+            return end
+        elif kind == 'IF':
+            self.emit(depth, 'if not (%s):' % self.condition(node[1]))
+            self.emit_jump(depth + 1, node[2])
+        elif kind == 'JUMP':
+            self.emit_jump(depth, node[1])
+        elif kind == 'FOR' and index in self.loop_ends:
+            return self.emit_loop(depth, index, self.loop_ends[index])
+        elif kind == 'FOR':
+            (FOR, name, start, end, step) = node
+            self.emit(depth, '%s = %s' % (name, self.expression(start)))
+            # re-entering a loop drops its old frame and any inside it
+            self.emit(depth, 'for _i in range(len(_frames)):')
+            self.emit(depth + 1, 'if _frames[_i][0] == %r:' % name)
+            self.emit(depth + 2, 'del _frames[_i:]')
+            self.emit(depth + 2, 'break')
+            step = '1' if step is None else self.expression(step)
+            self.emit(depth, '_frames.append((%r, %s, %s, %d))' % (name, self.expression(end), step, index + 1))
+        elif kind == 'NEXT':
+            name = node[1]
+            self.emit(depth, 'while _frames and _frames[-1][0] != %r:' % name)
+            self.emit(depth + 1, '_frames.pop()')
+            self.emit(depth, 'if not _frames:')
+            self.emit(depth + 1, 'raise RuntimeError(%r)' % ('NEXT without FOR: %s' % name))
+            self.emit(depth, '(_, _limit, _step, _body) = _frames[-1]')
+            self.emit(depth, '%s += _step' % name)
+            self.emit(depth, 'if %s <= _limit if _step >= 0 else %s >= _limit:' % (name, name))
+            self.emit(depth + 1, '_pc = _body')
+            self.emit(depth + 1, 'continue')
+            self.emit(depth, '_frames.pop()')
+        elif kind == 'GOTO':
+            self.emit_jump(depth, self.target(node[1]))
+        elif kind == 'GOSUB':
+            self.emit(depth, '_returns.append(%d)' % (index + 1))
+            self.emit_jump(depth, self.target(node[1]))
+        elif kind == 'ON':
+            (ON, selector, jump, targets) = node
+            targets = tuple(self.target(line_num) for line_num in targets)
+            self.emit(depth, '_index = int(%s)' % self.expression(selector))
+            self.emit(depth, 'if 1 <= _index <= %d:' % len(targets))
+            if jump == 'GOSUB':
+                self.emit(depth + 1, '_returns.append(%d)' % (index + 1))
+            self.emit(depth + 1, '_pc = %r[_index - 1]' % (targets,))
+            self.emit(depth + 1, 'continue')
+        elif kind == 'RETURN':
+            self.emit(depth, 'if not _returns:')
+            self.emit(depth + 1, 'raise RuntimeError("RETURN without GOSUB")')
+            self.emit(depth, '_pc = _returns.pop()')
+            self.emit(depth, 'continue')
+        elif kind == 'READ':
+            names = node[1]
+            self.emit(depth, 'if _position + %d > len(_data):' % len(names))
+            self.emit(depth + 1, 'raise RuntimeError("out of DATA")')
+            for (offset, name) in enumerate(names):
+                self.emit(depth, '%s = _data[_position + %d]' % (name, offset))
+            self.emit(depth, '_position += %d' % len(names))
+        elif kind == 'RESTORE':
+            self.emit(depth, '_position = %d' % (0 if node[1] is None else self.index.restore(node[1])))
+        elif kind == 'END':
+            self.emit(depth, 'return')
+        elif kind == 'REM' or kind == 'DEF' or kind == 'DATA':
+            pass
+        else:
+            raise ValueError("cannot translate {}".format(kind))
+        return index + 1
+
+    def emit_jump(self, depth, target):
+        self.emit(depth, '_pc = %d' % target)
+        self.emit(depth, 'continue')
+
+    # a FOR and its NEXT as a while loop; the body runs at least once and
+    # the variable is left one step past the limit, as in the engine
+    def emit_loop(self, depth, first, last):
+        (FOR, name, start, end, step) = self.entries[first]
+        self.loops += 1
+        limit = '_limit%d' % self.loops
+        self.emit(depth, '%s = %s' % (name, self.expression(start)))
+        self.emit(depth, '%s = %s' % (limit, self.expression(end)))
+        if step is None or isinstance(step, tuple) and self.constant(step) is not None:
+            value = 1 if step is None else self.constant(step)
+            self.emit(depth, 'while True:')
+            self.emit_range(depth + 1, first + 1, last)
+            self.emit(depth + 1, '%s += %r' % (name, value))
+            self.emit(depth + 1, 'if %s %s %s:' % (name, '>' if value >= 0 else '<', limit))
+            self.emit(depth + 2, 'break')
+        else:
+            step_name = '_step%d' % self.loops
+            self.emit(depth, '%s = %s' % (step_name, self.expression(step)))
+            self.emit(depth, 'while True:')
+            self.emit_range(depth + 1, first + 1, last)
+            self.emit(depth + 1, '%s += %s' % (name, step_name))
+            self.emit(depth + 1, 'if %s > %s if %s >= 0 else %s < %s:'
+                      % (name, limit, step_name, name, limit))
+            self.emit(depth + 2, 'break')
+        return last + 1
+
+    # the value of a numeric literal, possibly signed, or None
+    def constant(self, node):
+        if isinstance(node, str):
+            return None if is_name(node) or node.startswith('"') else literal_value(node)
+        if node[0] == 'FACTOR':
+            value = self.constant(node[2])
+            return None if value is None else node[1] * value
+        return None
+
+    # the variables a layout entry or an expression uses
+    def variables(self, node):
+        if node is None:
+            return
+        if isinstance(node, str):
+            if is_name(node):
+                yield node
+            return
+        tag = node[0]
+        if tag in ('LET', 'FOR', 'NEXT'):
+            yield node[1]
+            for child in node[2:]:
+                yield from self.variables(child)
+        elif tag == 'READ':
+            yield from node[1]
+        elif tag in ('PRINT', 'IF', 'ON'):
+            yield from self.variables(node[1])
+        elif tag in ('FACTOR', 'UNARY'):
+            yield from self.variables(node[2])
+        elif tag == 'FUNC':
+            for arg in node[2]:
+                yield from self.variables(arg)
+        elif tag in ('EXPR', 'TERM', 'POWER', 'COMPARE', 'LOGIC'):
+            yield from self.variables(node[2])
+            yield from self.variables(node[3])
+
+    # an expression as Python source; comparisons and logic give -1 or 0
+    def expression(self, node):
+        if isinstance(node, str):
+            if is_name(node):
+                return node
+            return repr(literal_value(node))
+        tag = node[0]
+        if tag == 'FACTOR':
+            (FACTOR, sign, operand) = node
+            value = self.expression(operand)
+            if sign == 1:
+                return value
+            if sign == -1:
+                return '(-%s)' % value
+            return '(%d * %s)' % (sign, value)
+        elif tag == 'FUNC':
+            (FUNC, name, args) = node
+            if name in self.functions and len(args) != len(self.functions[name][0]):
+                raise ValueError("{} takes {} arguments".format(name, len(self.functions[name][0])))
+            args = ', '.join(self.expression(arg) for arg in args)
+            if name in self.functions:
+                return '%s(%s)' % (name, args)
+            if name not in BUILTINS:
+                raise ValueError("unknown function {}".format(name))
+            return '%s(%s)' % (builtin_name(name), args)
+        elif tag in ('UNARY', 'LOGIC', 'COMPARE'):
+            return '(%d if %s else %d)' % (TRUE, self.condition(node), FALSE)
+        else:
+            (tag, op, left, right) = node
+            return '(%s %s %s)' % (self.expression(left), BINARY_OPERATORS[op], self.expression(right))
+
+    # an expression used as a truth value, without building -1 or 0
+    def condition(self, node):
+        if isinstance(node, tuple):
+            tag = node[0]
+            if tag == 'COMPARE':
+                (tag, op, left, right) = node
+                return '(%s %s %s)' % (self.expression(left), BINARY_OPERATORS[op], self.expression(right))
+            elif tag == 'LOGIC':
+                (tag, op, left, right) = node
+                return '(%s %s %s)' % (self.condition(left), op.lower(), self.condition(right))
+            elif tag == 'UNARY':
+                return '(not %s)' % self.condition(node[2])
+        return self.expression(node)
+
+# code objects of translated programs by source hash, the least recently
+# used dropped once there are more than size
+class CodeCache:
+    def __init__(self, size=128):
+        self.size = size
+        self.codes = OrderedDict()
+
+    def get(self, key):
+        code = self.codes.get(key)
+        if code is not None:
+            self.codes.move_to_end(key)
+        return code
+
+    def put(self, key, code):
+        self.codes[key] = code
+        self.codes.move_to_end(key)
+        while len(self.codes) > self.size:
+            self.codes.popitem(last=False)
+
+    def clear(self):
+        self.codes.clear()
+
+    def __len__(self):
+        return len(self.codes)
+
+CODE_CACHE = CodeCache()
+
+def namespace():
+    names = {builtin_name(name): function for (name, function) in BUILTINS.items()}
+    names['_format'] = format_value
+    return names
+
+# translate BASIC source to a code object defining program(); the code
+# object is kept in cache (a CodeCache, or None not to keep it) by the
+# hash of the source
+def compile_source(text, cache=CODE_CACHE):
+    key = hashlib.sha256(('%d\0%s' % (VERSION, text)).encode('utf-8')).hexdigest()
+    code = cache.get(key) if cache is not None else None
+    if code is None:
+        parser = parse_program(text)
+        source = Translator(parser.statements, parser.statement_lines, parser.index).source()
+        code = compile(source, '<basic %s>' % key[:12], 'exec')
+        if cache is not None:
+            cache.put(key, code)
+    return code
+
+# run BASIC source, translating it only when it is not in cache
+def run_source(text, output=None, cache=CODE_CACHE):
+    output = output or sys.stdout
+    names = namespace()
+    exec(compile_source(text, cache), names)
+    names['program'](lambda text: print(text, file=output))
@@ -0,0 +1,308 @@
+import math
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from engine import is_name, literal_value
+
+# Whole-array execution of numeric FOR/NEXT loops, for engine.Program
+# with vectorize=True.
+#
+# A loop qualifies when its body is only LET statements of arithmetic
+# (+ - * / ^, signs, numbers, variables) and the math builtins, nothing
+# jumps into it, and no iteration reads a value an earlier iteration
+# wrote.  The one exception is a running sum, V = V + a - b ..., where
+# the terms do not use V and V is not used elsewhere in the loop.  Such a
+# loop is run once over the array of all values of the loop variable, and
+# the variables are left as the last iteration would leave them.
+#
+# The arrays are float64.  Sums are accumulated in order with cumsum, so
+# they round as the scalar loop does.  Values the scalar engine keeps as
+# Python ints stay exact while they are below 2**53, and are turned back
+# into ints afterwards.  Anything else runs the loop one iteration at a
+# time instead: a division by zero or other floating point error, a
+# non-number, a value past 2**53, or fewer than MIN_ITERATIONS
+# iterations.  Transcendental functions may differ from the math module
+# in the last bit.
+
+MIN_ITERATIONS = 64
+EXACT_LIMIT = 2 ** 53
+
+# builtins a kernel can use: name -> (numpy function name, result is an
+# integer when the argument is)
+FUNCTIONS = {
+    'ABS': ('abs', True),
+    'ATN': ('arctan', False),
+    'COS': ('cos', False),
+    'EXP': ('exp', False),
+    'INT': ('floor', True),
+    'LOG': ('log', False),
+    'SGN': ('sign', True),
+    'SIN': ('sin', False),
+    'SQR': ('sqrt', False),
+    'TAN': ('tan', False),
+}
+# builtins whose result is an integer whatever the argument
+INTEGER_FUNCTIONS = {'INT', 'SGN'}
+
+ARITHMETIC = {'EXPR', 'TERM', 'POWER'}
+
+# a loop that cannot be vectorised this time, or at all
+class Fallback(Exception):
+    pass
+
+class Kernel:
+    def __init__(self, variable, body):
+        self.variable = variable
+        self.body = body
+        # LET index -> (name, [(term, sign)]) for the running sums
+        self.sums = {}
+        if any(name == variable for (LET, name, expression) in body):
+            raise Fallback("the loop variable is assigned")
+        for (index, (LET, name, expression)) in enumerate(body):
+            check_expression(expression)
+            terms = running_sum(name, expression)
+            if terms is not None and all(name not in set(variables(term)) for (term, sign) in terms):
+                self.sums[index] = (name, terms)
+        summed = set(name for (name, terms) in self.sums.values())
+        written = set()
+        for (index, (LET, name, expression)) in enumerate(body):
+            if index in self.sums:
+                reads = set(v for (term, sign) in self.sums[index][1] for v in variables(term))
+            elif name in summed:
+                raise Fallback("{} is assigned outside its running sum".format(name))
+            else:
+                reads = set(variables(expression))
+            if reads & summed:
+                raise Fallback("a running sum is read in the loop")
+            # a variable read before this iteration writes it carries a
+            # value over from the iteration before
+            for later in body[index:]:
+                if later[1] in reads and later[1] not in written:
+                    raise Fallback("loop-carried dependency on {}".format(later[1]))
+            written.add(name)
+        if len(summed) != len(self.sums):
+            raise Fallback("a running sum is assigned twice")
+
+    # Run the loop over env; returns False, with env unchanged, when it has
+    # to run one iteration at a time instead
+    def run(self, env, start, end, step):
+        if numpy is None:
+            return False
+        try:
+            with numpy.errstate(all='raise', under='ignore'):
+                values = self.evaluate(env, start, end, step)
+        except (Fallback, FloatingPointError, OverflowError, TypeError, ValueError):
+            return False
+        env.update(values)
+        return True
+
+    def evaluate(self, env, start, end, step):
+        (indexes, after) = iterations(start, end, step)
+        integral = all(isinstance(v, int) for v in (start, step))
+        arrays = {self.variable: (indexes, integral)}
+        final = {}
+        for (index, (LET, name, expression)) in enumerate(self.body):
+            if index in self.sums:
+                (name, terms) = self.sums[index]
+                initial = env[name]
+                if not isinstance(initial, (int, float)) or isinstance(initial, bool):
+                    raise Fallback("not a number")
+                # the terms of all iterations in the order they are added:
+                # one row per iteration
+                added = numpy.empty((len(indexes), len(terms)))
+                integral = isinstance(initial, int)
+                for (column, (term, sign)) in enumerate(terms):
+                    (value, value_integral) = self.value(term, env, arrays)
+                    added[:, column] = sign * value
+                    integral = integral and value_integral
+                totals = numpy.cumsum(numpy.concatenate(([initial], added.ravel())))
+                checked(totals, integral)
+                final[name] = scalar(totals[-1], integral)
+                continue
+            arrays[name] = self.value(expression, env, arrays)
+        for (name, (value, integral)) in arrays.items():
+            if name != self.variable:
+                final[name] = scalar(value if numpy.ndim(value) == 0 else value[-1], integral)
+        final[self.variable] = after
+        return final
+
+    # value of an expression in every iteration: an array, or a scalar
+    # when it does not depend on the iteration, and whether the scalar
+    # engine would have an int
+    def value(self, node, env, arrays):
+        if isinstance(node, str):
+            if is_name(node):
+                if node in arrays:
+                    return arrays[node]
+                value = env[node]
+                if not isinstance(value, (int, float)) or isinstance(value, bool):
+                    raise Fallback("not a number")
+                return (numpy.float64(value), isinstance(value, int))
+            value = literal_value(node)
+            return (numpy.float64(value), isinstance(value, int))
+        tag = node[0]
+        if tag == 'FACTOR':
+            (value, integral) = self.value(node[2], env, arrays)
+            return (node[1] * value, integral)
+        elif tag == 'FUNC':
+            (FUNC, name, args) = node
+            (value, integral) = self.value(args[0], env, arrays)
+            (function, keeps_integral) = FUNCTIONS[name]
+            # a domain error is a floating point error under run()
+            result = getattr(numpy, function)(value)
+            return checked(result, name in INTEGER_FUNCTIONS or keeps_integral and integral)
+        (tag, op, left, right) = node
+        (a, a_integral) = self.value(left, env, arrays)
+        (b, b_integral) = self.value(right, env, arrays)
+        integral = a_integral and b_integral
+        if op == 'ADD':
+            return checked(a + b, integral)
+        elif op == 'SUB':
+            return checked(a - b, integral)
+        elif op == 'MUL':
+            return checked(a * b, integral)
+        elif op == 'DIV':
+            return (a / b, False)
+        else:
+            # an int to a negative power is a float
+            return checked(a ** b, integral and not numpy.any(b < 0))
+
+# the values of the loop variable, and its value after the loop; the body
+# runs at least once and each value is the one before plus step, as in
+# the engine
+def iterations(start, end, step):
+    if step == 0:
+        raise Fallback("zero step")
+    if all(isinstance(v, int) for v in (start, end, step)):
+        count = 1 + max(0, (end - start) // step)
+        if count < MIN_ITERATIONS or abs(start) + count * abs(step) >= EXACT_LIMIT:
+            raise Fallback("loop bounds")
+        indexes = numpy.arange(count, dtype=numpy.float64) * step + start
+        return (indexes, start + count * step)
+    estimate = max(0, math.floor((end - start) / step)) + 1
+    if estimate < MIN_ITERATIONS:
+        raise Fallback("too few iterations")
+    steps = numpy.full(estimate + 3, step, dtype=numpy.float64)
+    steps[0] = start
+    indexes = numpy.cumsum(steps)
+    if step > 0:
+        count = int(numpy.searchsorted(indexes, end, side='right'))
+    else:
+        count = int(numpy.searchsorted(-indexes, -end, side='right'))
+    count = max(count, 1)
+    if count >= len(indexes):
+        raise Fallback("loop bounds")
+    return (indexes[:count], float(indexes[count]))
+
+def checked(value, integral):
+    if integral and numpy.any(numpy.abs(value) >= EXACT_LIMIT):
+        raise Fallback("integer too large")
+    return (value, integral)
+
+def scalar(value, integral):
+    if integral:
+        return int(value)
+    return float(value)
+
+# [(term, sign)] if expression adds terms to or subtracts them from name,
+# in order: V + a - b parses as (V + a) - b
+def running_sum(name, expression):
+    terms = []
+    node = expression
+    while isinstance(node, tuple) and node[0] == 'EXPR':
+        (EXPR, op, left, right) = node
+        terms.append((right, 1 if op == 'ADD' else -1))
+        if plain_variable(left) == name:
+            return terms[::-1]
+        node = left
+    if isinstance(expression, tuple) and expression[0] == 'EXPR':
+        (EXPR, op, left, right) = expression
+        if op == 'ADD' and plain_variable(right) == name:
+            return [(left, 1)]
+    return None
+
+def plain_variable(node):
+    while isinstance(node, tuple) and node[0] == 'FACTOR' and node[1] == 1:
+        node = node[2]
+    if isinstance(node, str) and is_name(node):
+        return node
+    return None
+
+def check_expression(node):
+    if isinstance(node, str):
+        if node.startswith('"'):
+            raise Fallback("string")
+        return
+    tag = node[0]
+    if tag == 'FACTOR':
+        check_expression(node[2])
+    elif tag == 'FUNC':
+        if node[1] not in FUNCTIONS or len(node[2]) != 1:
+            raise Fallback("function {}".format(node[1]))
+        check_expression(node[2][0])
+    elif tag in ARITHMETIC:
+        check_expression(node[2])
+        check_expression(node[3])
+    else:
+        raise Fallback("operator {}".format(tag))
+
+def variables(node):
+    if isinstance(node, str):
+        if is_name(node):
+            yield node
+    elif node[0] == 'FACTOR':
+        yield from variables(node[2])
+    elif node[0] == 'FUNC':
+        for arg in node[2]:
+            yield from variables(arg)
+    else:
+        yield from variables(node[2])
+        yield from variables(node[3])
+
+# The kernels of an engine.Layout: FOR index -> (Kernel, NEXT index) for
+# each loop that can be vectorised
+def find_kernels(layout):
+    entries = layout.entries
+    # the entries control can reach other than from the entry before
+    targets = set()
+    for (index, node) in enumerate(entries):
+        kind = node[0]
+        if kind == 'IF':
+            targets.add(node[2])
+        elif kind == 'JUMP':
+            targets.add(node[1])
+        elif kind == 'GOTO':
+            targets.add(layout.target(node[1]))
+        elif kind == 'GOSUB':
+            targets.add(layout.target(node[1]))
+            targets.add(index + 1)
+        elif kind == 'ON':
+            targets.update(layout.target(line_num) for line_num in node[3])
+            targets.add(index + 1)
+    kernels = {}
+    for (index, node) in enumerate(entries):
+        if node[0] != 'FOR':
+            continue
+        body = []
+        last = None
+        for position in range(index + 1, len(entries)):
+            entry = entries[position]
+            if entry[0] == 'NEXT' and entry[1] == node[1]:
+                last = position
+                break
+            if entry[0] == 'LET':
+                body.append(entry)
+            elif entry[0] != 'REM':
+                break
+        if last is None or not body:
+            continue
+        if any(index < target <= last for target in targets):
+            continue
+        try:
+            kernels[index] = (Kernel(node[1], body), last)
+        except Fallback:
+            continue
+    return kernels
@@ -1,33 +1,23 @@
+from ll1 import VINTAGE
+
 def formalargs_type(args):
 
     output_list = list()
+    # a void function without parameters has ('NIL',) for its args
+    if args[0] == 'NIL':
+        return ('LIST', output_list)
     for a in args[1]:
         (FORMALARG, type, id) = a
         output_list.append(type)
     return ('LIST', output_list)
 
 # there are lots of places where we need to lookahead
-# on primitive data types -- this list will make it easier.
-primitive_lookahead = [
-    'INTEGER_TYPE',
-    'FLOAT_TYPE',
-    'STRING_TYPE',
-    ]
+# on primitive data types -- this set will make it easier.
+# The lookahead sets are computed from the grammar by ll1 at import time.
+primitive_lookahead = VINTAGE.first['primitive_type']
 
 # stmt_list : ({VOID_TYPE,INTEGER_TYPE,FLOAT_TYPE,STRING_TYPE,ID,GET,PUT,RETURN,WHILE,IF,LCURLY} stmt)*
-stmt_lookahead = [
-    'VOID_TYPE',
-    'INTEGER_TYPE',
-    'FLOAT_TYPE',
-    'STRING_TYPE',
-    'ID',
-    'GET',
-    'PUT',
-    'RETURN',
-    'WHILE',
-    'IF',
-    'LCURLY',
-    ]
+stmt_lookahead = VINTAGE.first['stmt']
 def stmt_list(stream):
     lst = []
     while stream.pointer().type in stmt_lookahead:
@@ -45,133 +35,167 @@ def stmt_list(stream):
 #      | {IF} IF LPAREN exp RPAREN stmt ({ELSE} ELSE stmt)?
 #      | {LCURLY} LCURLY stmt_list RCURLY
 def stmt(stream):
-    if stream.pointer().type in ['VOID_TYPE']:
-        stream.match('VOID_TYPE')
-        ret_type = ('VOID_TYPE',)
-        id_tok = stream.match('ID')
-        stream.match('LPAREN')
-        args = ('NIL',)
-        if stream.pointer().type in primitive_lookahead:
-            args = formal_args(stream)
-        stream.match('RPAREN')
+    alternative = stmt_table.get(stream.pointer().type)
+    if alternative is None:
+        raise SyntaxError("stmt: syntax error at {}"
+                          .format(stream.pointer().value))
+    return alternative(stream)
+
+def stmt_fundecl(stream):
+    stream.match('VOID_TYPE')
+    ret_type = ('VOID_TYPE',)
+    id_tok = stream.match('ID')
+    stream.match('LPAREN')
+    args = ('NIL',)
+    if stream.pointer().type in primitive_lookahead:
+        args = formal_args(stream)
+    stream.match('RPAREN')
+    arg_types = formalargs_type(args)
+    body = stmt(stream)
+    return ('FUNDECL',
+            ('ID', id_tok.value),
+            ('FUNCTION_TYPE', ret_type, arg_types),
+            args,
+            body)
+
+def stmt_decl(stream):
+    type = data_type(stream)
+    id_tok = stream.match('ID')
+    e = decl_suffix(stream)
+    return declaration(id_tok, type, e)
+
+# build the declaration for ID of the given type from its decl_suffix
+def declaration(id_tok, type, e):
+    if e[0] == 'FUNCTION':
+        (FUNCTION, args, body) = e
         arg_types = formalargs_type(args)
-        body = stmt(stream)
         return ('FUNDECL',
                 ('ID', id_tok.value),
-                ('FUNCTION_TYPE', ret_type, arg_types),
+                ('FUNCTION_TYPE', type, arg_types),
                 args,
                 body)
-    elif stream.pointer().type in primitive_lookahead:
-        type = data_type(stream)
-        id_tok = stream.match('ID')
-        e = decl_suffix(stream)
-        if e[0] == 'FUNCTION':
-            (FUNCTION, args, body) = e
-            arg_types = formalargs_type(args)
-            return ('FUNDECL',
-                    ('ID', id_tok.value),
-                    ('FUNCTION_TYPE', type, arg_types),
-                    args,
-                    body)
-        elif e[0] == 'EXPINIT':
-            return ('VARDECL',
-                    ('ID', id_tok.value),
-                    type,
-                    e[1])
-        elif e[0] == 'ARRAYINIT':
-            return ('ARRAYDECL',
-                    ('ID', id_tok.value),
-                    type,
-                    e[1])
-        elif e[0] == 'NIL' and type[0] in primitive_lookahead:
-            return ('VARDECL',
-                    ('ID', id_tok.value),
-                    type,
-                    ('CONST', ('INTEGER_TYPE',), ('VALUE', 0)))
-        elif e[0] == 'NIL' and type[0] == 'ARRAY_TYPE':
-            # unpack the array type
-            (ARRAY_TYPE, btype, (SIZE, size)) = type
-            return ('ARRAYDECL',
-                    ('ID', id_tok.value),
-                    type,
-                    ('LIST',
-                        [('CONST',('INTEGER_TYPE',),('VALUE', 0))
-                            for _ in range(size)]))
-    elif stream.pointer().type in ['ID']:
-        id_tok = stream.match('ID')
-        e = id_suffix(stream)
-        if e[0] == 'CALL':
-            return ('CALLSTMT', ('ID', id_tok.value), e[1])
-        elif e[0] == 'VAR_ASSIGN':
-            return ('ASSIGN', ('ID', id_tok.value), e[1])
-        elif e[0] == 'ARRAY_ASSIGN':
-            return ('ASSIGN',
-                    ('ARRAY_ACCESS',
-                     ('ID', id_tok.value),
-                     ('IX', e[1])),
-                    e[2])
-        elif e[0] == 'FUN_ARRAY_ASSIGN':
-            (FUN_ARRAY_ASSIGN, args, ix, ae) = e
-            return ('ASSIGN',
-                    ('ARRAY_ACCESS',
-                     ('CALLEXP', ('ID', id_tok.value), args),
-                     ('IX', ix)),
-                     ae)
-    elif stream.pointer().type in ['GET']:
-        stream.match('GET')
-        id_tk = stream.match('ID')
-        if stream.pointer().type in ['SEMI']:
-            stream.match('SEMI')
-        return ('GET', ('ID', id_tk.value))
-    elif stream.pointer().type in ['PUT']:
-        stream.match('PUT')
-        e = exp(stream)
-        if stream.pointer().type in ['SEMI']:
-            stream.match('SEMI')
-        return ('PUT', e)
-    elif stream.pointer().type in ['RETURN']:
-        stream.match('RETURN')
-        if stream.pointer().type in exp_lookahead:
-            e = exp(stream)
-        else:
-            e = ('NIL',)
-        if stream.pointer().type in ['SEMI']:
-            stream.match('SEMI')
-        return ('RETURN', e)
-    elif stream.pointer().type in ['WHILE']:
-        stream.match('WHILE')
-        stream.match('LPAREN')
-        e = exp(stream)
-        stream.match('RPAREN')
-        s = stmt(stream)
-        return ('WHILE', e, s)
-    elif stream.pointer().type in ['IF']:
-        stream.match('IF')
-        stream.match('LPAREN')
+    elif e[0] == 'EXPINIT':
+        return ('VARDECL',
+                ('ID', id_tok.value),
+                type,
+                e[1])
+    elif e[0] == 'ARRAYINIT':
+        return ('ARRAYDECL',
+                ('ID', id_tok.value),
+                type,
+                e[1])
+    elif e[0] == 'NIL' and type[0] in primitive_lookahead:
+        return ('VARDECL',
+                ('ID', id_tok.value),
+                type,
+                ('CONST', ('INTEGER_TYPE',), ('VALUE', 0)))
+    elif e[0] == 'NIL' and type[0] == 'ARRAY_TYPE':
+        # unpack the array type
+        (ARRAY_TYPE, btype, (SIZE, size)) = type
+        return ('ARRAYDECL',
+                ('ID', id_tok.value),
+                type,
+                ('LIST',
+                    [('CONST',('INTEGER_TYPE',),('VALUE', 0))
+                        for _ in range(size)]))
+
+def stmt_id(stream):
+    id_tok = stream.match('ID')
+    e = id_suffix(stream)
+    return id_statement(id_tok, e)
+
+# build the statement starting with ID from its id_suffix
+def id_statement(id_tok, e):
+    if e[0] == 'CALL':
+        return ('CALLSTMT', ('ID', id_tok.value), e[1])
+    elif e[0] == 'VAR_ASSIGN':
+        return ('ASSIGN', ('ID', id_tok.value), e[1])
+    elif e[0] == 'ARRAY_ASSIGN':
+        return ('ASSIGN',
+                ('ARRAY_ACCESS',
+                 ('ID', id_tok.value),
+                 ('IX', e[1])),
+                e[2])
+    elif e[0] == 'FUN_ARRAY_ASSIGN':
+        (FUN_ARRAY_ASSIGN, args, ix, ae) = e
+        return ('ASSIGN',
+                ('ARRAY_ACCESS',
+                 ('CALLEXP', ('ID', id_tok.value), args),
+                 ('IX', ix)),
+                 ae)
+
+def stmt_get(stream):
+    stream.match('GET')
+    id_tk = stream.match('ID')
+    if stream.pointer().type == 'SEMI':
+        stream.match('SEMI')
+    return ('GET', ('ID', id_tk.value))
+
+def stmt_put(stream):
+    stream.match('PUT')
+    e = exp(stream)
+    if stream.pointer().type == 'SEMI':
+        stream.match('SEMI')
+    return ('PUT', e)
+
+def stmt_return(stream):
+    stream.match('RETURN')
+    if stream.pointer().type in exp_lookahead:
         e = exp(stream)
-        stream.match('RPAREN')
-        s1 = stmt(stream)
-        if stream.pointer().type in ['ELSE']:
-            stream.match('ELSE')
-            s2 = stmt(stream)
-            return ('IF', e, s1, s2)
-        else:
-            return ('IF', e, s1, ('NIL',))
-    elif stream.pointer().type in ['LCURLY']:
-        stream.match('LCURLY')
-        sl = stmt_list(stream)
-        stream.match('RCURLY')
-        return ('BLOCK', sl)
     else:
-        raise SyntaxError("stmt: syntax error at {}"
-                          .format(stream.pointer().value))
+        e = ('NIL',)
+    if stream.pointer().type == 'SEMI':
+        stream.match('SEMI')
+    return ('RETURN', e)
+
+def stmt_while(stream):
+    stream.match('WHILE')
+    stream.match('LPAREN')
+    e = exp(stream)
+    stream.match('RPAREN')
+    s = stmt(stream)
+    return ('WHILE', e, s)
+
+def stmt_if(stream):
+    stream.match('IF')
+    stream.match('LPAREN')
+    e = exp(stream)
+    stream.match('RPAREN')
+    s1 = stmt(stream)
+    if stream.pointer().type == 'ELSE':
+        stream.match('ELSE')
+        s2 = stmt(stream)
+        return ('IF', e, s1, s2)
+    else:
+        return ('IF', e, s1, ('NIL',))
+
+def stmt_block(stream):
+    stream.match('LCURLY')
+    sl = stmt_list(stream)
+    stream.match('RCURLY')
+    return ('BLOCK', sl)
+
+# the stmt alternatives in grammar order; the LL(1) table maps each
+# lookahead token to the alternative it predicts
+stmt_alternatives = [
+    stmt_fundecl,
+    stmt_decl,
+    stmt_id,
+    stmt_get,
+    stmt_put,
+    stmt_return,
+    stmt_while,
+    stmt_if,
+    stmt_block,
+    ]
+stmt_table = {tk: stmt_alternatives[i] for (tk, i) in VINTAGE.predict['stmt'].items()}
 
 # data_type : {INTEGER_TYPE,FLOAT_TYPE,STRING_TYPE} primitive_type
 #                   ({LSQUARE} LSQUARE INTEGER RSQUARE)?
 def data_type(stream):
     if stream.pointer().type in primitive_lookahead:
         type = primitive_type(stream)
-        if stream.pointer().type in ['LSQUARE']:
+        if stream.pointer().type == 'LSQUARE':
             stream.match('LSQUARE')
             int_tok = stream.match('INTEGER')
             size = int_tok.value
@@ -186,13 +210,13 @@ def data_type(stream):
 #           | {FLOAT_TYPE} FLOAT_TYPE
 #           | {STRING_TYPE} STRING_TYPE
 def primitive_type(stream):
-    if stream.pointer().type in ['INTEGER_TYPE']:
+    if stream.pointer().type == 'INTEGER_TYPE':
         stream.match('INTEGER_TYPE')
         return ('INTEGER_TYPE',)
-    elif stream.pointer().type in ['FLOAT_TYPE']:
+    elif stream.pointer().type == 'FLOAT_TYPE':
         stream.match('FLOAT_TYPE')
         return ('FLOAT_TYPE',)
-    elif stream.pointer().type in ['STRING_TYPE']:
+    elif stream.pointer().type == 'STRING_TYPE':
         stream.match('STRING_TYPE')
         return ('STRING_TYPE',)
     else:
@@ -203,7 +227,7 @@ def primitive_type(stream):
 #             | {ASSIGN} ASSIGN exp ({SEMI} SEMI)?
 #             | ({SEMI} SEMI)?
 def decl_suffix(stream):
-    if stream.pointer().type in ['LPAREN']:
+    if stream.pointer().type == 'LPAREN':
         stream.match('LPAREN')
         if stream.pointer().type in primitive_lookahead:
             args = formal_args(stream)
@@ -212,20 +236,20 @@ def decl_suffix(stream):
         stream.match('RPAREN')
         body = stmt(stream)
         return ('FUNCTION', args, body )
-    elif stream.pointer().type in ['ASSIGN']:
+    elif stream.pointer().type == 'ASSIGN':
         stream.match('ASSIGN')
         if stream.pointer().type in exp_lookahead:
             ie = exp(stream)
             if ie[0] != 'CONST':
                 raise ValueError("only constants are allowed in initializers")
             e = ('EXPINIT', ie)
-        elif stream.pointer().type in ['LCURLY']:
+        elif stream.pointer().type == 'LCURLY':
             stream.match('LCURLY')
             ie = exp(stream)
             if ie[0] != 'CONST':
                 raise ValueError("only constants are allowed in initializers")
             ll = [ie]
-            while stream.pointer().type in ['COMMA']:
+            while stream.pointer().type == 'COMMA':
                 stream.match('COMMA')
                 ie = exp(stream)
                 if ie[0] != 'CONST':
@@ -233,11 +257,11 @@ def decl_suffix(stream):
                 ll.append(ie)
             stream.match('RCURLY')
             e = ('ARRAYINIT', ('LIST', ll))
-        if stream.pointer().type in ['SEMI']:
+        if stream.pointer().type == 'SEMI':
             stream.match('SEMI')
         return e
     else:
-        if stream.pointer().type in ['SEMI']:
+        if stream.pointer().type == 'SEMI':
             stream.match('SEMI')
         return ('NIL',)
 
@@ -247,7 +271,7 @@ def decl_suffix(stream):
 #           | {LSQUARE} LSQUARE exp RSQUARE = exp ({SEMI} SEMI)?
 #           | {ASSIGN} ASSIGN exp ({SEMI} SEMI)?
 def id_suffix(stream):
-    if stream.pointer().type in ['LPAREN']:
+    if stream.pointer().type == 'LPAREN':
         stream.match('LPAREN')
         if stream.pointer().type in exp_lookahead:
             args = actual_args(stream)
@@ -255,7 +279,7 @@ def id_suffix(stream):
             args = ('LIST', list())
         stream.match('RPAREN')
         tree = ('CALL', args)
-        if stream.pointer().type in ['LSQUARE']:
+        if stream.pointer().type == 'LSQUARE':
             stream.match('LSQUARE')
             ix = exp(stream)
             stream.match('RSQUARE')
@@ -265,22 +289,22 @@ def id_suffix(stream):
                     args,
                     ix,
                     e)
-        if stream.pointer().type in ['SEMI']:
+        if stream.pointer().type == 'SEMI':
             stream.match('SEMI')
         return tree
-    elif stream.pointer().type in ['LSQUARE']:
+    elif stream.pointer().type == 'LSQUARE':
         stream.match('LSQUARE')
         ix = exp(stream)
         stream.match('RSQUARE')
         stream.match('ASSIGN')
         e = exp(stream)
-        if stream.pointer().type in ['SEMI']:
+        if stream.pointer().type == 'SEMI':
             stream.match('SEMI')
         return ('ARRAY_ASSIGN', ix, e)
-    elif stream.pointer().type in ['ASSIGN']:
+    elif stream.pointer().type == 'ASSIGN':
         stream.match('ASSIGN')
         e = exp(stream)
-        if stream.pointer().type in ['SEMI']:
+        if stream.pointer().type == 'SEMI':
             stream.match('SEMI')
         return ('VAR_ASSIGN', e)
     else:
@@ -293,15 +317,13 @@ def id_suffix(stream):
 #   == exp_med_lookahead
 #   == exp_high_lookahead
 #   == primary_lookahead
-exp_lookahead = [
-    'INTEGER',
-    'FLOAT',
-    'STRING',
-    'ID',
-    'LPAREN',
-    'MINUS',
-    'NOT',
-    ]
+exp_lookahead = VINTAGE.first['exp']
+
+# the operators of each binary level, and what may follow an ID in primary
+exp_low_ops = VINTAGE.first['exp_low_op']
+exp_med_ops = VINTAGE.first['exp_med_op']
+exp_high_ops = VINTAGE.first['exp_high_op']
+id_exp_suffix_lookahead = VINTAGE.first['id_exp_suffix']
 
 def exp(stream):
     if stream.pointer().type in exp_lookahead:
@@ -315,11 +337,8 @@ def exp(stream):
 def exp_low(stream):
     if stream.pointer().type in exp_lookahead:
         e = exp_med(stream)
-        while stream.pointer().type in ['EQ','LE']:
-            if stream.pointer().type == 'EQ':
-                op_tk = stream.match('EQ')
-            else:
-                op_tk = stream.match('LE')
+        while stream.pointer().type in exp_low_ops:
+            op_tk = stream.match(stream.pointer().type)
             tmp = exp_med(stream)
             e = (op_tk.type, e, tmp)
         return e
@@ -331,11 +350,8 @@ def exp_low(stream):
 def exp_med(stream):
     if stream.pointer().type in exp_lookahead:
         e = exp_high(stream)
-        while stream.pointer().type in ['PLUS','MINUS']:
-            if stream.pointer().type == 'PLUS':
-                op_tk = stream.match('PLUS')
-            else:
-                op_tk = stream.match('MINUS')
+        while stream.pointer().type in exp_med_ops:
+            op_tk = stream.match(stream.pointer().type)
             tmp = exp_high(stream)
             e = (op_tk.type, e, tmp)
         return e
@@ -347,11 +363,8 @@ def exp_med(stream):
 def exp_high(stream):
     if stream.pointer().type in exp_lookahead:
         e = primary(stream)
-        while stream.pointer().type in ['MUL','DIV']:
-            if stream.pointer().type == 'MUL':
-                op_tk = stream.match('MUL')
-            else:
-                op_tk = stream.match('DIV')
+        while stream.pointer().type in exp_high_ops:
+            op_tk = stream.match(stream.pointer().type)
             tmp = primary(stream)
             e = (op_tk.type, e, tmp)
         return e
@@ -367,62 +380,94 @@ def exp_high(stream):
 #         | {MINUS} MINUS primary
 #         | {NOT} NOT primary
 def primary(stream):
-    if stream.pointer().type in ['INTEGER']:
-        tk = stream.match('INTEGER')
-        return ('CONST', ('INTEGER_TYPE',), ('VALUE', int(tk.value)))
-    elif stream.pointer().type in ['FLOAT']:
-        tk = stream.match('FLOAT')
-        return ('CONST', ('FLOAT_TYPE',), ('VALUE', float(tk.value)))
-    elif stream.pointer().type in ['STRING']:
-        tk = stream.match('STRING')
-        return ('CONST', ('STRING_TYPE',), ('VALUE', str(tk.value)))
-    elif stream.pointer().type in ['ID']:
-        id_tok = stream.match('ID')
-        if stream.pointer().type in ['LPAREN','LSQUARE']:
-            e = id_exp_suffix(stream)
-            if e[0] == 'CALL':
-                return ('CALLEXP', ('ID', id_tok.value), e[1])
-            elif e[0] == 'ARRAY':
-                return ('ARRAY_ACCESS',
-                        ('ID', id_tok.value),
-                        ('IX', e[1]))
-            elif e[0] == 'FUN_ARRAY':
-                return ('ARRAY_ACCESS',
-                        ('CALLEXP', ('ID', id_tok.value), e[1]),
-                        ('IX', e[2]))
-            else:
-                raise ValueError("uknown suffix {}".format(e[0]))
-        else:
-            return ('ID', id_tok.value)
-    elif stream.pointer().type in ['LPAREN']:
-        stream.match('LPAREN')
-        e = exp(stream)
-        stream.match('RPAREN')
-        return e
-    elif stream.pointer().type in ['MINUS']:
-        stream.match('MINUS')
-        e = primary(stream)
-        if e[0] == 'CONST' and e[1][0] in ['INTEGER_TYPE', 'FLOAT_TYPE']:
-            return ('CONST', e[1], -e[2])
-        else:
-            return ('UMINUS', e)
-    elif stream.pointer().type in ['NOT']:
-        stream.match('NOT')
-        e = primary(stream)
-        # (CONST, TYPE, VAL)
-        if e[0] == 'CONST' and e[1][0] == 'INTEGER_TYPE':
-            return ('CONST', ('INTEGER_TYPE',), 0 if e[2] else 1)
-        else:
-            return ('NOT', e)
-    else:
+    alternative = primary_table.get(stream.pointer().type)
+    if alternative is None:
         raise SyntaxError("primary: syntax error at {}"
                           .format(stream.pointer().value))
+    return alternative(stream)
+
+def primary_integer(stream):
+    tk = stream.match('INTEGER')
+    return ('CONST', ('INTEGER_TYPE',), ('VALUE', int(tk.value)))
+
+def primary_float(stream):
+    tk = stream.match('FLOAT')
+    return ('CONST', ('FLOAT_TYPE',), ('VALUE', float(tk.value)))
+
+def primary_string(stream):
+    tk = stream.match('STRING')
+    return ('CONST', ('STRING_TYPE',), ('VALUE', str(tk.value)))
+
+def primary_id(stream):
+    id_tok = stream.match('ID')
+    if stream.pointer().type in id_exp_suffix_lookahead:
+        e = id_exp_suffix(stream)
+        return id_expression(id_tok, e)
+    else:
+        return ('ID', id_tok.value)
+
+# build the expression for ID followed by its id_exp_suffix
+def id_expression(id_tok, e):
+    if e[0] == 'CALL':
+        return ('CALLEXP', ('ID', id_tok.value), e[1])
+    elif e[0] == 'ARRAY':
+        return ('ARRAY_ACCESS',
+                ('ID', id_tok.value),
+                ('IX', e[1]))
+    elif e[0] == 'FUN_ARRAY':
+        return ('ARRAY_ACCESS',
+                ('CALLEXP', ('ID', id_tok.value), e[1]),
+                ('IX', e[2]))
+    else:
+        raise ValueError("uknown suffix {}".format(e[0]))
+
+def primary_paren(stream):
+    stream.match('LPAREN')
+    e = exp(stream)
+    stream.match('RPAREN')
+    return e
+
+def primary_minus(stream):
+    stream.match('MINUS')
+    e = primary(stream)
+    return fold_minus(e)
+
+def fold_minus(e):
+    # (CONST, TYPE, (VALUE, VAL))
+    if e[0] == 'CONST' and e[1][0] in ['INTEGER_TYPE', 'FLOAT_TYPE']:
+        return ('CONST', e[1], ('VALUE', -e[2][1]))
+    else:
+        return ('UMINUS', e)
+
+def primary_not(stream):
+    stream.match('NOT')
+    e = primary(stream)
+    return fold_not(e)
+
+def fold_not(e):
+    # (CONST, TYPE, (VALUE, VAL))
+    if e[0] == 'CONST' and e[1][0] == 'INTEGER_TYPE':
+        return ('CONST', ('INTEGER_TYPE',), ('VALUE', 0 if e[2][1] else 1))
+    else:
+        return ('NOT', e)
+
+# the primary alternatives in grammar order, driven by the LL(1) table
+primary_alternatives = [
+    primary_integer,
+    primary_float,
+    primary_string,
+    primary_id,
+    primary_paren,
+    primary_minus,
+    primary_not,
+    ]
+primary_table = {tk: primary_alternatives[i] for (tk, i) in VINTAGE.predict['primary'].items()}
 
 # id_exp_suffix : {LPAREN} LPAREN ({INTEGER,FLOAT,STRING,ID,LPAREN,MINUS,NOT} actual_args)? RPAREN
 #                       ({LSQUARE} LSQUARE exp RSQUARE)?
 #               | {LSQUARE} LSQUARE exp RSQUARE
 def id_exp_suffix(stream):
-    if stream.pointer().type in ['LPAREN']:
+    if stream.pointer().type == 'LPAREN':
         stream.match('LPAREN')
         if stream.pointer().type in exp_lookahead:
             args = actual_args(stream)
@@ -430,13 +475,13 @@ def id_exp_suffix(stream):
             args = ('LIST', [])
         stream.match('RPAREN')
         tree = ('CALL', args)
-        if stream.pointer().type in ['LSQUARE']:
+        if stream.pointer().type == 'LSQUARE':
             stream.match('LSQUARE')
             e = exp(stream)
             stream.match('RSQUARE')
             tree = ('FUN_ARRAY', args, e)
         return tree
-    elif stream.pointer().type in ['LSQUARE']:
+    elif stream.pointer().type == 'LSQUARE':
         stream.match('LSQUARE')
         e = exp(stream)
         stream.match('RSQUARE')
@@ -451,7 +496,7 @@ def formal_args(stream):
         type = data_type(stream)
         id_tok = stream.match('ID')
         ll = [('FORMALARG', type, ('ID', id_tok.value))]
-        while stream.pointer().type in ['COMMA']:
+        while stream.pointer().type == 'COMMA':
             stream.match('COMMA')
             type = data_type(stream)
             id_tok = stream.match('ID')
@@ -466,7 +511,7 @@ def actual_args(stream):
     if stream.pointer().type in exp_lookahead:
         e = exp(stream)
         ll = [e]
-        while stream.pointer().type in ['COMMA']:
+        while stream.pointer().type == 'COMMA':
             stream.match('COMMA')
             e = exp(stream)
             ll.append(e)
@@ -476,18 +521,54 @@ def actual_args(stream):
                           .format(stream.pointer().value))
 
 # frontend top-level driver
-def parse(stream):
-    from cuppa5_lexer import Lexer
-    token_stream = Lexer(stream)
-    sl = stmt_list(token_stream) # call the parser function for start symbol
+# with iterative=True the explicit-stack parser in vintage_iter is used,
+# which handles arbitrarily deep nesting; the tree is interned in factory,
+# a hashcons.NodeFactory, when one is given.  stream is the source text,
+# which is lexed into a list first, or a file object, which is lexed as
+# the parser reads it
+def parse(stream, iterative=False, factory=None):
+    from lexer import TokenList, TokenStream, VintageLexer
+    if isinstance(stream, str):
+        tokens = TokenList(VintageLexer.iter_tokens(stream))
+    else:
+        tokens = TokenStream(VintageLexer.iter_file(stream))
+    return parse_tokens(tokens, iterative, factory)
+
+# parse a TokenList or TokenStream of VintageLexer tokens
+def parse_tokens(token_stream, iterative=False, factory=None):
+    if iterative:
+        from vintage_iter import stmt_list as parse_stmt_list
+    else:
+        parse_stmt_list = stmt_list
+    sl = parse_stmt_list(token_stream) # call the parser function for start symbol
     if not token_stream.end_of_file():
         raise SyntaxError("parse: syntax error at {}"
                           .format(token_stream.pointer().value))
+    elif factory is not None:
+        return factory.intern(sl)
     else:
         return sl
 
+# usage: python vintage_fe.py [--stats] [--stats-json PATH] [tree|sexp|ndjson] < source
+# --stats prints the time of each phase and the calls and time of each
+# rule function to stderr, --stats-json writes them as JSON
 if __name__ == "__main__":
-    from sys import stdin
-    from dumpast import dumpast
+    import argparse
+    from sys import stderr, stdin
+    from dumpast import FORMATS, dump
+    arguments = argparse.ArgumentParser(description='Parse cuppa5 source from stdin and dump its tree.')
+    arguments.add_argument('format', nargs='?', default='tree', choices=sorted(FORMATS))
+    arguments.add_argument('--stats', action='store_true', help='print phase and rule timings to stderr')
+    arguments.add_argument('--stats-json', metavar='PATH', help='write phase and rule timings as JSON')
+    options = arguments.parse_args()
     char_stream = stdin.read() # read from stdin
-    dumpast(parse(char_stream))
+    if options.stats or options.stats_json:
+        from instrument import Profiler, profile_vintage
+        with Profiler() as profiler:
+            profile_vintage(char_stream, profiler, options.format)
+        if options.stats:
+            print(profiler, file=stderr)
+        if options.stats_json:
+            profiler.save(options.stats_json)
+    else:
+        dump(parse(char_stream), format=options.format)
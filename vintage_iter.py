@@ -0,0 +1,379 @@
+from vintage_fe import (
+    primitive_lookahead,
+    stmt_lookahead,
+    exp_lookahead,
+    id_exp_suffix_lookahead,
+    formalargs_type,
+    data_type,
+    formal_args,
+    declaration,
+    id_statement,
+    fold_minus,
+    fold_not,
+    )
+
+# Explicit-stack version of the vintage_fe parser.  It builds the same
+# trees as vintage_fe.stmt_list, but nested statements and nested
+# expressions are kept on list stacks instead of the Python call stack,
+# so nesting depth is only limited by memory and parsing stays linear.
+
+# pending statements: a frame on the statement stack waits for the
+# statement (or statement list) parsed after it and then completes
+PENDING = object()
+
+def stmt_list(stream):
+    stack = [['LIST', []]]
+    while True:
+        frame = stack[-1]
+        if frame[0] == 'LIST' and stream.pointer().type not in stmt_lookahead:
+            stack.pop()
+            value = ('STMTLIST', frame[1])
+            if not stack:
+                return value
+        else:
+            value = stmt_head(stream, stack)
+            if value is PENDING:
+                continue
+        # hand the finished statement to the frames waiting for it
+        while True:
+            frame = stack[-1]
+            if frame[0] == 'LIST':
+                frame[1].append(value)
+                break
+            stack.pop()
+            value = stmt_finish[frame[0]](stream, stack, frame, value)
+            if value is PENDING:
+                break
+
+# parse a statement up to the point where it needs a nested statement;
+# returns the statement, or PENDING after pushing a frame for the rest
+def stmt_head(stream, stack):
+    tk = stream.pointer()
+    if tk.type == 'VOID_TYPE':
+        stream.match('VOID_TYPE')
+        ret_type = ('VOID_TYPE',)
+        id_tok = stream.match('ID')
+        stream.match('LPAREN')
+        args = ('NIL',)
+        if stream.pointer().type in primitive_lookahead:
+            args = formal_args(stream)
+        stream.match('RPAREN')
+        arg_types = formalargs_type(args)
+        stack.append(['FUNDECL', id_tok, ret_type, arg_types, args])
+        return PENDING
+    elif tk.type in primitive_lookahead:
+        type = data_type(stream)
+        id_tok = stream.match('ID')
+        if stream.pointer().type == 'LPAREN':
+            stream.match('LPAREN')
+            if stream.pointer().type in primitive_lookahead:
+                args = formal_args(stream)
+            else:
+                args = ('LIST', [])
+            stream.match('RPAREN')
+            stack.append(['FUNCTION', id_tok, type, args])
+            return PENDING
+        return declaration(id_tok, type, decl_init(stream))
+    elif tk.type == 'ID':
+        id_tok = stream.match('ID')
+        return id_statement(id_tok, id_suffix(stream))
+    elif tk.type == 'GET':
+        stream.match('GET')
+        id_tk = stream.match('ID')
+        if stream.pointer().type == 'SEMI':
+            stream.match('SEMI')
+        return ('GET', ('ID', id_tk.value))
+    elif tk.type == 'PUT':
+        stream.match('PUT')
+        e = exp(stream)
+        if stream.pointer().type == 'SEMI':
+            stream.match('SEMI')
+        return ('PUT', e)
+    elif tk.type == 'RETURN':
+        stream.match('RETURN')
+        if stream.pointer().type in exp_lookahead:
+            e = exp(stream)
+        else:
+            e = ('NIL',)
+        if stream.pointer().type == 'SEMI':
+            stream.match('SEMI')
+        return ('RETURN', e)
+    elif tk.type == 'WHILE':
+        stream.match('WHILE')
+        stream.match('LPAREN')
+        e = exp(stream)
+        stream.match('RPAREN')
+        stack.append(['WHILE', e])
+        return PENDING
+    elif tk.type == 'IF':
+        stream.match('IF')
+        stream.match('LPAREN')
+        e = exp(stream)
+        stream.match('RPAREN')
+        stack.append(['IF', e])
+        return PENDING
+    elif tk.type == 'LCURLY':
+        stream.match('LCURLY')
+        stack.append(['BLOCK'])
+        stack.append(['LIST', []])
+        return PENDING
+    else:
+        raise SyntaxError("stmt: syntax error at {}"
+                          .format(tk.value))
+
+# completing a frame with the statement it was waiting for
+def finish_fundecl(stream, stack, frame, body):
+    (FUNDECL, id_tok, ret_type, arg_types, args) = frame
+    return ('FUNDECL',
+            ('ID', id_tok.value),
+            ('FUNCTION_TYPE', ret_type, arg_types),
+            args,
+            body)
+
+def finish_function(stream, stack, frame, body):
+    (FUNCTION, id_tok, type, args) = frame
+    return declaration(id_tok, type, ('FUNCTION', args, body))
+
+def finish_while(stream, stack, frame, s):
+    return ('WHILE', frame[1], s)
+
+def finish_if(stream, stack, frame, s1):
+    if stream.pointer().type == 'ELSE':
+        stream.match('ELSE')
+        stack.append(['ELSE', frame[1], s1])
+        return PENDING
+    else:
+        return ('IF', frame[1], s1, ('NIL',))
+
+def finish_else(stream, stack, frame, s2):
+    return ('IF', frame[1], frame[2], s2)
+
+def finish_block(stream, stack, frame, sl):
+    stream.match('RCURLY')
+    return ('BLOCK', sl)
+
+stmt_finish = {
+    'FUNDECL': finish_fundecl,
+    'FUNCTION': finish_function,
+    'WHILE': finish_while,
+    'IF': finish_if,
+    'ELSE': finish_else,
+    'BLOCK': finish_block,
+    }
+
+# decl_suffix without the function case, which stmt_head handles
+def decl_init(stream):
+    if stream.pointer().type == 'ASSIGN':
+        stream.match('ASSIGN')
+        if stream.pointer().type in exp_lookahead:
+            ie = exp(stream)
+            if ie[0] != 'CONST':
+                raise ValueError("only constants are allowed in initializers")
+            e = ('EXPINIT', ie)
+        elif stream.pointer().type == 'LCURLY':
+            stream.match('LCURLY')
+            ie = exp(stream)
+            if ie[0] != 'CONST':
+                raise ValueError("only constants are allowed in initializers")
+            ll = [ie]
+            while stream.pointer().type == 'COMMA':
+                stream.match('COMMA')
+                ie = exp(stream)
+                if ie[0] != 'CONST':
+                    raise ValueError("only constants are allowed in initializers")
+                ll.append(ie)
+            stream.match('RCURLY')
+            e = ('ARRAYINIT', ('LIST', ll))
+        else:
+            raise SyntaxError("decl_suffix: syntax error at {}"
+                              .format(stream.pointer().value))
+        if stream.pointer().type == 'SEMI':
+            stream.match('SEMI')
+        return e
+    else:
+        if stream.pointer().type == 'SEMI':
+            stream.match('SEMI')
+        return ('NIL',)
+
+def id_suffix(stream):
+    if stream.pointer().type == 'LPAREN':
+        stream.match('LPAREN')
+        if stream.pointer().type in exp_lookahead:
+            args = actual_args(stream)
+        else:
+            args = ('LIST', list())
+        stream.match('RPAREN')
+        tree = ('CALL', args)
+        if stream.pointer().type == 'LSQUARE':
+            stream.match('LSQUARE')
+            ix = exp(stream)
+            stream.match('RSQUARE')
+            stream.match('ASSIGN')
+            e = exp(stream)
+            tree = ('FUN_ARRAY_ASSIGN',
+                    args,
+                    ix,
+                    e)
+        if stream.pointer().type == 'SEMI':
+            stream.match('SEMI')
+        return tree
+    elif stream.pointer().type == 'LSQUARE':
+        stream.match('LSQUARE')
+        ix = exp(stream)
+        stream.match('RSQUARE')
+        stream.match('ASSIGN')
+        e = exp(stream)
+        if stream.pointer().type == 'SEMI':
+            stream.match('SEMI')
+        return ('ARRAY_ASSIGN', ix, e)
+    elif stream.pointer().type == 'ASSIGN':
+        stream.match('ASSIGN')
+        e = exp(stream)
+        if stream.pointer().type == 'SEMI':
+            stream.match('SEMI')
+        return ('VAR_ASSIGN', e)
+    else:
+        raise SyntaxError("id_suffix: syntax error at {}"
+                          .format(stream.pointer().value))
+
+def actual_args(stream):
+    e = exp(stream)
+    ll = [e]
+    while stream.pointer().type == 'COMMA':
+        stream.match('COMMA')
+        e = exp(stream)
+        ll.append(e)
+    return ('LIST', ll)
+
+# binary operator -> level (exp_low, exp_med, exp_high); all left associative
+binary_level = {
+    'EQ': 1, 'LE': 1,
+    'PLUS': 2, 'MINUS': 2,
+    'MUL': 3, 'DIV': 3,
+    }
+# the rule the recursive parser reports when the operand after an
+# operator of a level is missing
+operand_rule = {1: 'exp_med', 2: 'exp_high', 3: 'primary'}
+
+# Expressions with an explicit stack of frames, one per nested expression
+# (parentheses, call arguments, array indexes).  A frame is
+#   [kind, operands, operators, prefixes, id_tok, args]
+# where kind says what completes it ('TOP', 'PAREN', 'ARG', 'INDEX',
+# 'FUN_INDEX') and prefixes are the MINUS/NOT waiting for the next operand.
+def exp(stream):
+    if stream.pointer().type not in exp_lookahead:
+        raise SyntaxError("exp: syntax error at {}"
+                          .format(stream.pointer().value))
+    stack = [['TOP', [], [], [], None, None]]
+    rule = 'exp'
+    while True:
+        frame = stack[-1]
+        # an operand: prefix operators, then a primary
+        tk = stream.pointer()
+        while tk.type == 'MINUS' or tk.type == 'NOT':
+            frame[3].append(stream.match(tk.type).type)
+            rule = 'primary'
+            tk = stream.pointer()
+        if tk.type == 'INTEGER':
+            stream.match('INTEGER')
+            value = ('CONST', ('INTEGER_TYPE',), ('VALUE', int(tk.value)))
+        elif tk.type == 'FLOAT':
+            stream.match('FLOAT')
+            value = ('CONST', ('FLOAT_TYPE',), ('VALUE', float(tk.value)))
+        elif tk.type == 'STRING':
+            stream.match('STRING')
+            value = ('CONST', ('STRING_TYPE',), ('VALUE', str(tk.value)))
+        elif tk.type == 'ID':
+            id_tok = stream.match('ID')
+            if stream.pointer().type not in id_exp_suffix_lookahead:
+                value = ('ID', id_tok.value)
+            elif stream.pointer().type == 'LSQUARE':
+                stream.match('LSQUARE')
+                stack.append(['INDEX', [], [], [], id_tok, None])
+                rule = 'exp'
+                continue
+            else:
+                stream.match('LPAREN')
+                if stream.pointer().type in exp_lookahead:
+                    stack.append(['ARG', [], [], [], id_tok, []])
+                    rule = 'exp'
+                    continue
+                stream.match('RPAREN')
+                args = ('LIST', [])
+                if stream.pointer().type == 'LSQUARE':
+                    stream.match('LSQUARE')
+                    stack.append(['FUN_INDEX', [], [], [], id_tok, args])
+                    rule = 'exp'
+                    continue
+                value = ('CALLEXP', ('ID', id_tok.value), args)
+        elif tk.type == 'LPAREN':
+            stream.match('LPAREN')
+            stack.append(['PAREN', [], [], [], None, None])
+            rule = 'exp'
+            continue
+        else:
+            raise SyntaxError("{}: syntax error at {}"
+                              .format(rule, tk.value))
+        # value is a complete primary of the top frame: apply its prefixes
+        # and either continue after a binary operator or close the frame
+        while True:
+            frame = stack[-1]
+            prefixes = frame[3]
+            while prefixes:
+                if prefixes.pop() == 'MINUS':
+                    value = fold_minus(value)
+                else:
+                    value = fold_not(value)
+            operands = frame[1]
+            operators = frame[2]
+            operands.append(value)
+            level = binary_level.get(stream.pointer().type)
+            if level is not None:
+                reduce(operands, operators, level)
+                operators.append(stream.match(stream.pointer().type).type)
+                rule = operand_rule[level]
+                break
+            reduce(operands, operators, 0)
+            value = operands.pop()
+            stack.pop()
+            kind = frame[0]
+            if kind == 'TOP':
+                return value
+            elif kind == 'PAREN':
+                stream.match('RPAREN')
+            elif kind == 'INDEX':
+                stream.match('RSQUARE')
+                value = ('ARRAY_ACCESS',
+                         ('ID', frame[4].value),
+                         ('IX', value))
+            elif kind == 'FUN_INDEX':
+                stream.match('RSQUARE')
+                value = ('ARRAY_ACCESS',
+                         ('CALLEXP', ('ID', frame[4].value), frame[5]),
+                         ('IX', value))
+            else:
+                # the next argument, or the end of the call
+                frame[5].append(value)
+                if stream.pointer().type == 'COMMA':
+                    stream.match('COMMA')
+                    if stream.pointer().type not in exp_lookahead:
+                        raise SyntaxError("exp: syntax error at {}"
+                                          .format(stream.pointer().value))
+                    stack.append(['ARG', [], [], [], frame[4], frame[5]])
+                    rule = 'exp'
+                    break
+                stream.match('RPAREN')
+                args = ('LIST', frame[5])
+                if stream.pointer().type == 'LSQUARE':
+                    stream.match('LSQUARE')
+                    stack.append(['FUN_INDEX', [], [], [], frame[4], args])
+                    rule = 'exp'
+                    break
+                value = ('CALLEXP', ('ID', frame[4].value), args)
+
+# fold the operators of at least the given level into tree nodes
+def reduce(operands, operators, level):
+    while operators and binary_level[operators[-1]] >= level:
+        right = operands.pop()
+        left = operands.pop()
+        operands.append((operators.pop(), left, right))
@@ -0,0 +1,428 @@
+import sys
+
+from engine import (
+    BUILTINS,
+    FALSE,
+    TRUE,
+    Layout,
+    format_value,
+    is_name,
+    literal_value,
+    parse_program,
+    )
+from parser_1 import ProgramIndex
+
+# Register bytecode compiler and virtual machine for parser_1 programs.
+#
+# Every variable, constant and intermediate value has a register: a slot
+# in one flat list.  Instructions are (opcode, a, b, c) tuples in one flat
+# code list; arithmetic is three-address (registers[a] = registers[b] op
+# registers[c]) and all jump targets are instruction offsets, resolved
+# when the program is compiled.  A FOR pushes a frame and its NEXT is a
+# single add, compare and branch instruction.  AND and OR test their left
+# operand and jump past the right one when it decides the result, as the
+# engine does.  GOSUB return addresses and FOR frames live in stacks
+# allocated once per run.
+#
+# A DEF FN body is compiled once, after the program, into registers of
+# its own.  FNCALL saves the parameters and those registers, binds the
+# arguments and jumps to the body; FNRETURN puts them back and stores the
+# result, so parameters are bound for the call and recursion works as it
+# does in the engine.
+#
+# READ and RESTORE work on the DATA values of the program's ProgramIndex:
+# READ copies the next values into its registers, and RESTORE sets the
+# position they are read from to the one the index gives for its line.
+
+# opcodes, most frequent first as the dispatch loop tests them in order
+(ADD, SUB, MUL, DIV, NEXT, JUMPF, JUMP, MOVE, LSS, GRT, CALL1, GOSUB, RETURN,
+ LEQ, GREQ, EQ, NEQ, POW, NEG, NOT, AND, OR, BOOL, CALL, FNCALL, FNRETURN,
+ FOR, ON, READ, RESTORE, PRINT, HALT) = range(32)
+
+OPCODE_NAMES = ['ADD', 'SUB', 'MUL', 'DIV', 'NEXT', 'JUMPF', 'JUMP', 'MOVE',
+                'LSS', 'GRT', 'CALL1', 'GOSUB', 'RETURN', 'LEQ', 'GREQ', 'EQ',
+                'NEQ', 'POW', 'NEG', 'NOT', 'AND', 'OR', 'BOOL', 'CALL',
+                'FNCALL', 'FNRETURN', 'FOR', 'ON', 'READ', 'RESTORE', 'PRINT',
+                'HALT']
+
+BINARY_OPCODES = {
+    'ADD': ADD, 'SUB': SUB, 'MUL': MUL, 'DIV': DIV, 'POW': POW,
+    'LSS': LSS, 'GRT': GRT, 'LEQ': LEQ, 'GREQ': GREQ, 'EQ': EQ, 'NEQ': NEQ,
+}
+
+# instructions whose b operand (JUMPF, GOSUB) or a operand (JUMP) is a
+# layout entry until the program is compiled
+JUMP_OPERAND = {JUMP: 1, JUMPF: 2, GOSUB: 1}
+
+GOSUB_DEPTH = 256
+FOR_DEPTH = 64
+CALL_DEPTH = 256
+
+# the variables an expression names
+def expression_names(node):
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, str):
+            if is_name(node):
+                yield node
+            continue
+        for child in node[2:]:
+            if isinstance(child, list):
+                stack.extend(child)
+            else:
+                stack.append(child)
+
+class Bytecode:
+    def __init__(self, statements, lines=None, index=None):
+        layout = Layout(statements, lines)
+        self.target = layout.target
+        if index is None:
+            index = ProgramIndex.of(statements, lines)
+        self.index = index
+        self.data = index.data
+        self.code = []
+        # initial register values: 0 for variables and temporaries, the
+        # value for constants
+        self.registers = []
+        self.variables = {}
+        self.constants = {}
+        # argument register tuples of CALL and FNCALL, target tuples of
+        # ON, variable register tuples of READ
+        self.tables = []
+        # DEF FN functions: name -> (parameters, body), and name -> number
+        # in self.calls, a function being given its number when it is first
+        # called.  An entry of self.calls is the name until the body is
+        # compiled, then the body's entry offset, the parameter registers,
+        # the range of registers the body uses and the register holding
+        # its result
+        self.functions = {node[1]: (node[2], node[3]) for node in layout.entries if node[0] == 'DEF'}
+        self.numbers = {}
+        self.calls = []
+        # offset of the first instruction of each layout entry
+        offsets = []
+        for node in layout.entries:
+            offsets.append(len(self.code))
+            self.compile_statement(node)
+        offsets.append(len(self.code))
+        self.emit(HALT)
+        # the bodies of the functions called, including those called from
+        # a body compiled here
+        number = 0
+        while number < len(self.calls):
+            self.compile_function(number)
+            number += 1
+        # jumps were emitted with layout entries as targets
+        for (index, (op, a, b, c)) in enumerate(self.code):
+            if op in JUMP_OPERAND:
+                operands = [a, b, c]
+                position = JUMP_OPERAND[op] - 1
+                operands[position] = offsets[operands[position]]
+                self.code[index] = (op, operands[0], operands[1], operands[2])
+            elif op == ON:
+                self.tables[b] = tuple(offsets[t] for t in self.tables[b])
+
+    def emit(self, op, a=0, b=0, c=0):
+        self.code.append((op, a, b, c))
+
+    def register(self, value=0):
+        self.registers.append(value)
+        return len(self.registers) - 1
+
+    def variable(self, name):
+        if name not in self.variables:
+            self.variables[name] = self.register()
+        return self.variables[name]
+
+    def constant(self, value):
+        key = (type(value), value)
+        if key not in self.constants:
+            self.constants[key] = self.register(value)
+        return self.constants[key]
+
+    def table(self, values):
+        self.tables.append(tuple(values))
+        return len(self.tables) - 1
+
+    def compile_statement(self, node):
+        kind = node[0]
+        if kind == 'LET':
+            self.compile_expression(node[2], self.variable(node[1]))
+        elif kind == 'PRINT':
+            self.emit(PRINT, self.compile_expression(node[1]))
+        elif kind == 'IF':
+            self.emit(JUMPF, self.compile_expression(node[1]), node[2])
+        elif kind == 'JUMP':
+            self.emit(JUMP, node[1])
+        elif kind == 'GOTO':
+            self.emit(JUMP, self.target(node[1]))
+        elif kind == 'GOSUB':
+            self.emit(GOSUB, self.target(node[1]))
+        elif kind == 'ON':
+            (ON_, selector, jump, targets) = node
+            targets = self.table(self.target(line_num) for line_num in targets)
+            self.emit(ON, self.compile_expression(selector), targets, 1 if jump == 'GOSUB' else 0)
+        elif kind == 'RETURN':
+            self.emit(RETURN)
+        elif kind == 'FOR':
+            (FOR_, name, start, end, step) = node
+            variable = self.variable(name)
+            self.compile_expression(start, variable)
+            # the limit and step are copied into the frame
+            limit = self.compile_expression(end)
+            step = self.constant(1) if step is None else self.compile_expression(step)
+            self.emit(FOR, variable, limit, step)
+        elif kind == 'NEXT':
+            self.emit(NEXT, self.variable(node[1]))
+        elif kind == 'READ':
+            self.emit(READ, self.table(self.variable(name) for name in node[1]))
+        elif kind == 'RESTORE':
+            self.emit(RESTORE, 0 if node[1] is None else self.index.restore(node[1]))
+        elif kind == 'END':
+            self.emit(HALT)
+        elif kind == 'REM' or kind == 'DEF' or kind == 'DATA':
+            pass
+        else:
+            raise ValueError("cannot compile {}".format(kind))
+
+    # the number of a DEF FN function, its body to be compiled later
+    def function(self, name):
+        if name not in self.numbers:
+            self.numbers[name] = len(self.calls)
+            self.calls.append(name)
+        return self.numbers[name]
+
+    def compile_function(self, number):
+        (parameters, body) = self.functions[self.calls[number]]
+        parameters = tuple(self.variable(parameter) for parameter in parameters)
+        # every variable is a register of its own before the body's
+        # temporaries are allocated, so only those are saved for a call
+        for variable in expression_names(body):
+            self.variable(variable)
+        entry = len(self.code)
+        low = len(self.registers)
+        result = self.compile_expression(body)
+        self.emit(FNRETURN, result)
+        self.calls[number] = (entry, parameters, low, len(self.registers), result)
+
+    # emit the code for an expression; returns the register holding its
+    # value, which is target when one is given
+    def compile_expression(self, node, target=None):
+        if isinstance(node, str):
+            if is_name(node):
+                source = self.variable(node)
+            else:
+                source = self.constant(literal_value(node))
+            if target is None:
+                return source
+            self.emit(MOVE, target, source)
+            return target
+        tag = node[0]
+        if tag == 'FACTOR' and node[1] == 1:
+            return self.compile_expression(node[2], target)
+        if target is None:
+            target = self.register()
+        if tag == 'FACTOR':
+            (FACTOR, sign, operand) = node
+            value = self.compile_expression(operand)
+            if sign == -1:
+                self.emit(NEG, target, value)
+            else:
+                self.emit(MUL, target, self.constant(sign), value)
+        elif tag == 'FUNC' and node[1] in self.functions:
+            (FUNC, name, args) = node
+            if len(args) != len(self.functions[name][0]):
+                raise ValueError("{} takes {} arguments".format(name, len(self.functions[name][0])))
+            args = self.table(self.compile_expression(arg) for arg in args)
+            self.emit(FNCALL, target, self.function(name), args)
+        elif tag == 'FUNC':
+            (FUNC, name, args) = node
+            if name not in BUILTINS:
+                raise ValueError("unknown function {}".format(name))
+            function = self.constant(BUILTINS[name])
+            if len(args) == 1:
+                self.emit(CALL1, target, function, self.compile_expression(args[0]))
+            else:
+                args = self.table(self.compile_expression(arg) for arg in args)
+                self.emit(CALL, target, function, args)
+        elif tag == 'UNARY':
+            self.emit(NOT, target, self.compile_expression(node[2]))
+        elif tag == 'LOGIC':
+            # AND (OR) sets target and jumps to c when its left operand is
+            # false (true); otherwise BOOL gives the truth of the right
+            (LOGIC, op, left, right) = node
+            left = self.compile_expression(left)
+            test = len(self.code)
+            self.emit(AND if op == 'AND' else OR, target, left)
+            self.emit(BOOL, target, self.compile_expression(right))
+            self.code[test] = self.code[test][:3] + (len(self.code),)
+        else:
+            (tag, op, left, right) = node
+            left = self.compile_expression(left)
+            right = self.compile_expression(right)
+            self.emit(BINARY_OPCODES[op], target, left, right)
+        return target
+
+    # the code as text, one instruction per line
+    def disassemble(self):
+        lines = []
+        for (offset, (op, a, b, c)) in enumerate(self.code):
+            lines.append('%5d  %-7s %d %d %d' % (offset, OPCODE_NAMES[op], a, b, c))
+        return '\n'.join(lines)
+
+    # run the program; returns the number of instructions executed
+    def run(self, output=None):
+        output = output or sys.stdout
+        code = self.code
+        tables = self.tables
+        functions = self.calls
+        data = self.data
+        position = 0
+        r = list(self.registers)
+        # FNCALL frames: return offset, target register, function, saved
+        # parameters and saved body registers
+        calls = []
+        returns = [0] * GOSUB_DEPTH
+        rsp = 0
+        # FOR frames: variable, limit, step and loop body offset
+        frame_variable = [0] * FOR_DEPTH
+        frame_limit = [0] * FOR_DEPTH
+        frame_step = [0] * FOR_DEPTH
+        frame_body = [0] * FOR_DEPTH
+        fsp = 0
+        pc = 0
+        executed = 0
+        while True:
+            (op, a, b, c) = code[pc]
+            executed += 1
+            pc += 1
+            if op == ADD:
+                r[a] = r[b] + r[c]
+            elif op == SUB:
+                r[a] = r[b] - r[c]
+            elif op == MUL:
+                r[a] = r[b] * r[c]
+            elif op == DIV:
+                r[a] = r[b] / r[c]
+            elif op == NEXT:
+                # an inner loop left without its NEXT is closed as well
+                while fsp and frame_variable[fsp - 1] != a:
+                    fsp -= 1
+                if not fsp:
+                    name = next(n for (n, i) in self.variables.items() if i == a)
+                    raise RuntimeError("NEXT without FOR: {}".format(name))
+                step = frame_step[fsp - 1]
+                value = r[a] + step
+                r[a] = value
+                if value <= frame_limit[fsp - 1] if step >= 0 else value >= frame_limit[fsp - 1]:
+                    pc = frame_body[fsp - 1]
+                else:
+                    fsp -= 1
+            elif op == JUMPF:
+                if not r[a]:
+                    pc = b
+            elif op == JUMP:
+                pc = a
+            elif op == MOVE:
+                r[a] = r[b]
+            elif op == LSS:
+                r[a] = TRUE if r[b] < r[c] else FALSE
+            elif op == GRT:
+                r[a] = TRUE if r[b] > r[c] else FALSE
+            elif op == CALL1:
+                r[a] = r[b](r[c])
+            elif op == GOSUB:
+                if rsp == GOSUB_DEPTH:
+                    raise RuntimeError("GOSUB nested too deeply")
+                returns[rsp] = pc
+                rsp += 1
+                pc = a
+            elif op == RETURN:
+                if not rsp:
+                    raise RuntimeError("RETURN without GOSUB")
+                rsp -= 1
+                pc = returns[rsp]
+            elif op == LEQ:
+                r[a] = TRUE if r[b] <= r[c] else FALSE
+            elif op == GREQ:
+                r[a] = TRUE if r[b] >= r[c] else FALSE
+            elif op == EQ:
+                r[a] = TRUE if r[b] == r[c] else FALSE
+            elif op == NEQ:
+                r[a] = TRUE if r[b] != r[c] else FALSE
+            elif op == POW:
+                r[a] = r[b] ** r[c]
+            elif op == NEG:
+                r[a] = -r[b]
+            elif op == NOT:
+                r[a] = FALSE if r[b] else TRUE
+            elif op == AND:
+                if not r[b]:
+                    r[a] = FALSE
+                    pc = c
+            elif op == OR:
+                if r[b]:
+                    r[a] = TRUE
+                    pc = c
+            elif op == BOOL:
+                r[a] = TRUE if r[b] else FALSE
+            elif op == CALL:
+                r[a] = r[b](*[r[i] for i in tables[c]])
+            elif op == FNCALL:
+                if len(calls) == CALL_DEPTH:
+                    raise RecursionError("function calls nested too deeply")
+                (entry, parameters, low, high, result) = functions[b]
+                values = [r[i] for i in tables[c]]
+                calls.append((pc, a, b, [r[i] for i in parameters], r[low:high]))
+                for (i, value) in zip(parameters, values):
+                    r[i] = value
+                pc = entry
+            elif op == FNRETURN:
+                value = r[a]
+                (pc, target, function, parameters, registers) = calls.pop()
+                (entry, names, low, high, result) = functions[function]
+                r[low:high] = registers
+                for (i, saved) in zip(names, parameters):
+                    r[i] = saved
+                r[target] = value
+            elif op == FOR:
+                # re-entering a loop drops its old frame and any inside it
+                for i in range(fsp):
+                    if frame_variable[i] == a:
+                        fsp = i
+                        break
+                if fsp == FOR_DEPTH:
+                    raise RuntimeError("FOR nested too deeply")
+                frame_variable[fsp] = a
+                frame_limit[fsp] = r[b]
+                frame_step[fsp] = r[c]
+                frame_body[fsp] = pc
+                fsp += 1
+            elif op == ON:
+                targets = tables[b]
+                index = int(r[a])
+                if 1 <= index <= len(targets):
+                    if c:
+                        if rsp == GOSUB_DEPTH:
+                            raise RuntimeError("GOSUB nested too deeply")
+                        returns[rsp] = pc
+                        rsp += 1
+                    pc = targets[index - 1]
+            elif op == READ:
+                variables = tables[a]
+                if position + len(variables) > len(data):
+                    raise RuntimeError("out of DATA")
+                for i in variables:
+                    r[i] = data[position]
+                    position += 1
+            elif op == RESTORE:
+                position = a
+            elif op == PRINT:
+                print(format_value(r[a]), file=output)
+            else:
+                return executed
+
+# lex, parse and compile BASIC source
+def compile_source(text):
+    parser = parse_program(text)
+    return Bytecode(parser.statements, parser.statement_lines, parser.index)